@@ -21,7 +21,7 @@ class ProductCommentInline(admin.TabularInline):
 
 class ProductAdmin(admin.ModelAdmin):
     inlines = [ProductImageInline, ProductCommentInline]
-    list_display = ("title", "seller", "price", "created_at")
+    list_display = ("title", "seller", "price", "rating_avg", "rating_count", "created_at")
     search_fields = ("title", "description")
     list_filter = ("seller",)
 
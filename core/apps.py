@@ -6,6 +6,7 @@ class CoreConfig(AppConfig):
     name = 'core'
 
     def ready(self):
+        from . import signals  # noqa: F401
         from yookassa import Configuration
         from django.conf import settings
 
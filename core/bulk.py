@@ -0,0 +1,75 @@
+"""
+Массовые действия продавца без построчных запросов.
+
+Товары (цена, остаток): принадлежность проверяется одним запросом,
+изменения пишутся одним UPDATE ... SET поле = CASE id WHEN ... END на пачку
+в одной транзакции.
+
+Заказы (подтверждение, отказ): заказы продавца читаются одним SELECT,
+ожидающие переводятся одним условным UPDATE (переход статуса,
+core/orders.py).
+"""
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Now
+
+from .cache import invalidate_catalog
+from .models import Order, OrderStatusChange, Product
+from .orders import ORDER_FIELDS, apply_transitions, can_transition
+
+BULK_UPDATE_FIELDS = ('price', 'quantity')
+BULK_UPDATE_BATCH_SIZE = 1000
+
+
+def bulk_update_products(seller, items):
+    """
+    items - [{"id": uuid, "price": ..., "quantity": ...}] (поля необязательны).
+    Возвращает (обновлённые id, id не найденных или чужих товаров).
+    """
+    ids = [item['id'] for item in items]
+    owned = set(Product.objects.filter(seller=seller, pk__in=ids).values_list('pk', flat=True))
+    items = [item for item in items if item['id'] in owned]
+
+    with transaction.atomic():
+        for start in range(0, len(items), BULK_UPDATE_BATCH_SIZE):
+            batch = items[start:start + BULK_UPDATE_BATCH_SIZE]
+            updates = {}
+            for name in BULK_UPDATE_FIELDS:
+                field = Product._meta.get_field(name)
+                whens = [
+                    When(pk=item['id'], then=Value(item[name], output_field=field))
+                    for item in batch if name in item
+                ]
+                if whens:
+                    updates[name] = Case(*whens, default=F(name), output_field=field)
+            Product.objects.filter(pk__in=[item['id'] for item in batch]).update(updated_at=Now(), **updates)
+        if items:
+            invalidate_catalog(owned)
+
+    updated = [item['id'] for item in items]
+    return updated, [pk for pk in ids if pk not in owned]
+
+
+def bulk_set_order_status(seller, ids, status):
+    """
+    Переводит ожидающие оплаты заказы продавца из ids в status (paid или
+    seller_rejected). Возвращает [{"id": ..., "result": ...}] в порядке ids:
+    ok, not_found (нет или чужой) или not_pending.
+    """
+    orders = {row['pk']: row for row in Order.objects.filter(seller=seller, pk__in=ids).values(*ORDER_FIELDS)}
+    pending = [row for row in orders.values() if can_transition(row['status'], status)]
+    done = set()
+    if apply_transitions(pending, status, OrderStatusChange.Source.SELLER):
+        done.update(row['pk'] for row in pending)
+    else:
+        # Часть заказов изменили параллельно - переводим оставшиеся по одному
+        for row in pending:
+            if apply_transitions([row], status, OrderStatusChange.Source.SELLER):
+                done.add(row['pk'])
+
+    def result(pk):
+        if pk not in orders:
+            return 'not_found'
+        return 'ok' if pk in done else 'not_pending'
+
+    return [{'id': pk, 'result': result(pk)} for pk in ids]
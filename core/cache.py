@@ -0,0 +1,176 @@
+"""
+Кэш ответов каталога (list/retrieve товаров).
+
+Ключи версионные: в ключ входит номер версии каталога (для списков) и
+номер версии товара (для карточки). Запись в Product, ProductImage или
+ProductComment увеличивает версии (signals.py), старые ключи просто
+перестают читаться и истекают сами.
+
+Остатки (core/stock.py) меняются на каждом заказе, поэтому версию каталога
+они не трогают: invalidate_stock увеличивает версию карточки и отдельную
+версию остатков. quantity в закэшированном списке подставляется заново при
+каждом ответе (with_live_quantity), от версии остатков зависят только
+списки, состав которых определяют остатки (STOCK_DEPENDENT_PARAMS).
+
+Защита от stampede: запись хранится дольше своего «мягкого» TTL. После
+мягкого истечения ответ пересчитывает один воркер (взявший блокировку через
+cache.add), остальные в это время отдают устаревшую копию. При холодном
+промахе воркеры без блокировки коротко ждут, пока значение появится.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .timing import phase
+
+CATALOG_VERSION_KEY = 'catalog:version'
+STOCK_VERSION_KEY = 'catalog:stock:version'
+# Параметры списка товаров, при которых ответ зависит от остатков
+STOCK_DEPENDENT_PARAMS = ('in_stock', 'facets')
+
+
+def _timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60)
+
+
+def _stale_timeout():
+    return getattr(settings, 'CATALOG_CACHE_STALE_TIMEOUT', 300)
+
+
+def _lock_timeout():
+    return getattr(settings, 'CATALOG_CACHE_LOCK_TIMEOUT', 10)
+
+
+def product_version_key(product_id):
+    return f'catalog:product:{product_id}:version'
+
+
+def _initial_version():
+    # Версия начинается с текущего времени в мс, а не с 1: после очистки кэша
+    # номера не повторяются (на них завязаны и ETag, см. conditional.py)
+    return int(time.time() * 1000)
+
+
+def get_version(key):
+    with phase('cache'):
+        version = cache.get(key)
+    if version is None:
+        # Без срока жизни: версия должна пережить все зависящие от неё ключи
+        cache.add(key, _initial_version(), timeout=None)
+        # DummyCache ничего не хранит: каждая версия уникальна
+        version = cache.get(key) or _initial_version()
+    return version
+
+
+def _bump(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_version(), timeout=None)
+
+
+def invalidate_catalog(product_ids=()):
+    """
+    Инвалидирует списки товаров и карточки product_ids.
+
+    Версии увеличиваются сразу (чтобы текущая транзакция видела свежие
+    данные) и ещё раз после коммита: иначе параллельный запрос мог успеть
+    закэшировать старые данные под новой версией.
+    """
+    _bump_now_and_on_commit([CATALOG_VERSION_KEY] + [product_version_key(pk) for pk in product_ids])
+
+
+def invalidate_stock(product_ids):
+    """
+    Инвалидирует после изменения остатков product_ids: их карточки и версию
+    остатков. Закэшированные списки каталога остаются.
+    """
+    _bump_now_and_on_commit([STOCK_VERSION_KEY] + [product_version_key(pk) for pk in product_ids])
+
+
+def _bump_now_and_on_commit(keys):
+    _bump(keys)
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def list_version_scope(request):
+    """
+    Версии, от которых зависит список товаров по параметрам запроса.
+    """
+    scope = f'v{get_version(CATALOG_VERSION_KEY)}'
+    if any(param in request.query_params for param in STOCK_DEPENDENT_PARAMS):
+        scope += f':s{get_version(STOCK_VERSION_KEY)}'
+    return scope
+
+
+def with_live_quantity(data):
+    """
+    Подставляет в данные списка товаров текущие остатки: один запрос по
+    первичным ключам страницы. Закэшированный объект не меняется.
+    """
+    from .models import Product
+
+    items = data['results'] if isinstance(data, dict) else data
+    ids = [item['id'] for item in items if 'quantity' in item]
+    if not ids:
+        return data
+    quantities = {str(pk): quantity for pk, quantity in Product.objects.filter(pk__in=ids).values_list('pk', 'quantity')}
+    items = [
+        {**item, 'quantity': quantities.get(str(item['id']), item['quantity'])} if 'quantity' in item else item
+        for item in items
+    ]
+    return {**data, 'results': items} if isinstance(data, dict) else items
+
+
+def request_key(request, scope):
+    """
+    Ключ ответа: scope + схема/хост (в ответе абсолютные URL) + отсортированные
+    параметры запроса.
+    """
+    params = sorted((name, sorted(values)) for name, values in request.query_params.lists())
+    raw = f'{request.scheme}://{request.get_host()}|{params}'
+    return f'catalog:{scope}:{hashlib.sha1(raw.encode()).hexdigest()}'
+
+
+def cached_response_data(key, build):
+    """
+    Возвращает закэшированные данные ответа или строит их через build().
+    """
+    timeout = _timeout()
+    if not timeout:
+        return build()
+
+    with phase('cache'):
+        entry = cache.get(key)
+    now = time.time()
+    if entry is not None:
+        fresh_until, data = entry
+        if now < fresh_until or not cache.add(key + ':lock', 1, timeout=_lock_timeout()):
+            return data
+        return _rebuild(key, build, timeout)
+
+    if cache.add(key + ':lock', 1, timeout=_lock_timeout()):
+        return _rebuild(key, build, timeout)
+
+    # Значение строит другой воркер - ждём его, но не дольше блокировки
+    deadline = now + _lock_timeout()
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[1]
+    return build()
+
+
+def _rebuild(key, build, timeout):
+    try:
+        data = build()
+        with phase('cache'):
+            cache.set(key, (time.time() + timeout, data), timeout=timeout + _stale_timeout())
+        return data
+    finally:
+        cache.delete(key + ':lock')
@@ -0,0 +1,87 @@
+"""
+ETag / Last-Modified для условных GET (django.views.decorators.http.condition).
+
+Функции вызываются до сериализации, и при совпадении If-None-Match ответ 304
+отдаётся без построения тела. Каждая читает не больше одной строки по
+первичному ключу, а то и ни одной: пользователь уже загружен
+аутентификацией, версия каталога лежит в кэше (core/cache.py).
+"""
+import hashlib
+import uuid
+
+from django.db.models import Q
+from django.views.decorators.http import condition
+
+from .cache import CATALOG_VERSION_KEY, STOCK_VERSION_KEY, get_version
+from .models import Order, Product
+
+
+def _digest(request, *parts):
+    # Тело зависит от параметров запроса, хоста (абсолютные URL) и Accept
+    raw = '|'.join(str(part) for part in (
+        *parts, request.get_full_path(), request.get_host(), request.META.get('HTTP_ACCEPT', ''),
+    ))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _row(request, queryset, pk, fields):
+    """
+    Поля одной строки по первичному ключу, один запрос на запрос клиента.
+    """
+    if not hasattr(request, '_conditional_row'):
+        try:
+            uuid.UUID(str(pk))
+        except ValueError:
+            request._conditional_row = None
+        else:
+            request._conditional_row = queryset.filter(pk=pk).values_list(*fields).first()
+    return request._conditional_row
+
+
+def product_list_etag(request, *args, **kwargs):
+    # quantity в списке подставляется при каждом ответе - учитываем версию остатков
+    return _digest(request, get_version(CATALOG_VERSION_KEY), get_version(STOCK_VERSION_KEY))
+
+
+def product_updated_at(request, pk=None, **kwargs):
+    row = _row(request, Product.objects.all(), pk, ['updated_at'])
+    return row[0] if row else None
+
+
+def product_etag(request, pk=None, **kwargs):
+    updated_at = product_updated_at(request, pk)
+    return _digest(request, pk, updated_at.isoformat()) if updated_at else None
+
+
+def order_list_etag(request, *args, **kwargs):
+    # Во вложенных товарах могут поменяться данные - учитываем версию каталога
+    user = request.user
+    return _digest(request, user.pk, user.orders_updated_at.isoformat(), get_version(CATALOG_VERSION_KEY))
+
+
+def order_updated_at(request, pk=None, **kwargs):
+    # Только свои заказы: 304 не должен подтверждать чужой заказ
+    user = request.user
+    orders = Order.objects.filter(Q(buyer=user) | Q(seller=user))
+    row = _row(request, orders, pk, ['updated_at', 'product__updated_at'])
+    return max(row) if row else None
+
+
+def order_etag(request, pk=None, **kwargs):
+    updated_at = order_updated_at(request, pk)
+    return _digest(request, request.user.pk, pk, updated_at.isoformat()) if updated_at else None
+
+
+def profile_last_modified(request, *args, **kwargs):
+    return request.user.updated_at
+
+
+def profile_etag(request, *args, **kwargs):
+    return _digest(request, request.user.pk, request.user.updated_at.isoformat())
+
+
+product_list_conditional = condition(etag_func=product_list_etag)
+product_conditional = condition(etag_func=product_etag, last_modified_func=product_updated_at)
+order_list_conditional = condition(etag_func=order_list_etag)
+order_conditional = condition(etag_func=order_etag, last_modified_func=order_updated_at)
+profile_conditional = condition(etag_func=profile_etag, last_modified_func=profile_last_modified)
@@ -0,0 +1,59 @@
+"""
+Счётчики фасетов каталога: ценовые диапазоны, продавцы, наличие.
+
+Считаются одним GROUP BY (продавец, ценовой диапазон, в наличии) по уже
+отфильтрованному queryset, остальное суммируется в Python. Результат входит
+в закэшированный ответ списка (core/cache.py), поэтому запрос выполняется
+один раз на версию каталога и набор параметров.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import BooleanField, Case, Count, ExpressionWrapper, IntegerField, Q, Value, When
+
+# Сколько продавцов с наибольшим числом товаров отдаётся в фасете
+SELLER_FACET_SIZE = 20
+
+
+def price_bounds():
+    return getattr(settings, 'PRODUCT_PRICE_FACETS', [100, 500, 1000, 5000])
+
+
+def product_facets(queryset):
+    bounds = price_bounds()
+    bucket = Case(
+        *(When(price__lt=bound, then=Value(i)) for i, bound in enumerate(bounds)),
+        default=Value(len(bounds)),
+        output_field=IntegerField(),
+    )
+    rows = (
+        queryset.order_by()
+        .annotate(
+            price_bucket=bucket,
+            in_stock=ExpressionWrapper(Q(quantity__gt=0), output_field=BooleanField()),
+        )
+        .values('seller_id', 'seller__username', 'price_bucket', 'in_stock')
+        .annotate(count=Count('id'))
+    )
+
+    prices, sellers, names = Counter(), Counter(), {}
+    in_stock = 0
+    for row in rows:
+        prices[row['price_bucket']] += row['count']
+        sellers[row['seller_id']] += row['count']
+        names[row['seller_id']] = row['seller__username']
+        if row['in_stock']:
+            in_stock += row['count']
+
+    edges = [0, *bounds, None]
+    return {
+        'price': [
+            {'min': edges[i], 'max': edges[i + 1], 'count': prices[i]}
+            for i in range(len(bounds) + 1)
+        ],
+        'sellers': [
+            {'id': str(seller_id), 'name': names[seller_id], 'count': count}
+            for seller_id, count in sellers.most_common(SELLER_FACET_SIZE)
+        ],
+        'in_stock': in_stock,
+    }
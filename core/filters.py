@@ -0,0 +1,95 @@
+"""
+Фильтры DRF для эндпоинтов каталога и заказов.
+"""
+import django_filters
+from django.db.models import FloatField, Value
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+from .models import Order, Product
+from .search import get_search_backend
+
+
+class ProductFilter(django_filters.FilterSet):
+    """
+    Фильтры каталога по денормализованным колонкам товара.
+    """
+    min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
+    seller = django_filters.UUIDFilter(field_name='seller_id')
+    in_stock = django_filters.BooleanFilter(method='filter_in_stock')
+    min_rating = django_filters.NumberFilter(field_name='rating_avg', lookup_expr='gte')
+    created_after = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='gte')
+    created_before = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='lt')
+
+    class Meta:
+        model = Product
+        fields = []
+
+    def filter_in_stock(self, queryset, name, value):
+        if value is None:
+            return queryset
+        return queryset.filter(quantity__gt=0) if value else queryset.filter(quantity__lte=0)
+
+
+class CharInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    pass
+
+
+class OrderFilter(django_filters.FilterSet):
+    """
+    Фильтры списков заказов. ?status=pending,paid - несколько статусов
+    через запятую. Вместе с ограничением по покупателю или продавцу
+    (OrderViewSet.get_queryset) попадают в индексы order_buyer_created_idx
+    и order_seller_status_idx.
+    """
+    status = CharInFilter(field_name='status')
+    product = django_filters.UUIDFilter(field_name='product_id')
+    created_after = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='gte')
+    created_before = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='lt')
+
+    class Meta:
+        model = Order
+        fields = []
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    """
+    ?search= через полнотекстовый бэкенд (core.search).
+
+    Queryset всегда аннотируется полем relevance, чтобы ordering=relevance
+    работал и без поискового запроса.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset.annotate(relevance=Value(0.0, output_field=FloatField()))
+        return get_search_backend().search(queryset, query)
+
+
+class ProductOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter с псевдонимами: ordering=relevance - сначала самые
+    релевантные, ordering=rating - сначала с лучшей средней оценкой (при
+    равной - с большим числом оценок). С минусом - в обратном порядке.
+    """
+    aliases = {
+        'relevance': ['-relevance'],
+        'rating': ['-rating_avg', '-rating_count'],
+    }
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        result = []
+        for term in ordering:
+            name = term.lstrip('-')
+            if name not in self.aliases:
+                result.append(term)
+            elif term.startswith('-'):
+                result.extend(t.lstrip('-') if t.startswith('-') else '-' + t for t in self.aliases[name])
+            else:
+                result.extend(self.aliases[name])
+        return result
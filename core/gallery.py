@@ -0,0 +1,84 @@
+"""
+Изображения товара: добавление, удаление и порядок за одну транзакцию.
+
+Удаление - обычный QuerySet.delete(): ссылки на файл и его варианты
+(core/storage.py) освобождает post_delete ProductImage. Новые изображения -
+один bulk_create, порядок - один UPDATE ... SET position = CASE id WHEN ...
+END; сигналы при этом не вызываются, поэтому ссылки на новые файлы,
+обработку вариантов и кэш каталога обновляем здесь. Файлы удаляются в фоне
+после коммита.
+"""
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.db.models.functions import Now
+
+from .cache import invalidate_catalog
+from .images import process_product_image
+from .models import Product, ProductImage
+from .storage import delete_unreferenced
+from .tasks import enqueue
+
+
+def _reorder(product, order):
+    """
+    Изображения из order (id) - первыми в этом порядке, остальные следом в
+    прежнем. Меняются только позиции, которые действительно сдвинулись.
+    """
+    current = list(ProductImage.objects.filter(product=product).values_list('pk', 'position'))
+    known = {pk for pk, _ in current}
+    first = list(dict.fromkeys(pk for pk in order if pk in known))
+    rest = [pk for pk, _ in sorted(current, key=lambda row: (row[1], row[0])) if pk not in set(first)]
+    wanted = {pk: position for position, pk in enumerate(first + rest)}
+    moved = {pk: wanted[pk] for pk, position in current if wanted[pk] != position}
+    if moved:
+        field = ProductImage._meta.get_field('position')
+        ProductImage.objects.filter(pk__in=moved).update(position=Case(
+            *[When(pk=pk, then=Value(position, output_field=field)) for pk, position in moved.items()],
+            output_field=field,
+        ))
+    return len(current)
+
+
+def update_images(product, uploaded=(), delete=(), order=None):
+    """
+    uploaded - новые файлы (в конец списка), delete - id удаляемых
+    изображений товара (чужие и несуществующие пропускаются), order - id в
+    нужном порядке. Возвращает изображения товара по порядку.
+    """
+    if not uploaded and not delete and order is None:
+        return list(product.images.all())
+
+    written = []
+    try:
+        with transaction.atomic():
+            # Параллельные изменения галереи одного товара - по очереди
+            Product.objects.select_for_update().filter(pk=product.pk).values_list('pk').first()
+
+            if delete:
+                # Файлы и варианты освобождает release_product_image_files (post_delete)
+                ProductImage.objects.filter(product=product, pk__in=delete).delete()
+
+            count = _reorder(product, order or [])
+
+            images = []
+            for position, upload in enumerate(uploaded, start=count):
+                image = ProductImage(product=product, position=position)
+                image.image.save(upload.name, upload, save=False)
+                written.append(image.image.name)
+                images.append(image)
+            if images:
+                # Ссылки на файлы заняты при записи (ContentAddressedStorage._save)
+                ProductImage.objects.bulk_create(images)
+                for image in images:
+                    enqueue(process_product_image, image.pk)
+
+            Product.objects.filter(pk=product.pk).update(updated_at=Now())
+            invalidate_catalog([product.pk])
+    except BaseException:
+        # Записанные файлы без ссылок не должны остаться на диске
+        if written:
+            delete_unreferenced(written)
+        raise
+
+    product._prefetched_objects_cache = {}
+    return list(ProductImage.objects.filter(product=product))
@@ -0,0 +1,180 @@
+"""
+Обработка загруженных изображений: варианты размеров, размеры оригинала,
+LQIP-заглушка.
+
+Для каждого варианта (VARIANTS: имя -> максимальная ширина) сохраняются
+WebP и копия в формате оригинала, рядом с оригиналом в подкаталоге variants/.
+Заглушка - крошечный WebP в data URI, его можно показать размытым, пока
+грузится картинка.
+
+Обработка идёт фоновой задачей (core/tasks.py) после сохранения
+ProductImage или аватара пользователя (signals.py). Результат пишется
+UPDATE-ом по (pk, имя файла): если файл успели заменить, запись пропускается.
+Варианты изображений товаров лежат в content_storage (core/storage.py) и
+учитываются в счётчиках ссылок вместе с оригиналом.
+"""
+import base64
+import io
+import logging
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.functions import Now
+from PIL import Image, ImageOps
+
+VARIANTS = {'thumb': 200, 'card': 600, 'full': 1600}
+PLACEHOLDER_SIZE = 16
+WEBP_QUALITY = 80
+ORIGINAL_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(image, fmt, **options):
+    if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def _variant_path(name, variant, ext):
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'variants', f'{stem}_{variant}.{ext}')
+
+
+def process_image(name, storage=default_storage):
+    """
+    Строит варианты файла name. Возвращает поля для модели: width, height,
+    placeholder, variants ({"source": name, "thumb": {...}, ...}).
+    """
+    with storage.open(name) as source:
+        original = Image.open(source)
+        fmt = original.format if original.format in ORIGINAL_FORMATS else 'JPEG'
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    variants = {'source': name}
+    for variant, max_width in VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail((max_width, max_width * 4), Image.LANCZOS)
+        entry = {'width': resized.width, 'height': resized.height}
+        webp = _variant_path(name, variant, 'webp')
+        entry['webp'] = storage.save(webp, ContentFile(_encode(resized, 'WEBP', quality=WEBP_QUALITY)))
+        if fmt != 'WEBP':
+            path = _variant_path(name, variant, ORIGINAL_FORMATS[fmt])
+            entry['original'] = storage.save(path, ContentFile(_encode(resized, fmt, optimize=True)))
+        variants[variant] = entry
+
+    tiny = image.copy()
+    tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    placeholder = 'data:image/webp;base64,' + base64.b64encode(_encode(tiny, 'WEBP', quality=30)).decode()
+    return {'width': image.width, 'height': image.height, 'placeholder': placeholder, 'variants': variants}
+
+
+def variant_files(variants):
+    return [
+        path for variant in VARIANTS if variant in (variants or {})
+        for path in (variants[variant].get('webp'), variants[variant].get('original')) if path
+    ]
+
+
+def delete_files(paths, storage=default_storage):
+    for path in paths:
+        storage.delete(path)
+
+
+def _delete_replaced(old_variants, name):
+    # Варианты прежнего файла больше не нужны
+    if old_variants and old_variants.get('source') != name:
+        delete_files(variant_files(old_variants))
+
+
+def srcset(variants, url, key='webp'):
+    """
+    srcset по вариантам: "url 200w, url 600w, ...". url(path) строит адрес.
+    """
+    entries = [variants[v] for v in VARIANTS if v in (variants or {}) and key in variants[v]]
+    return ', '.join(f"{url(entry[key])} {entry['width']}w" for entry in entries)
+
+
+def _safe_process(name, storage=default_storage):
+    try:
+        return process_image(name, storage)
+    except (OSError, Image.DecompressionBombError) as exc:
+        # Битый или не поддерживаемый файл: отдаём оригинал как есть
+        logger.warning("Cannot process image %s: %s", name, exc)
+        return None
+
+
+def _failed_variants(name):
+    """
+    variants файла, который не удалось обработать: source без размеров.
+    Сигналы сверяют source с именем файла и больше не ставят задачу.
+    """
+    return {'source': name}
+
+
+def process_product_image(image_id):
+    """
+    Фоновая задача для ProductImage.
+    """
+    from .cache import invalidate_catalog
+    from .models import Product, ProductImage
+    from .storage import acquire, release
+
+    row = ProductImage.objects.filter(pk=image_id).values_list('image', 'product_id').first()
+    if row is None or not row[0]:
+        return
+    name, product_id = row
+    # Тот же файл уже обработан для другого товара: варианты общие
+    fields = ProductImage.objects.filter(
+        image=name, width__isnull=False,
+    ).exclude(pk=image_id).values('width', 'height', 'placeholder', 'variants').first()
+    # Записанные варианты заняты при записи (ContentAddressedStorage._save),
+    # чужие - занимаем здесь
+    shared = fields is not None and fields['variants'].get('source') == name
+    if not shared:
+        fields = _safe_process(name, ProductImage._meta.get_field('image').storage)
+    if fields is None:
+        ProductImage.objects.filter(pk=image_id, image=name).update(variants=_failed_variants(name))
+        return
+    # Ссылки на прежние варианты освобождает сигнал при замене файла
+    with transaction.atomic():
+        updated = ProductImage.objects.filter(pk=image_id, image=name).update(**fields)
+        if updated and shared:
+            acquire(variant_files(fields['variants']))
+    if updated:
+        Product.objects.filter(pk=product_id).update(updated_at=Now())
+        invalidate_catalog([product_id])
+    elif not shared:
+        release(variant_files(fields['variants']))
+
+
+def process_avatar(user_id):
+    """
+    Фоновая задача для User.avatar.
+    """
+    from .models import User
+
+    row = User.objects.filter(pk=user_id).values_list('avatar', 'avatar_variants').first()
+    if row is None or not row[0]:
+        return
+    name, old_variants = row
+    fields = _safe_process(name)
+    if fields is None:
+        if User.objects.filter(pk=user_id, avatar=name).update(avatar_variants=_failed_variants(name)):
+            _delete_replaced(old_variants, name)
+        return
+    updated = User.objects.filter(pk=user_id, avatar=name).update(
+        updated_at=Now(), **{f'avatar_{key}': value for key, value in fields.items()}
+    )
+    if updated:
+        _delete_replaced(old_variants, name)
+    else:
+        delete_files(variant_files(fields['variants']))
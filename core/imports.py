@@ -0,0 +1,391 @@
+"""
+Пакетный импорт товаров из CSV/JSONL.
+
+Файл читается целиком, каждая колонка проверяется одним полем формы по всем
+строкам сразу, корректные строки пишутся bulk_create пачками в одной
+транзакции, по некорректным возвращается отчёт (номер строки - поля - ошибки).
+
+Колонка images - ссылки на изображения (http/https) или имена файлов в
+приложенном zip-архиве, в CSV через «|». Изображения загружаются фоновой
+задачей (core/tasks.py), состояние - в ProductImport.
+"""
+import csv
+import http.client
+import io
+import ipaddress
+import json
+import logging
+import os
+import socket
+import uuid
+import zipfile
+from datetime import timedelta
+from urllib.parse import urljoin, urlparse
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Now
+from django.utils import timezone
+from PIL import Image
+
+from . import suggest
+from .cache import invalidate_catalog
+from .models import Product, ProductImage, ProductImport
+from .search import get_search_backend
+from .images import process_product_image
+from .storage import release
+from .tasks import enqueue
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 500
+IMAGE_FETCH_TIMEOUT = 10
+IMAGE_FETCH_MAX_REDIRECTS = 3
+IMAGES_SEPARATOR = '|'
+
+COLUMNS = {
+    'title': forms.CharField(max_length=120),
+    'description': forms.CharField(required=False),
+    'price': forms.DecimalField(max_digits=10, decimal_places=2, min_value=0),
+    'quantity': forms.IntegerField(min_value=0, required=False),
+    'download_link': forms.URLField(required=False),
+    'usage_instructions': forms.CharField(required=False),
+    'seller_info': forms.CharField(required=False),
+    'image_url': forms.URLField(required=False),
+}
+
+
+class ImportFormatError(ValueError):
+    """
+    Файл целиком не удаётся прочитать (формат, кодировка, размер).
+    """
+
+
+class ImageFetchError(Exception):
+    pass
+
+
+def _max_rows():
+    return getattr(settings, 'PRODUCT_IMPORT_MAX_ROWS', 10000)
+
+
+def _max_image_size():
+    return getattr(settings, 'PRODUCT_IMPORT_MAX_IMAGE_SIZE', 10 * 1024 * 1024)
+
+
+def read_rows(fileobj, filename=''):
+    """
+    Строки файла: словари (CSV, JSONL) или None для нечитаемой строки JSONL.
+    """
+    try:
+        text = fileobj.read().decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ImportFormatError("Файл должен быть в кодировке UTF-8")
+
+    if filename.lower().endswith(('.jsonl', '.ndjson')) or text.lstrip().startswith('{'):
+        rows = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            rows.append(row if isinstance(row, dict) else None)
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+    if len(rows) > _max_rows():
+        raise ImportFormatError(f"Не больше {_max_rows()} строк за один импорт")
+    return rows
+
+
+def _image_refs(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(IMAGES_SEPARATOR)
+    return [str(ref).strip() for ref in value if str(ref).strip()]
+
+
+def validate_rows(rows):
+    """
+    Возвращает (valid, errors): valid - [(номер строки, поля Product, ссылки
+    на изображения)], errors - [{"row": N, "errors": {...}}]. Строки с 1.
+    """
+    cleaned = [{} for _ in rows]
+    failed = [{} for _ in rows]
+    for index, row in enumerate(rows):
+        if row is None:
+            failed[index]['non_field_errors'] = ["Строка не является JSON-объектом"]
+
+    for name, field in COLUMNS.items():
+        for index, row in enumerate(rows):
+            if row is None:
+                continue
+            try:
+                cleaned[index][name] = field.clean(row.get(name))
+            except ValidationError as exc:
+                failed[index][name] = exc.messages
+
+    valid, errors = [], []
+    for index, row in enumerate(rows):
+        if failed[index]:
+            errors.append({'row': index + 1, 'errors': failed[index]})
+            continue
+        fields = cleaned[index]
+        if fields['quantity'] is None:
+            del fields['quantity']
+        valid.append((index + 1, fields, _image_refs(row.get('images'))))
+    return valid, errors
+
+
+def products_created(products):
+    """
+    bulk_create не вызывает сигналы: обновляем поиск, подсказки и кэш сами.
+    """
+    get_search_backend().index_products([product.pk for product in products])
+    for product in products:
+        suggest.product_changed(product)
+    invalidate_catalog()
+
+
+def import_products(seller, fileobj, filename='', archive=None, background=True):
+    """
+    Создаёт товары продавца из файла, возвращает ProductImport с отчётом.
+    Изображения загружаются после коммита: в фоне или (background=False) сразу.
+    """
+    rows = read_rows(fileobj, filename)
+    valid, errors = validate_rows(rows)
+    products = [Product(seller=seller, **fields) for _, fields, _ in valid]
+    pending = [
+        {'row': row, 'product': str(product.pk), 'ref': ref}
+        for (row, _, refs), product in zip(valid, products)
+        for ref in refs
+    ]
+
+    job = ProductImport(seller=seller, total_rows=len(rows), created_count=len(products), errors=errors)
+    with transaction.atomic():
+        for start in range(0, len(products), IMPORT_BATCH_SIZE):
+            Product.objects.bulk_create(products[start:start + IMPORT_BATCH_SIZE])
+        if pending:
+            job.status = ProductImport.Status.IMAGES
+            job.pending_images = pending
+            if archive is not None:
+                job.archive = default_storage.save(f'imports/{uuid.uuid4().hex}.zip', archive)
+        else:
+            job.finished_at = timezone.now()
+        job.save()
+        if products:
+            products_created(products)
+        if pending:
+            if background:
+                enqueue(fetch_import_images, job.pk)
+            else:
+                transaction.on_commit(lambda: fetch_import_images(job.pk))
+    return job
+
+
+def _public_address(host):
+    """
+    IP-адрес хоста, если все его адреса публичные: импорт не должен ходить
+    во внутреннюю сеть.
+    """
+    try:
+        addresses = socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError, TypeError):
+        raise ImageFetchError("Не удалось разрешить адрес")
+    if not addresses:
+        raise ImageFetchError("Не удалось разрешить адрес")
+    for address in addresses:
+        if not ipaddress.ip_address(address[4][0]).is_global:
+            raise ImageFetchError("Адрес недоступен для загрузки")
+    return addresses[0][4][0]
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    """
+    Соединение с заранее проверенным адресом: повторное разрешение имени
+    при подключении (DNS rebinding) не даст уйти на другой адрес.
+    """
+    def __init__(self, host, address, **kwargs):
+        super().__init__(host, **kwargs)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, host, address, **kwargs):
+        super().__init__(host, **kwargs)
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port), self.timeout)
+        # Сертификат проверяется по имени хоста из ссылки
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+def _fetch(url, limit):
+    """
+    Содержимое по ссылке (не больше limit + 1 байт). Перенаправления
+    обрабатываются здесь же: каждый адрес проверяется заново.
+    """
+    for _ in range(IMAGE_FETCH_MAX_REDIRECTS + 1):
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+            raise ImageFetchError("Недопустимая ссылка")
+        connection_class = _PinnedHTTPSConnection if parsed.scheme == 'https' else _PinnedHTTPConnection
+        connection = connection_class(
+            parsed.hostname, _public_address(parsed.hostname), port=parsed.port, timeout=IMAGE_FETCH_TIMEOUT,
+        )
+        try:
+            path = (parsed.path or '/') + (f'?{parsed.query}' if parsed.query else '')
+            connection.request('GET', path, headers={'User-Agent': 'reshop-import'})
+            response = connection.getresponse()
+            if response.status in (301, 302, 303, 307, 308):
+                location = response.getheader('Location')
+                if not location:
+                    raise ImageFetchError(f"Перенаправление без адреса (HTTP {response.status})")
+                url = urljoin(url, location)
+                continue
+            if response.status != 200:
+                raise ImageFetchError(f"Не удалось загрузить: HTTP {response.status}")
+            return response.read(limit + 1)
+        except (OSError, ValueError, http.client.HTTPException) as exc:
+            raise ImageFetchError(f"Не удалось загрузить: {exc}")
+        finally:
+            connection.close()
+    raise ImageFetchError("Слишком много перенаправлений")
+
+
+def load_image(ref, archive=None):
+    """
+    (имя файла, содержимое) изображения по ссылке или из архива.
+    """
+    limit = _max_image_size()
+    if ref.startswith(('http://', 'https://')):
+        content = _fetch(ref, limit)
+        name = os.path.basename(urlparse(ref).path) or 'image'
+    else:
+        if archive is None:
+            raise ImageFetchError("Архив с изображениями не приложен")
+        try:
+            info = archive.getinfo(ref)
+        except KeyError:
+            raise ImageFetchError("Файл не найден в архиве")
+        if info.file_size > limit:
+            raise ImageFetchError("Файл слишком большой")
+        content = archive.read(info)
+        name = os.path.basename(ref)
+
+    if len(content) > limit:
+        raise ImageFetchError("Файл слишком большой")
+    try:
+        Image.open(io.BytesIO(content)).verify()
+    except Exception:
+        raise ImageFetchError("Файл не является изображением")
+    return name, content
+
+
+def _stale_after():
+    return timedelta(seconds=getattr(settings, 'PRODUCT_IMPORT_STALE_AFTER', 60 * 60))
+
+
+def fetch_import_images(job_id, stale_after=None):
+    """
+    Фоновая задача: загружает изображения импорта и создаёт ProductImage.
+
+    Задача сначала занимает импорт условным UPDATE images_started_at: второй
+    запуск (resume_imports) возьмётся за него, только если первый не успел
+    за PRODUCT_IMPORT_STALE_AFTER, а результат запишет лишь последний занявший.
+    """
+    started = timezone.now()
+    stale_after = stale_after or _stale_after()
+    claimed = ProductImport.objects.filter(pk=job_id, status=ProductImport.Status.IMAGES).filter(
+        Q(images_started_at__isnull=True) | Q(images_started_at__lt=started - stale_after)
+    ).update(images_started_at=started)
+    if not claimed:
+        return
+    job = ProductImport.objects.get(pk=job_id)
+    product_ids = {item['product'] for item in job.pending_images}
+    existing = {str(pk) for pk in Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True)}
+
+    images, failures = [], []
+    archive = zipfile.ZipFile(default_storage.open(job.archive)) if job.archive else None
+    try:
+        for item in job.pending_images:
+            if item['product'] not in existing:
+                continue
+            try:
+                name, content = load_image(item['ref'], archive)
+            except ImageFetchError as exc:
+                failures.append({'row': item['row'], 'image': item['ref'], 'error': str(exc)})
+                continue
+            image = ProductImage(product_id=item['product'])
+            image.image.save(name, ContentFile(content), save=False)
+            images.append(image)
+    except BaseException:
+        # Ссылки на уже записанные файлы заняты при записи - освобождаем
+        release([image.image.name for image in images])
+        raise
+    finally:
+        if archive is not None:
+            archive.close()
+
+    touched = {image.product_id for image in images}
+    archive_path = job.archive
+    with transaction.atomic():
+        finished = ProductImport.objects.filter(
+            pk=job_id, status=ProductImport.Status.IMAGES, images_started_at=started,
+        ).update(
+            status=ProductImport.Status.DONE, pending_images=[], image_errors=failures,
+            finished_at=timezone.now(), archive='',
+        )
+        if finished:
+            # Ссылки на файлы заняты при записи (ContentAddressedStorage._save);
+            # bulk_create не вызывает сигналы: варианты размеров - сами
+            ProductImage.objects.bulk_create(images, batch_size=IMPORT_BATCH_SIZE)
+            for image in images:
+                enqueue(process_product_image, image.pk)
+            Product.objects.filter(pk__in=touched).update(updated_at=Now())
+            invalidate_catalog(touched)
+
+    if not finished:
+        # Импорт занял повторный запуск - его результат и останется. Файлы
+        # адресуются содержимым: те же имена записал и повторный запуск, а
+        # могли и другие товары, поэтому освобождаются только наши ссылки
+        logger.warning("Product import %s was taken over, dropping %s images", job_id, len(images))
+        release([image.image.name for image in images])
+        return
+
+    if archive_path:
+        default_storage.delete(archive_path)
+
+
+def resume_stale_imports(max_age=None):
+    """
+    Заново запускает загрузку изображений импортов, задача которых не
+    завершилась (процесс перезапустили, задача упала). Возвращает число
+    запущенных импортов.
+    """
+    max_age = max_age or _stale_after()
+    threshold = timezone.now() - max_age
+    stale = ProductImport.objects.filter(status=ProductImport.Status.IMAGES, created_at__lt=threshold).filter(
+        Q(images_started_at__isnull=True) | Q(images_started_at__lt=threshold)
+    )
+    count = 0
+    for job_id in stale.values_list('pk', flat=True):
+        try:
+            fetch_import_images(job_id, max_age)
+        except Exception:
+            logger.exception("Product import %s failed again", job_id)
+            continue
+        count += 1
+    return count
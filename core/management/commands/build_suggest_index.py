@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.suggest import PrefixIndex
+
+
+class Command(BaseCommand):
+    help = "Строит индекс подсказок поиска и сохраняет снимок для загрузки воркерами"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="Путь к снимку (по умолчанию SUGGEST_SNAPSHOT_PATH)")
+
+    def handle(self, *args, **options):
+        path = options['output'] or getattr(settings, 'SUGGEST_SNAPSHOT_PATH', None)
+        if not path:
+            raise CommandError("Укажите --output или SUGGEST_SNAPSHOT_PATH")
+        index = PrefixIndex.build()
+        index.save(path)
+        self.stdout.write(self.style.SUCCESS(f"Снимок индекса подсказок сохранён: {len(index.products)} товаров"))
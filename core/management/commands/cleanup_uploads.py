@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.uploads import cleanup_uploads
+
+
+class Command(BaseCommand):
+    help = "Удаляет брошенные загрузки файлов товаров и их недокачанные части"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, help="Секунды без активности (по умолчанию UPLOAD_EXPIRY)")
+
+    def handle(self, *args, **options):
+        max_age = timedelta(seconds=options['max_age']) if options['max_age'] else None
+        removed = cleanup_uploads(max_age)
+        self.stdout.write(self.style.SUCCESS(f"Удалено загрузок: {removed}"))
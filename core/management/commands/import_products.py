@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import ImportFormatError, import_products
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = "Импортирует товары продавца из CSV/JSONL (изображения загружаются сразу)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV или JSONL файл")
+        parser.add_argument('--seller', required=True, help="Email продавца")
+        parser.add_argument('--images', help="zip-архив с изображениями")
+
+    def handle(self, *args, **options):
+        try:
+            seller = User.objects.get(email=options['seller'], role=User.Roles.SELLER)
+        except User.DoesNotExist:
+            raise CommandError(f"Продавец {options['seller']} не найден")
+
+        archive = open(options['images'], 'rb') if options['images'] else None
+        try:
+            with open(options['path'], 'rb') as source:
+                job = import_products(seller, source, options['path'], archive=archive, background=False)
+        except ImportFormatError as e:
+            raise CommandError(str(e))
+        finally:
+            if archive is not None:
+                archive.close()
+
+        job.refresh_from_db()
+        for error in job.errors + job.image_errors:
+            self.stderr.write(f"Строка {error['row']}: {error.get('errors') or error.get('error')}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано товаров: {job.created_count} из {job.total_rows}, ошибок изображений: {len(job.image_errors)}"
+        ))
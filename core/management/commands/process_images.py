@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from core.images import process_avatar, process_product_image
+from core.models import ProductImage, User
+
+
+class Command(BaseCommand):
+    help = "Строит варианты размеров для изображений товаров и аватаров, у которых их ещё нет"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Перестроить и уже обработанные")
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.exclude(image='')
+        users = User.objects.exclude(avatar='').exclude(avatar__isnull=True)
+        if not options['all']:
+            images = images.filter(width__isnull=True)
+            users = users.filter(avatar_width__isnull=True)
+
+        count = 0
+        for image_id in images.values_list('pk', flat=True).iterator():
+            process_product_image(image_id)
+            count += 1
+        for user_id in users.values_list('pk', flat=True).iterator():
+            process_avatar(user_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Обработано изображений: {count}"))
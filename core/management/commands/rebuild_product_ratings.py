@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.ratings import rebuild_product_ratings
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает агрегаты отзывов (рейтинг, гистограмма) всех товаров"
+
+    def handle(self, *args, **options):
+        rebuild_product_ratings()
+        self.stdout.write(self.style.SUCCESS("Агрегаты отзывов пересчитаны"))
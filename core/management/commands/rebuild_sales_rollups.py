@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.sales import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает дневную статистику продаж продавцов по всем заказам"
+
+    def handle(self, *args, **options):
+        rebuild_sales_rollups()
+        self.stdout.write(self.style.SUCCESS("Статистика продаж пересчитана"))
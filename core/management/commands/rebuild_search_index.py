@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Product
+from core.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Перестраивает поисковый индекс товаров"
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"{backend.__class__.__name__}: проиндексировано товаров: {Product.objects.count()}"
+        ))
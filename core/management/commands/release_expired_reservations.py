@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.stock import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = "Отменяет неоплаченные заказы с истёкшим резервом и возвращает остаток (запускать по cron)"
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            released = release_expired_reservations()
+            total += released
+            if not released:
+                break
+        self.stdout.write(self.style.SUCCESS(f"Отменено заказов: {total}"))
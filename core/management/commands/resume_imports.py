@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.imports import resume_stale_imports
+
+
+class Command(BaseCommand):
+    help = "Заново загружает изображения импортов, фоновая задача которых не завершилась (запускать по cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age', type=int, help="Секунды без завершения (по умолчанию PRODUCT_IMPORT_STALE_AFTER)",
+        )
+
+    def handle(self, *args, **options):
+        max_age = timedelta(seconds=options['max_age']) if options['max_age'] else None
+        resumed = resume_stale_imports(max_age)
+        self.stdout.write(self.style.SUCCESS(f"Перезапущено импортов: {resumed}"))
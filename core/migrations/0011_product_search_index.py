@@ -0,0 +1,88 @@
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE core_product_fts USING fts5("
+    "product_id UNINDEXED, title, description, tokenize = 'unicode61 remove_diacritics 2')",
+]
+SQLITE_BACKWARD = ["DROP TABLE IF EXISTS core_product_fts"]
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE TABLE core_product_search ("
+    "product_id uuid PRIMARY KEY REFERENCES core_product (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX core_product_search_document_gin ON core_product_search USING gin (document)",
+    "CREATE INDEX core_product_title_trgm ON core_product USING gin (title gin_trgm_ops)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS core_product_title_trgm",
+    "DROP TABLE IF EXISTS core_product_search",
+]
+
+
+def run(statements_by_vendor):
+    def operation(apps, schema_editor):
+        statements = statements_by_vendor.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+POSTGRES_BUILD = (
+    "INSERT INTO core_product_search (product_id, document) "
+    "SELECT id, "
+    "setweight(to_tsvector('russian', translate(coalesce(title, ''), 'ёЁ', 'еЕ')), 'A') || "
+    "setweight(to_tsvector('english', translate(coalesce(title, ''), 'ёЁ', 'еЕ')), 'A') || "
+    "setweight(to_tsvector('russian', translate(coalesce(description, ''), 'ёЁ', 'еЕ')), 'B') || "
+    "setweight(to_tsvector('english', translate(coalesce(description, ''), 'ёЁ', 'еЕ')), 'B') "
+    "FROM core_product"
+)
+
+
+def _normalize(text):
+    # Копия core.search.normalize на момент миграции
+    return (text or "").lower().replace("ё", "е")
+
+
+def build_index(apps, schema_editor):
+    """
+    Заполняет индекс существующими товарами. Миграция не зависит от
+    core.search: SQL и нормализация текста зафиксированы здесь, товары
+    читаются историческими моделями.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_BUILD)
+    elif vendor == 'sqlite':
+        Product = apps.get_model('core', 'Product')
+        products = Product.objects.using(schema_editor.connection.alias).values_list('id', 'title', 'description')
+        rows = [
+            # rowid - старшие 63 бита UUID (SqliteSearchBackend.rowid)
+            (pk.int >> 65, pk.hex, _normalize(title), _normalize(description))
+            for pk, title, description in products.iterator()
+        ]
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT OR REPLACE INTO core_product_fts (rowid, product_id, title, description) "
+                "VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+
+
+class Migration(migrations.Migration):
+    """
+    Таблицы полнотекстового индекса товаров (см. core/search.py).
+    """
+
+    dependencies = [
+        ('core', '0010_alter_order_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
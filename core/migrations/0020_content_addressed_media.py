@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:03
+
+from collections import Counter
+
+import core.storage
+from django.db import migrations, models
+
+
+def count_references(apps, schema_editor):
+    """
+    Счётчики ссылок для уже загруженных изображений и их вариантов (файлы
+    остаются под прежними именами).
+    """
+    ProductImage = apps.get_model('core', 'ProductImage')
+    MediaBlob = apps.get_model('core', 'MediaBlob')
+    counts = Counter()
+    for name, variants in ProductImage.objects.values_list('image', 'variants').iterator():
+        if name:
+            counts[name] += 1
+        for variant in ('thumb', 'card', 'full'):
+            entry = (variants or {}).get(variant) or {}
+            for key in ('webp', 'original'):
+                if entry.get(key):
+                    counts[entry[key]] += 1
+    MediaBlob.objects.bulk_create(
+        [MediaBlob(name=name, ref_count=count) for name, count in counts.items()], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_product_file_uploads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=core.storage.content_storage, upload_to='products/'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_sales(apps, schema_editor):
+    """
+    Цена на момент заказа для старых заказов неизвестна - берём текущую
+    цену товара, затем строим статистику.
+    """
+    from core.sales import rebuild_sales_rollups
+    Order = apps.get_model('core', 'Order')
+    Product = apps.get_model('core', 'Product')
+    Order.objects.filter(unit_price__isnull=True).update(
+        unit_price=models.Subquery(Product.objects.filter(pk=models.OuterRef('product')).values('price')[:1]),
+    )
+    rebuild_sales_rollups(Order, apps.get_model('core', 'SalesRollup'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_image_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('orders_count', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='core.product')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('seller', 'day', 'product', 'status'), name='sales_rollup_key')],
+            },
+        ),
+        migrations.RunPython(fill_sales, migrations.RunPython.noop),
+    ]
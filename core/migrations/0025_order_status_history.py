@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_order_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'В ожидании оплаты'), ('paid', 'Оплачен'), ('delivered', 'Доставлен'), ('payment_rejected', 'Отклонен платежной системой'), ('seller_rejected', 'Отклонен продавцом'), ('canceled', 'Отменен')], default='pending', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='OrderStatusChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, max_length=20)),
+                ('to_status', models.CharField(max_length=20)),
+                ('source', models.CharField(choices=[('seller', 'Продавец'), ('payment', 'Платёжная система'), ('reservation', 'Истёк резерв'), ('system', 'Система')], default='system', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_history', to='core.order')),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+                'indexes': [models.Index(fields=['order', 'created_at'], name='order_status_change_idx')],
+            },
+        ),
+    ]
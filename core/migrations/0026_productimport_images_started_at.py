@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_order_status_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimport',
+            name='images_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
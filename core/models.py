@@ -3,7 +3,10 @@
 """
 import uuid
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+
+from .storage import ContentImageField, content_storage, private_storage
 
 
 class User(AbstractUser):
@@ -23,6 +26,48 @@ class Roles(models.TextChoices):
 
     email = models.EmailField(unique=True)
 
+    # Профиль (поля добавлены миграцией 0009)
+    avatar = models.ImageField(upload_to='avatars/', blank=True, null=True, verbose_name='Аватар')
+    bio = models.TextField(blank=True, verbose_name='О себе')
+    location = models.CharField(max_length=100, blank=True, verbose_name='Местоположение')
+    phone = models.CharField(max_length=20, blank=True, verbose_name='Телефон')
+    website = models.URLField(blank=True, verbose_name='Веб-сайт')
+    # Заполняются фоновой обработкой аватара (core/images.py)
+    avatar_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    avatar_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    avatar_placeholder = models.TextField(blank=True, editable=False)
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    updated_at = models.DateTimeField(auto_now=True)
+    # Последнее изменение заказов пользователя (как покупателя или продавца),
+    # для ETag списков заказов без запроса к таблице заказов
+    orders_updated_at = models.DateTimeField(default=timezone.now, editable=False)
+
+
+# Сколько последних отзывов встраивается в ответ о товаре
+REVIEW_PREVIEW_SIZE = 3
+
+
+def latest_comments_prefetch(lookup='comments'):
+    """
+    Prefetch последних REVIEW_PREVIEW_SIZE отзывов в атрибут latest_comments
+    (срез внутри prefetch - одна оконная выборка на всю страницу).
+    """
+    return models.Prefetch(
+        lookup,
+        queryset=ProductComment.objects.select_related('user')[:REVIEW_PREVIEW_SIZE],
+        to_attr='latest_comments',
+    )
+
+
+class ProductQuerySet(models.QuerySet):
+    def for_serializer(self):
+        """
+        Подгружает всё, что читает ProductSerializer (продавец, изображения,
+        последние отзывы с авторами), фиксированным числом запросов.
+        """
+        return self.select_related('seller').prefetch_related('images', latest_comments_prefetch())
+
 
 class Product(models.Model):
     """
@@ -38,8 +83,47 @@ class Product(models.Model):
     usage_instructions = models.TextField(blank=True, verbose_name="Инструкция по использованию")
     seller_info = models.TextField(blank=True, verbose_name="Информация от продавца")
     image_url = models.URLField(blank=True, verbose_name="URL изображения товара")
+    # Файл товара, загружается частями через /api/uploads/ (core/uploads.py)
+    file = models.FileField(upload_to='product_files/', storage=private_storage, blank=True, editable=False)
+    file_name = models.CharField(max_length=255, blank=True, editable=False)
+    file_size = models.BigIntegerField(null=True, blank=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    # Меняется и при изменении изображений/отзывов (signals.py, ratings.py)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Агрегаты отзывов, обновляются при изменении ProductComment (core/ratings.py)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # keyset-пагинация (core/pagination.py)
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),
+            # ordering=rating и min_rating
+            models.Index(fields=['rating_avg', 'rating_count'], name='product_rating_idx'),
+            # инкрементальная синхронизация индекса подсказок (core/suggest.py)
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+            # фильтры каталога (core/filters.py): цена, продавец, в наличии
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['seller', 'created_at'], name='product_seller_created_idx'),
+            models.Index(
+                fields=['created_at', 'id'], condition=models.Q(quantity__gt=0), name='product_in_stock_idx',
+            ),
+        ]
+
+    @property
+    def rating_histogram(self):
+        return {star: getattr(self, f'rating_{star}_count') for star in range(1, 6)}
 
     def __str__(self):
         return self.title
@@ -50,37 +134,250 @@ class ProductImage(models.Model):
     Изображение для товара. У одного товара может быть несколько.
     """
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='products/')
+    # Имя файла - хеш содержимого, одинаковые файлы общие (core/storage.py)
+    image = ContentImageField(upload_to='products/', storage=content_storage)
+    # Порядок в галерее товара (core/gallery.py)
+    position = models.PositiveIntegerField(default=0)
+    # Заполняются фоновой обработкой (core/images.py)
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    placeholder = models.TextField(blank=True, editable=False)
+    variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        ordering = ['position', 'id']
+        indexes = [
+            models.Index(fields=['product', 'position'], name='productimage_position_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Нужно, чтобы при замене файла освободить ссылку на прежний
+        instance._loaded_image = instance.__dict__.get('image')
+        return instance
 
     def __str__(self):
         return f"Image for {self.product.title}"
 
 
+class MediaBlob(models.Model):
+    """
+    Файл в content_storage и число ссылок на него (изображения товаров и
+    их варианты). Без строки файл удаляется (core/storage.py).
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+
+class Upload(models.Model):
+    """
+    Возобновляемая загрузка файла товара частями (core/uploads.py).
+    """
+    class Status(models.TextChoices):
+        UPLOADING = "uploading", "Загружается"
+        PROCESSING = "processing", "Проверяется"
+        COMPLETE = "complete", "Завершена"
+        FAILED = "failed", "Ошибка"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="uploads")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="uploads")
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    # sha256 (hex), передаётся при завершении загрузки
+    checksum = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.UPLOADING)
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # сборка брошенных загрузок (cleanup_uploads)
+            models.Index(fields=['status', 'updated_at'], name='upload_status_updated_idx'),
+        ]
+
+
+class ProductImport(models.Model):
+    """
+    Пакетный импорт товаров продавца из CSV/JSONL (core/imports.py).
+    Товары создаются сразу, изображения загружаются в фоне.
+    """
+    class Status(models.TextChoices):
+        IMAGES = "images", "Загрузка изображений"
+        DONE = "done", "Завершён"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name="product_imports")
+    status = models.CharField(max_length=6, choices=Status.choices, default=Status.DONE)
+    total_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    # [{"row": N, "errors": {"поле": ["сообщение", ...]}}]
+    errors = models.JSONField(default=list, blank=True)
+    # Изображения, которые ещё предстоит загрузить: [{"row", "product", "ref"}]
+    pending_images = models.JSONField(default=list, blank=True)
+    image_errors = models.JSONField(default=list, blank=True)
+    # Путь к zip-архиву с изображениями в default_storage (удаляется после загрузки)
+    archive = models.CharField(max_length=255, blank=True)
+    # Когда фоновая задача взялась за изображения (повторный запуск - resume_imports)
+    images_started_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Import {self.id} ({self.created_count}/{self.total_rows})"
+
+
+class OrderQuerySet(models.QuerySet):
+    def compact(self):
+        """
+        Для компактного OrderSerializer: товар с продавцом и покупатель одним
+        JOIN, первое изображение товара (миниатюра) - подзапросами в том же
+        запросе.
+        """
+        first_image = ProductImage.objects.filter(product=models.OuterRef('product')).order_by('position', 'id')
+        return self.select_related('buyer', 'product__seller').annotate(
+            product_image=models.Subquery(first_image.values('image')[:1]),
+            product_image_variants=models.Subquery(
+                first_image.values('variants')[:1], output_field=models.JSONField(),
+            ),
+        )
+
+    def for_serializer(self):
+        """
+        Подгружает покупателя и вложенный товар для OrderSerializer с
+        ?expand=product фиксированным числом запросов.
+        """
+        return self.select_related('buyer', 'product__seller').prefetch_related(
+            'product__images', latest_comments_prefetch('product__comments')
+        )
+
+
 class Order(models.Model):
     """
     Заказ = связь покупателя с конкретным товаром.
+
+    Статус меняется только разрешёнными переходами (core/orders.py).
     """
     class Status(models.TextChoices):
         PENDING = "pending", "В ожидании оплаты"
         PAID = "paid", "Оплачен"
         DELIVERED = "delivered", "Доставлен"
+        PAYMENT_REJECTED = "payment_rejected", "Отклонен платежной системой"
+        SELLER_REJECTED = "seller_rejected", "Отклонен продавцом"
         CANCELED = "canceled", "Отменен"
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name="orders")
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    # Продавец товара (копия product.seller): списки заказов продавца идут
+    # по индексу (seller, status, created_at) без JOIN с товаром
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name="sales", editable=False, db_index=False)
     quantity = models.PositiveIntegerField(default=1)
+    # Цена товара на момент заказа (для статистики продаж, core/sales.py)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, editable=False)
     comment = models.TextField(blank=True)
     receipt_email = models.EmailField(blank=True, null=True)
     status = models.CharField(
-        max_length=9, choices=Status.choices, default=Status.PENDING
+        max_length=20, choices=Status.choices, default=Status.PENDING
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # До какого момента держится резерв остатка неоплаченного заказа;
+    # NULL - резерва нет (оплачен, возвращён или заказ без резерва). core/stock.py
+    reserved_until = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='order_created_id_idx'),
+            # списки заказов покупателя и продавца (OrderViewSet, OrderFilter)
+            models.Index(fields=['buyer', 'created_at', 'id'], name='order_buyer_created_idx'),
+            models.Index(fields=['seller', 'status', 'created_at', 'id'], name='order_seller_status_idx'),
+            models.Index(fields=['seller', 'created_at', 'id'], name='order_seller_created_idx'),
+            # поиск просроченных резервов (release_expired_reservations)
+            models.Index(fields=['status', 'reserved_until'], name='order_reservation_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Нужно для переноса заказа между строками статистики продаж
+        instance._loaded_sale = (
+            instance.__dict__.get('status'), instance.__dict__.get('quantity'), instance.__dict__.get('unit_price'),
+        )
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.unit_price is None:
+            self.unit_price = self.product.price
+        if self._state.adding and self.seller_id is None:
+            self.seller_id = self.product.seller_id
+        loaded = getattr(self, '_loaded_sale', None)
+        if not self._state.adding and kwargs.get('update_fields') is None and loaded and loaded[0] == self.status:
+            # Статус не менялся - не пишем его и резерв: их мог успеть
+            # сменить параллельный переход (core/orders.py)
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('status', 'reserved_until')
+            ]
+        # Статистика продаж обновляется в post_save - в той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Order {self.id} - {self.product.title}"
 
 
+class OrderStatusChange(models.Model):
+    """
+    История статусов заказа: строки только добавляются (core/orders.py).
+    from_status пустой - создание заказа.
+    """
+    class Source(models.TextChoices):
+        SELLER = "seller", "Продавец"
+        PAYMENT = "payment", "Платёжная система"
+        RESERVATION = "reservation", "Истёк резерв"
+        SYSTEM = "system", "Система"
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="status_history")
+    from_status = models.CharField(max_length=20, blank=True)
+    to_status = models.CharField(max_length=20)
+    source = models.CharField(max_length=20, choices=Source.choices, default=Source.SYSTEM)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['order', 'created_at'], name='order_status_change_idx'),
+        ]
+
+
+class SalesRollup(models.Model):
+    """
+    Продажи продавца за день по товару и статусу заказа (core/sales.py).
+    """
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name="sales_rollups")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="sales_rollups")
+    day = models.DateField()
+    status = models.CharField(max_length=20)
+    orders_count = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['seller', 'day', 'product', 'status'], name='sales_rollup_key'),
+        ]
+
+
 class ProductComment(models.Model):
     """
     Комментарий к товару от пользователя.
@@ -97,6 +394,23 @@ class Meta:
         ordering = ['-created_at']
         verbose_name = 'Комментарий к товару'
         verbose_name_plural = 'Комментарии к товарам'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='comment_created_id_idx'),
+            models.Index(fields=['product', 'created_at', 'id'], name='comment_product_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Нужна для пересчёта агрегатов товара при изменении оценки
+        instance._loaded_rating = instance.__dict__.get('rating')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Агрегаты товара обновляются в post_save - в той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        self._loaded_rating = self.rating
 
     def __str__(self):
         return f"Comment by {self.user.email} on {self.product.title}"
@@ -0,0 +1,149 @@
+"""
+Статусы заказа: таблица разрешённых переходов и их применение.
+
+Переход пишется условным UPDATE ... WHERE status = <прочитанный статус>
+(и прежнее наличие резерва) без блокировки строки. Если заказ успели
+изменить, UPDATE не затронет строк: статус перечитывается и переход
+проверяется заново, поэтому поздний вебхук не перепишет решение продавца,
+а два одновременных перехода не затрут друг друга. Каждый переход
+добавляет строку в OrderStatusChange.
+
+UPDATE минует сигналы Order, поэтому резерв остатка (core/stock.py),
+статистику продаж (core/sales.py) и orders_updated_at (после коммита, как
+и сигнал touch_order_owners) обновляем здесь.
+"""
+import logging
+from collections import Counter
+
+from django.db import transaction
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from . import stock
+from .models import Order, OrderStatusChange, User
+from .sales import apply_order_changes
+
+logger = logging.getLogger(__name__)
+
+Status = Order.Status
+
+TRANSITIONS = {
+    Status.PENDING: {Status.PAID, Status.PAYMENT_REJECTED, Status.SELLER_REJECTED, Status.CANCELED},
+    Status.PAID: {Status.DELIVERED},
+    Status.DELIVERED: set(),
+    Status.PAYMENT_REJECTED: set(),
+    Status.SELLER_REJECTED: set(),
+    Status.CANCELED: set(),
+}
+
+# Статусы, в которых резерв остатка возвращается на склад
+RELEASE_STATUSES = {Status.PAYMENT_REJECTED, Status.SELLER_REJECTED, Status.CANCELED}
+
+# Поля заказа, нужные для перехода
+ORDER_FIELDS = (
+    'pk', 'status', 'buyer_id', 'seller_id', 'product_id', 'quantity', 'unit_price', 'created_at', 'reserved_until',
+)
+
+TRANSITION_ATTEMPTS = 3
+
+
+class InvalidTransition(Exception):
+    def __init__(self, current, to):
+        self.current = current
+        self.to = to
+        super().__init__(f"{current} -> {to}")
+
+
+def can_transition(current, to):
+    return to in TRANSITIONS.get(current, ())
+
+
+def _row(order):
+    return {name: getattr(order, name) for name in ORDER_FIELDS}
+
+
+def transition(order, to, source=OrderStatusChange.Source.SYSTEM):
+    """
+    Переводит заказ в статус to. Недопустимый из текущего статуса переход -
+    InvalidTransition (current - статус в базе). order обновляется на месте.
+    """
+    row = _row(order)
+    for _ in range(TRANSITION_ATTEMPTS):
+        if not can_transition(row['status'], to):
+            raise InvalidTransition(row['status'], to)
+        if apply_transitions([row], to, source):
+            break
+        # Заказ изменили после чтения - перечитываем
+        row = Order.objects.filter(pk=order.pk).values(*ORDER_FIELDS).first()
+        if row is None:
+            raise Order.DoesNotExist
+    else:
+        raise InvalidTransition(row['status'], to)
+
+    order.status = to
+    order.reserved_until = None
+    order.updated_at = timezone.now()
+    order._loaded_sale = (to, order.quantity, order.unit_price)
+    return order
+
+
+def apply_transitions(rows, to, source=OrderStatusChange.Source.SYSTEM):
+    """
+    Переводит заказы rows (словари ORDER_FIELDS в одном статусе) в to одним
+    условным UPDATE. Если переведены не все (заказы изменили параллельно),
+    ничего не меняет и возвращает False.
+    """
+    if not rows:
+        return True
+    current = {row['status'] for row in rows}
+    assert len(current) == 1, current
+    current = current.pop()
+    if not can_transition(current, to):
+        raise InvalidTransition(current, to)
+
+    with transaction.atomic():
+        reserved = [row['pk'] for row in rows if row['reserved_until'] is not None]
+        updated = Order.objects.filter(pk__in=reserved, status=current, reserved_until__isnull=False).update(
+            status=to, reserved_until=None, updated_at=Now(),
+        ) if reserved else 0
+        unreserved = [row['pk'] for row in rows if row['reserved_until'] is None]
+        if unreserved:
+            updated += Order.objects.filter(pk__in=unreserved, status=current, reserved_until__isnull=True).update(
+                status=to, updated_at=Now(),
+            )
+        if updated != len(rows):
+            transaction.set_rollback(True)
+            return False
+
+        OrderStatusChange.objects.bulk_create([
+            OrderStatusChange(order_id=row['pk'], from_status=current, to_status=to, source=source) for row in rows
+        ])
+        _settle_stock(rows, to)
+        apply_order_changes(
+            (row['seller_id'], row['product_id'], timezone.localdate(row['created_at']),
+             (current, row['quantity'], (row['unit_price'] or 0) * row['quantity']),
+             (to, row['quantity'], (row['unit_price'] or 0) * row['quantity']))
+            for row in rows
+        )
+        owners = {row['buyer_id'] for row in rows} | {row['seller_id'] for row in rows}
+        transaction.on_commit(lambda: User.objects.filter(pk__in=owners).update(orders_updated_at=Now()))
+    return True
+
+
+def _settle_stock(rows, to):
+    """
+    Отказ или отмена возвращают резерв на склад, оплата делает его
+    постоянным (резерв с заказа уже снят UPDATE).
+    """
+    if to == Status.PAID:
+        # Заказы без резерва (созданы до резервирования) списываются сейчас
+        for row in rows:
+            if row['reserved_until'] is None and not stock.reserve(row['product_id'], row['quantity']):
+                logger.warning("Order %s paid without a reservation, product %s is out of stock",
+                               row['pk'], row['product_id'])
+    elif to in RELEASE_STATUSES:
+        quantities = Counter()
+        for row in rows:
+            if row['reserved_until'] is not None:
+                quantities[row['product_id']] += row['quantity']
+        stock.return_reserved(dict(quantities))
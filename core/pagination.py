@@ -0,0 +1,125 @@
+"""
+Пагинация: по страницам (по умолчанию) или keyset по (created_at, id).
+
+Keyset-режим включается параметром ?cursor= (пустое значение - первая
+страница). Он не делает COUNT(*) и OFFSET, поэтому скорость не зависит от
+глубины прокрутки. ?with_count=1 добавляет в ответ примерное общее число.
+"""
+import base64
+import binascii
+import json
+import uuid
+from collections import OrderedDict
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def encode_cursor(created_at, pk):
+    payload = json.dumps([created_at.isoformat(), str(pk)]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Возвращает (created_at, id) или бросает ValueError.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = parse_datetime(created_at)
+        pk = uuid.UUID(pk)
+    except (TypeError, ValueError, binascii.Error):
+        raise ValueError(cursor)
+    if created_at is None:
+        raise ValueError(cursor)
+    return created_at, pk
+
+
+def approximate_count(queryset):
+    """
+    Примерное число строк: оценка планировщика PostgreSQL без выполнения
+    запроса, на остальных БД - обычный COUNT(*).
+    """
+    queryset = queryset.order_by()
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPaginationMixin:
+    """
+    Добавляет к PageNumberPagination keyset-режим по (created_at, id),
+    от новых к старым. В keyset-режиме ?ordering= не учитывается.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'with_count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.approximate_count = None
+        if request.query_params.get(self.count_query_param):
+            self.approximate_count = approximate_count(queryset)
+
+        queryset = queryset.order_by('-created_at', '-id')
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            try:
+                created_at, pk = decode_cursor(cursor)
+            except ValueError:
+                raise NotFound('Неверный курсор')
+            # Верхняя граница по created_at даёт range scan по индексу
+            queryset = queryset.filter(created_at__lte=created_at).filter(
+                Q(created_at__lt=created_at) | Q(id__lt=pk)
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        page = rows[:self.page_size]
+        self.next_cursor = encode_cursor(page[-1].created_at, page[-1].pk) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.count_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        body = OrderedDict([('next', self.get_next_link()), ('results', data)])
+        if self.approximate_count is not None:
+            body['approximate_count'] = self.approximate_count
+        return Response(body)
+
+
+class StandardPagination(KeysetPaginationMixin, PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class ProductPagination(KeysetPaginationMixin, PageNumberPagination):
+    page_size = 8
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,73 @@
+"""
+Бюджет SQL-запросов на эндпоинт.
+
+Каждый action вьюсета объявляет, сколько запросов ему положено. Если
+эндпоинт выходит за бюджет (обычно это N+1 после правки сериализатора),
+в тестах падает QueryBudgetExceeded, а в проде пишется предупреждение в лог.
+"""
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Эндпоинт выполнил больше SQL-запросов, чем ему разрешено.
+    """
+
+
+class QueryCounter:
+    """
+    execute_wrapper, который считает выполненные запросы.
+    """
+    def __init__(self):
+        self.count = 0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+
+def _check(counter, limit, label):
+    if counter.count <= limit:
+        return
+    message = f"{label}: {counter.count} SQL-запросов при бюджете {limit}"
+    if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+        raise QueryBudgetExceeded(message + "\n" + "\n".join(counter.queries))
+    logger.warning(message)
+
+
+@contextmanager
+def query_budget(limit, label="query budget"):
+    """
+    Считает запросы внутри блока и проверяет их число против limit.
+    """
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+    _check(counter, limit, label)
+
+
+class QueryBudgetMixin:
+    """
+    Примесь для вьюсетов: query_budgets = {"list": 5, "retrieve": 4, ...}.
+
+    Учитываются все запросы запроса целиком, включая аутентификацию.
+    Action без записи в query_budgets не проверяется.
+    """
+    query_budgets = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = super().dispatch(request, *args, **kwargs)
+        limit = self.query_budgets.get(getattr(self, 'action', None))
+        if limit is not None and response.status_code < 400:
+            _check(counter, limit, f"{self.__class__.__name__}.{self.action}")
+        return response
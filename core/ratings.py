@@ -0,0 +1,86 @@
+"""
+Денормализованные агрегаты отзывов на Product: число отзывов, число и сумма
+оценок, средняя оценка и гистограмма по звёздам.
+
+Обновляются одним условным UPDATE на каждое изменение ProductComment
+(сигналы в signals.py), полная перестройка - rebuild_product_ratings.
+"""
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast, Now
+
+STARS = range(1, 6)
+
+
+def apply_review_change(product_id, old_rating=None, new_rating=None, comments_delta=0):
+    """
+    Сдвигает агрегаты товара: отзыв добавлен (comments_delta=1, new_rating),
+    удалён (comments_delta=-1, old_rating) или изменена оценка.
+
+    Все правые части UPDATE читают старые значения строки, поэтому среднее
+    считается от старых значений плюс дельта.
+    """
+    from .models import Product
+
+    if old_rating == new_rating:
+        old_rating = new_rating = None
+    count_delta = (new_rating is not None) - (old_rating is not None)
+    sum_delta = (new_rating or 0) - (old_rating or 0)
+
+    # Отзывы входят в ответ о товаре, поэтому updated_at меняется всегда
+    updates = {'updated_at': Now()}
+    if comments_delta:
+        updates['comments_count'] = F('comments_count') + comments_delta
+    if old_rating is not None:
+        updates[f'rating_{old_rating}_count'] = F(f'rating_{old_rating}_count') - 1
+    if new_rating is not None:
+        updates[f'rating_{new_rating}_count'] = F(f'rating_{new_rating}_count') + 1
+    if count_delta or sum_delta:
+        updates['rating_count'] = F('rating_count') + count_delta
+        updates['rating_sum'] = F('rating_sum') + sum_delta
+        updates['rating_avg'] = Case(
+            When(
+                rating_count__gt=-count_delta,
+                then=Cast(F('rating_sum') + sum_delta, FloatField()) / (F('rating_count') + count_delta),
+            ),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    Product.objects.filter(pk=product_id).update(**updates)
+
+
+def rebuild_product_ratings(Product=None, ProductComment=None):
+    """
+    Пересчитывает агрегаты всех товаров одним GROUP BY по отзывам.
+    Модели можно передать явно (для миграций).
+    """
+    if Product is None or ProductComment is None:
+        from .models import Product, ProductComment
+
+    stats = ProductComment.objects.order_by().values('product').annotate(
+        comments=Count('id'),
+        ratings=Count('rating'),
+        total=Sum('rating'),
+        **{f'stars_{star}': Count('id', filter=Q(rating=star)) for star in STARS},
+    )
+    zero = {f'rating_{star}_count': 0 for star in STARS}
+    fields = ['comments_count', 'rating_count', 'rating_sum', 'rating_avg', *zero]
+
+    with transaction.atomic():
+        Product.objects.update(comments_count=0, rating_count=0, rating_sum=0, rating_avg=0, **zero)
+        batch = []
+        for row in stats.iterator(chunk_size=2000):
+            product = Product(
+                pk=row['product'],
+                comments_count=row['comments'],
+                rating_count=row['ratings'],
+                rating_sum=row['total'] or 0,
+                rating_avg=(row['total'] or 0) / row['ratings'] if row['ratings'] else 0,
+                **{f'rating_{star}_count': row[f'stars_{star}'] for star in STARS},
+            )
+            batch.append(product)
+            if len(batch) >= 1000:
+                Product.objects.bulk_update(batch, fields)
+                batch = []
+        if batch:
+            Product.objects.bulk_update(batch, fields)
@@ -0,0 +1,138 @@
+"""
+Дневная статистика продаж продавца: SalesRollup по (продавец, товар, день,
+статус) - число заказов, единиц и выручка.
+
+Строки сдвигаются при каждом изменении заказа (создание, смена статуса или
+количества, удаление - сигналы в signals.py), поэтому запрос статистики за
+период читает не заказы, а не больше (товаров x дней x статусов) строк.
+День - дата создания заказа в TIME_ZONE, выручка - Order.unit_price *
+quantity. Полная перестройка - rebuild_sales_rollups.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+# Статусы, которые считаются продажей, если в запросе не указаны другие
+SALE_STATUSES = ('paid', 'delivered')
+
+
+def order_day(order):
+    return timezone.localdate(order.created_at)
+
+
+def order_amount(order):
+    return (order.unit_price or Decimal('0')) * order.quantity
+
+
+def apply_order_change(seller_id, product_id, day, old=None, new=None):
+    """
+    Переносит заказ между строками статистики. old/new - (статус,
+    количество, сумма) до и после изменения, None - заказа не было (создан)
+    или больше нет (удалён).
+    """
+    apply_order_changes([(seller_id, product_id, day, old, new)])
+
+
+def apply_order_changes(changes):
+    """
+    То же для нескольких заказов сразу (массовые действия, core/bulk.py):
+    changes - (seller_id, product_id, day, old, new). Изменения одной строки
+    статистики складываются и пишутся одним UPDATE.
+    """
+    from .models import SalesRollup
+
+    deltas = {}
+    for seller_id, product_id, day, old, new in changes:
+        if old == new:
+            continue
+        for state, sign in ((old, -1), (new, 1)):
+            if state is None:
+                continue
+            status, units, amount = state
+            key = (seller_id, product_id, day, status)
+            orders_delta, units_delta, revenue_delta = deltas.get(key, (0, 0, Decimal('0')))
+            deltas[key] = (orders_delta + sign, units_delta + sign * units, revenue_delta + sign * amount)
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        SalesRollup.objects.bulk_create([
+            SalesRollup(seller_id=seller_id, product_id=product_id, day=day, status=status)
+            for seller_id, product_id, day, status in deltas
+        ], ignore_conflicts=True)
+        for (seller_id, product_id, day, status), (orders_delta, units_delta, revenue_delta) in deltas.items():
+            SalesRollup.objects.filter(seller_id=seller_id, product_id=product_id, day=day, status=status).update(
+                orders_count=F('orders_count') + orders_delta,
+                units=F('units') + units_delta,
+                revenue=F('revenue') + revenue_delta,
+            )
+
+
+def seller_stats(seller, date_from, date_to, statuses=SALE_STATUSES):
+    """
+    Итоги, разбивка по дням, по товарам и по статусам за [date_from, date_to].
+    """
+    from .models import SalesRollup
+
+    rows = SalesRollup.objects.filter(
+        seller=seller, day__range=(date_from, date_to), status__in=statuses,
+    ).order_by()
+    sums = {'orders': Sum('orders_count'), 'units': Sum('units'), 'revenue': Sum('revenue')}
+
+    def clean(row):
+        return {
+            **row,
+            'orders': row['orders'] or 0,
+            'units': row['units'] or 0,
+            'revenue': row['revenue'] or Decimal('0.00'),
+        }
+
+    totals = clean(rows.aggregate(**sums))
+    by_day = {row['day']: clean(row) for row in rows.values('day').annotate(**sums)}
+    days = []
+    day = date_from
+    while day <= date_to:
+        days.append(by_day.get(day) or clean({'day': day, 'orders': 0, 'units': 0, 'revenue': None}))
+        day += timedelta(days=1)
+    products = [
+        clean(row) for row in rows.values('product', title=F('product__title')).annotate(**sums).order_by('-revenue')
+    ]
+    by_status = {row['status']: clean(row) for row in rows.values('status').annotate(**sums)}
+    return {
+        'from': date_from, 'to': date_to, 'statuses': list(statuses),
+        'totals': totals, 'days': days, 'products': products,
+        'by_status': [by_status.get(status) or clean({'status': status, 'orders': 0, 'units': 0, 'revenue': None})
+                      for status in statuses],
+    }
+
+
+def rebuild_sales_rollups(Order=None, SalesRollup=None):
+    """
+    Пересчитывает всю статистику одним GROUP BY по заказам.
+    Модели можно передать явно (для миграций).
+    """
+    if Order is None or SalesRollup is None:
+        from .models import Order, SalesRollup
+
+    amount = ExpressionWrapper(F('unit_price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    stats = Order.objects.order_by().values(
+        'product__seller', 'product', 'status', day=TruncDate('created_at'),
+    ).annotate(orders=Count('id'), units=Sum('quantity'), revenue=Sum(amount))
+
+    with transaction.atomic():
+        SalesRollup.objects.all().delete()
+        batch = []
+        for row in stats.iterator(chunk_size=2000):
+            batch.append(SalesRollup(
+                seller_id=row['product__seller'], product_id=row['product'], day=row['day'], status=row['status'],
+                orders_count=row['orders'], units=row['units'] or 0, revenue=row['revenue'] or 0,
+            ))
+            if len(batch) >= 1000:
+                SalesRollup.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            SalesRollup.objects.bulk_create(batch)
@@ -0,0 +1,204 @@
+"""
+Полнотекстовый поиск товаров.
+
+Бэкенд выбирается по settings.PRODUCT_SEARCH_BACKEND (dotted path) или,
+если настройка пуста, по типу БД:
+- PostgreSQL: tsvector (russian + english) в core_product_search с GIN-индексом
+  и триграммный fallback по названию для опечаток;
+- SQLite: виртуальная таблица FTS5 core_product_fts;
+- прочие БД: icontains без индекса.
+
+Индекс обновляется инкрементально сигналами Product (см. signals.py),
+полная перестройка - manage.py rebuild_search_index.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize(text):
+    """
+    Приводит текст к виду, в котором он хранится в индексе.
+    """
+    return (text or "").lower().replace("ё", "е")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+class BaseSearchBackend:
+    """
+    Интерфейс бэкенда поиска.
+
+    search() фильтрует queryset товаров и аннотирует его полем relevance
+    (чем больше, тем релевантнее), чтобы работал ordering=relevance.
+    """
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def index_products(self, product_ids):
+        """
+        Добавляет или обновляет документы товаров в индексе.
+        """
+
+    def remove_products(self, product_ids):
+        """
+        Удаляет документы товаров из индекса.
+        """
+
+    def clear(self):
+        """
+        Удаляет все документы из индекса.
+        """
+
+    def rebuild(self):
+        """
+        Перестраивает индекс по всем товарам.
+        """
+        from .models import Product
+        ids = list(Product.objects.values_list('id', flat=True))
+        self.clear()
+        for start in range(0, len(ids), 500):
+            self.index_products(ids[start:start + 500])
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """
+    Поиск без индекса (icontains). Используется для БД без FTS.
+    """
+    def search(self, queryset, query):
+        condition = Q()
+        for token in tokenize(query):
+            condition &= Q(title__icontains=token) | Q(description__icontains=token)
+        return queryset.filter(condition).annotate(relevance=Value(0.0, output_field=FloatField()))
+
+
+class SqliteSearchBackend(BaseSearchBackend):
+    """
+    SQLite FTS5. rowid документа - старшие 63 бита UUID товара, так что
+    обновление и удаление идут по rowid без сканирования таблицы.
+    """
+    table = 'core_product_fts'
+
+    @staticmethod
+    def rowid(product_id):
+        return product_id.int >> 65
+
+    @staticmethod
+    def match_expression(query):
+        # Каждый токен в кавычках (без синтаксиса FTS5) и как префикс
+        return " ".join(f'"{token}"*' for token in tokenize(query))
+
+    def search(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset.annotate(relevance=Value(0.0, output_field=FloatField()))
+        matched = RawSQL(f"SELECT product_id FROM {self.table} WHERE {self.table} MATCH %s", (expression,))
+        # bm25 отрицательный: чем меньше, тем релевантнее; название весит больше описания
+        relevance = RawSQL(
+            f"SELECT -bm25({self.table}, 0, 10.0, 1.0) FROM {self.table} "
+            f"WHERE {self.table} MATCH %s AND product_id = core_product.id",
+            (expression,),
+            output_field=FloatField(),
+        )
+        return queryset.filter(id__in=matched).annotate(relevance=relevance)
+
+    def index_products(self, product_ids):
+        from .models import Product
+        rows = [
+            (self.rowid(pk), pk.hex, normalize(title), normalize(description))
+            for pk, title, description in Product.objects.filter(id__in=product_ids).values_list(
+                'id', 'title', 'description'
+            )
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (rowid, product_id, title, description) VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+
+    def remove_products(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {self.table} WHERE rowid = %s",
+                [(self.rowid(pk),) for pk in product_ids],
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    PostgreSQL: tsvector в отдельной таблице (GIN) с конфигурациями russian и
+    english; товары с опечаткой в названии находятся через pg_trgm.
+    """
+    table = 'core_product_search'
+    tsquery = "(websearch_to_tsquery('russian', %s) || websearch_to_tsquery('english', %s))"
+
+    def search(self, queryset, query):
+        query = normalize(query).strip()
+        if not query:
+            return queryset.annotate(relevance=Value(0.0, output_field=FloatField()))
+        # Обе ветки UNION используют свои GIN-индексы
+        matched = RawSQL(
+            f"SELECT product_id FROM {self.table} WHERE document @@ {self.tsquery} "
+            f"UNION SELECT id FROM core_product WHERE title %% %s",
+            (query, query, query),
+        )
+        relevance = RawSQL(
+            f"COALESCE((SELECT ts_rank(s.document, {self.tsquery}) FROM {self.table} s "
+            f"WHERE s.product_id = core_product.id), 0) + similarity(core_product.title, %s)",
+            (query, query, query),
+            output_field=FloatField(),
+        )
+        return queryset.filter(id__in=matched).annotate(relevance=relevance)
+
+    def index_products(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {self.table} (product_id, document)
+                SELECT id,
+                    setweight(to_tsvector('russian', translate(coalesce(title, ''), 'ёЁ', 'еЕ')), 'A') ||
+                    setweight(to_tsvector('english', translate(coalesce(title, ''), 'ёЁ', 'еЕ')), 'A') ||
+                    setweight(to_tsvector('russian', translate(coalesce(description, ''), 'ёЁ', 'еЕ')), 'B') ||
+                    setweight(to_tsvector('english', translate(coalesce(description, ''), 'ёЁ', 'еЕ')), 'B')
+                FROM core_product WHERE id = ANY(%s)
+                ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document
+                """,
+                [list(product_ids)],
+            )
+
+    def remove_products(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE product_id = ANY(%s)", [list(product_ids)])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {self.table}")
+
+
+VENDOR_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SqliteSearchBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+        backend_class = import_string(path) if path else VENDOR_BACKENDS.get(connection.vendor, SimpleSearchBackend)
+        _backend = backend_class()
+    return _backend
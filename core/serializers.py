@@ -1,10 +1,30 @@
 """
 Преобразуют модели ⇄ JSON.
 """
+from datetime import timedelta
+
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from .models import Product, Order, ProductImage, ProductComment
+from .models import (
+    Product,
+    Order,
+    ProductImage,
+    ProductComment,
+    ProductImport,
+    Upload,
+    REVIEW_PREVIEW_SIZE,
+    latest_comments_prefetch,
+)
+from .gallery import update_images
+from .sales import SALE_STATUSES
+from .stock import OutOfStock, reservation_deadline, reserve_for_order
+from .images import srcset
 import logging
 
 # Настраиваем логирование
@@ -13,14 +33,29 @@
 User = get_user_model()
 
 
+def media_srcset(variants, request, key='webp'):
+    """
+    srcset вариантов изображения (core/images.py) с абсолютными URL.
+    """
+    def url(path):
+        path = default_storage.url(path)
+        return request.build_absolute_uri(path) if request else path
+    return srcset(variants, url, key)
+
+
 class UserSerializer(serializers.ModelSerializer):
     """
     Используется для чтения профиля, не для регистрации.
     """
     avatar = serializers.ImageField(read_only=True)
+    avatar_srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = User
-        fields = ("id", "email", "role", "avatar")
+        fields = ("id", "email", "role", "avatar", "avatar_srcset", "avatar_placeholder")
+
+    def get_avatar_srcset(self, obj):
+        return media_srcset(obj.avatar_variants, self.context.get('request'))
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -44,9 +79,22 @@ def create(self, validated_data):
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    """
+    Изображение товара: оригинал, srcset вариантов (WebP и в формате
+    оригинала), размеры и заглушка. Пока варианты не построены, srcset пустой.
+    """
+    srcset = serializers.SerializerMethodField()
+    srcset_fallback = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'position', 'srcset', 'srcset_fallback', 'width', 'height', 'placeholder')
+
+    def get_srcset(self, obj):
+        return media_srcset(obj.variants, self.context.get('request'))
+
+    def get_srcset_fallback(self, obj):
+        return media_srcset(obj.variants, self.context.get('request'), key='original')
     
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -56,13 +104,8 @@ def to_representation(self, instance):
             if request:
                 full_url = request.build_absolute_uri(instance.image.url)
                 representation['image'] = full_url
-                print(f"🖼️ ProductImageSerializer: Built full URL: {full_url}")
-                print(f"🖼️ ProductImageSerializer: Original URL: {instance.image.url}")
             else:
                 representation['image'] = instance.image.url
-                print(f"⚠️ ProductImageSerializer: No request context, using original URL: {instance.image.url}")
-        else:
-            print(f"⚠️ ProductImageSerializer: No image field for instance {instance.id}")
         return representation
 
 
@@ -71,16 +114,39 @@ class ProductCommentSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = ProductComment
-        fields = ('id', 'user', 'text', 'rating', 'created_at', 'updated_at')
+        fields = ('id', 'product', 'user', 'text', 'rating', 'created_at', 'updated_at')
         read_only_fields = ('id', 'user', 'created_at', 'updated_at')
 
+    def update(self, instance, validated_data):
+        # Отзыв нельзя перенести на другой товар
+        validated_data.pop('product', None)
+        return super().update(instance, validated_data)
 
-class ProductSerializer(serializers.ModelSerializer):
-    print("🎨 PRODUCT SERIALIZER LOADED WITH NEW CODE! 🎨")
-    
+
+class ReviewSummaryMixin:
+    """
+    Последние REVIEW_PREVIEW_SIZE отзывов вместо всех комментариев (число
+    отзывов - колонка Product.comments_count). Полный список -
+    /api/products/{id}/reviews/.
+
+    Отзывы берутся из prefetch ProductQuerySet.for_serializer(); для
+    объектов без него делается отдельный запрос.
+    """
+    def get_rating_histogram(self, obj):
+        return obj.rating_histogram
+
+    def get_latest_comments(self, obj):
+        comments = getattr(obj, 'latest_comments', None)
+        if comments is None:
+            comments = obj.comments.select_related('user')[:REVIEW_PREVIEW_SIZE]
+        return ProductCommentSerializer(comments, many=True, context=self.context).data
+
+
+class ProductSerializer(ReviewSummaryMixin, serializers.ModelSerializer):
     seller = UserSerializer(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
-    comments = ProductCommentSerializer(many=True, read_only=True)
+    latest_comments = serializers.SerializerMethodField()
+    rating_histogram = serializers.SerializerMethodField()
     uploaded_images = serializers.ListField(
         child=serializers.ImageField(max_length=1000000, allow_empty_file=False, use_url=False),
         write_only=True,
@@ -89,8 +155,8 @@ class ProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product
-        fields = ('id', 'seller', 'title', 'description', 'price', 'quantity', 'download_link', 'usage_instructions', 'seller_info', 'image_url', 'created_at', 'images', 'comments', 'uploaded_images')
-        read_only_fields = ("id", "seller", "created_at", "images", "comments")
+        fields = ('id', 'seller', 'title', 'description', 'price', 'quantity', 'download_link', 'file_name', 'file_size', 'usage_instructions', 'seller_info', 'image_url', 'created_at', 'images', 'comments_count', 'rating_avg', 'rating_count', 'rating_histogram', 'latest_comments', 'uploaded_images')
+        read_only_fields = ("id", "seller", "created_at", "images", "comments_count", "rating_avg", "rating_count")
 
     def create(self, validated_data):
         logger.info("=" * 50)
@@ -99,57 +165,132 @@ def create(self, validated_data):
         logger.info(f"Validated data: {validated_data}")
         logger.info(f"Validated data keys: {list(validated_data.keys())}")
         
-        # Также выводим в консоль
-        print("=" * 50)
-        print("PRODUCT SERIALIZER CREATE METHOD")
-        print("=" * 50)
-        print(f"Validated data: {validated_data}")
-        print(f"Validated data keys: {list(validated_data.keys())}")
-        
         uploaded_images = validated_data.pop("uploaded_images", [])
         logger.info(f"Uploaded images count: {len(uploaded_images)}")
         logger.info(f"Uploaded images: {uploaded_images}")
-        print(f"Uploaded images count: {len(uploaded_images)}")
-        print(f"Uploaded images: {uploaded_images}")
         
         logger.info("Creating product...")
-        print("Creating product...")
-        product = super().create(validated_data)
-        logger.info(f"Product created with ID: {product.id}")
-        print(f"Product created with ID: {product.id}")
-        
-        if uploaded_images:
-            logger.info("Creating ProductImage objects...")
-            print("Creating ProductImage objects...")
-            for i, image in enumerate(uploaded_images):
-                logger.info(f"Processing image {i+1}: {image}")
-                logger.info(f"Image type: {type(image)}")
-                logger.info(f"Image name: {getattr(image, 'name', 'N/A')}")
-                logger.info(f"Image size: {getattr(image, 'size', 'N/A')}")
-                
-                print(f"Processing image {i+1}: {image}")
-                print(f"Image type: {type(image)}")
-                print(f"Image name: {getattr(image, 'name', 'N/A')}")
-                print(f"Image size: {getattr(image, 'size', 'N/A')}")
-                
-                try:
-                    ProductImage.objects.create(product=product, image=image)
-                    logger.info(f"ProductImage {i+1} created successfully")
-                    print(f"ProductImage {i+1} created successfully")
-                except Exception as e:
-                    logger.error(f"ERROR creating ProductImage {i+1}: {e}")
-                    print(f"ERROR creating ProductImage {i+1}: {e}")
-                    import traceback
-                    logger.error(f"Traceback: {traceback.format_exc()}")
-                    print(f"Traceback: {traceback.format_exc()}")
-        else:
-            logger.info("No images to process")
-            print("No images to process")
+        # Товар и его изображения - одной транзакцией
+        with transaction.atomic():
+            product = super().create(validated_data)
+            logger.info(f"Product created with ID: {product.id}")
+
+            if uploaded_images:
+                logger.info(f"Creating {len(uploaded_images)} ProductImage objects...")
+                update_images(product, uploaded=uploaded_images)
+            else:
+                logger.info("No images to process")
         
         logger.info("=" * 50)
-        print("=" * 50)
         return product
 
+    def update(self, instance, validated_data):
+        """
+        Пишет только присланные поля: остаток (core/stock.py) и агрегаты
+        отзывов меняются условными UPDATE, полная запись строки вернула бы
+        значения, прочитанные до них.
+        """
+        validated_data.pop("uploaded_images", None)
+        for name, value in validated_data.items():
+            setattr(instance, name, value)
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
+
+
+class ProductImagesUpdateSerializer(serializers.Serializer):
+    """
+    Изменение галереи товара (core/gallery.py): uploaded_images - новые
+    файлы, delete - id удаляемых изображений, order - id в нужном порядке.
+    """
+    uploaded_images = serializers.ListField(
+        child=serializers.ImageField(allow_empty_file=False, use_url=False), required=False,
+    )
+    delete = serializers.ListField(child=serializers.IntegerField(), required=False)
+    order = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+
+class SparseFieldsetMixin:
+    """
+    Принимает fields=[...] и оставляет в выдаче только эти поля.
+    """
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class ProductListSerializer(SparseFieldsetMixin, ReviewSummaryMixin, serializers.ModelSerializer):
+    """
+    Компактный товар для сетки каталога: по умолчанию только default_fields,
+    тяжёлые поля (описания, вложенные объекты) добавляются через ?expand=.
+    """
+    seller_name = serializers.CharField(source='seller.username', read_only=True)
+    image = serializers.SerializerMethodField()
+    seller = UserSerializer(read_only=True)
+    images = ProductImageSerializer(many=True, read_only=True)
+    latest_comments = serializers.SerializerMethodField()
+    rating_histogram = serializers.SerializerMethodField()
+
+    default_fields = (
+        'id', 'title', 'price', 'quantity', 'image', 'image_url', 'seller_name', 'created_at',
+        'rating_avg', 'rating_count',
+    )
+    expandable_fields = (
+        'description', 'usage_instructions', 'seller_info', 'download_link', 'seller', 'images',
+        'comments_count', 'rating_histogram', 'latest_comments',
+    )
+
+    class Meta:
+        model = Product
+        fields = (
+            'id', 'title', 'price', 'quantity', 'image', 'image_url', 'seller_name', 'created_at',
+            'rating_avg', 'rating_count',
+            'description', 'usage_instructions', 'seller_info', 'download_link', 'seller', 'images',
+            'comments_count', 'rating_histogram', 'latest_comments',
+        )
+        read_only_fields = fields
+
+    def get_image(self, obj):
+        """
+        URL первого изображения товара (из prefetch, без отдельного запроса):
+        вариант card, если он уже построен, иначе оригинал.
+        """
+        first = next(iter(obj.images.all()), None)
+        if first is None or not first.image:
+            return None
+        card = first.variants.get('card')
+        url = default_storage.url(card['webp']) if card else first.image.url
+        request = self.context.get('request')
+        if request:
+            return request.build_absolute_uri(url)
+        return url
+
+    @classmethod
+    def setup_queryset(cls, queryset, fields):
+        """
+        Читает из БД только колонки и связи, нужные для набора полей fields.
+        """
+        model_fields = {f.name for f in Product._meta.concrete_fields}
+        # created_at нужен для сортировки по умолчанию
+        columns = {'id', 'created_at'} | (set(fields) & model_fields)
+        if 'seller' in fields:
+            queryset = queryset.select_related('seller')
+        elif 'seller_name' in fields:
+            columns |= {'seller', 'seller__username'}
+            queryset = queryset.select_related('seller')
+        if 'images' in fields:
+            queryset = queryset.prefetch_related('images')
+        elif 'image' in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('images', queryset=ProductImage.objects.only('id', 'product_id', 'image', 'variants'))
+            )
+        if 'rating_histogram' in fields:
+            columns |= {f'rating_{star}_count' for star in range(1, 6)}
+        if 'latest_comments' in fields:
+            queryset = queryset.prefetch_related(latest_comments_prefetch())
+        return queryset.only(*columns)
+
 
 class ProductDetailSerializer(serializers.ModelSerializer):
     class Meta:
@@ -157,13 +298,127 @@ class Meta:
         fields = ('title', 'price', 'seller_info', 'image_url')
 
 
+class ProductImportSerializer(serializers.ModelSerializer):
+    """
+    Отчёт пакетного импорта: ошибки по строкам и состояние загрузки изображений.
+    """
+    images_pending = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProductImport
+        fields = (
+            'id', 'status', 'total_rows', 'created_count', 'errors',
+            'images_pending', 'image_errors', 'created_at', 'finished_at',
+        )
+        read_only_fields = fields
+
+    def get_images_pending(self, obj):
+        return len(obj.pending_images)
+
+
+class UploadSerializer(serializers.ModelSerializer):
+    """
+    Возобновляемая загрузка файла товара (core/uploads.py).
+    """
+    class Meta:
+        model = Upload
+        fields = ('id', 'product', 'filename', 'size', 'offset', 'status', 'error', 'created_at')
+        read_only_fields = ('id', 'offset', 'status', 'error', 'created_at')
+
+    def validate_product(self, product):
+        if product.seller_id != self.context['request'].user.pk:
+            raise serializers.ValidationError("Можно загружать файлы только к своим товарам")
+        return product
+
+    def validate_size(self, size):
+        if size <= 0:
+            raise serializers.ValidationError("Размер должен быть больше нуля")
+        return size
+
+
+class ProductBulkUpdateListSerializer(serializers.ListSerializer):
+    def validate(self, attrs):
+        ids = [item['id'] for item in attrs]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Товары в списке повторяются")
+        return attrs
+
+
+class ProductBulkUpdateSerializer(serializers.Serializer):
+    """
+    Элемент массового изменения товаров: id и изменяемые поля.
+    """
+    id = serializers.UUIDField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    quantity = serializers.IntegerField(min_value=0, required=False)
+
+    class Meta:
+        list_serializer_class = ProductBulkUpdateListSerializer
+
+    def validate(self, attrs):
+        if len(attrs) == 1:
+            raise serializers.ValidationError("Нет изменяемых полей")
+        return attrs
+
+
+class OrderBulkActionSerializer(serializers.Serializer):
+    """
+    Массовое подтверждение или отклонение заказов: {"ids": [...]}.
+    """
+    ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+
+    def validate_ids(self, value):
+        limit = settings.ORDER_BULK_MAX_ITEMS
+        if len(value) > limit:
+            raise serializers.ValidationError(f"Не больше {limit} заказов за раз")
+        return list(dict.fromkeys(value))
+
+
+class OrderProductSerializer(serializers.Serializer):
+    """
+    Товар в компактном заказе: без описаний, изображений и отзывов. Получает
+    сам заказ (source='*'), миниатюра - из аннотаций OrderQuerySet.compact().
+    """
+    id = serializers.UUIDField(source='product.id')
+    title = serializers.CharField(source='product.title')
+    price = serializers.DecimalField(source='product.price', max_digits=10, decimal_places=2)
+    seller_name = serializers.CharField(source='product.seller.username')
+    image = serializers.SerializerMethodField()
+
+    def get_image(self, obj):
+        if hasattr(obj, 'product_image'):
+            name, variants = obj.product_image, obj.product_image_variants
+        else:
+            # Заказ загружен без compact() (создание, подтверждение)
+            name, variants = ProductImage.objects.filter(product_id=obj.product_id).values_list(
+                'image', 'variants',
+            ).first() or (None, None)
+        if not name:
+            return None
+        thumb = (variants or {}).get('thumb')
+        url = default_storage.url(thumb['webp'] if thumb else name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
 class OrderSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+    """
+    Заказ с кратким товаром (OrderProductSerializer). С expand=product в
+    контексте (?expand=product) - полный ProductSerializer.
+    """
+    product = OrderProductSerializer(source='*', read_only=True)
     total_amount = serializers.SerializerMethodField()
     payment_info = serializers.SerializerMethodField()
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if 'product' in self.context.get('expand', ()):
+            self.fields['product'] = ProductSerializer(read_only=True)
+
     def get_total_amount(self, obj):
-        return float(obj.product.price) * obj.quantity
+        # Цена на момент заказа; у старых заказов её нет - текущая цена товара
+        price = obj.unit_price if obj.unit_price is not None else obj.product.price
+        return float(price) * obj.quantity
 
     def get_payment_info(self, obj):
         """
@@ -200,10 +455,6 @@ def to_representation(self, instance):
                 'username': instance.buyer.username
             }
         
-        # Убеждаемся, что product правильно сериализуется
-        if instance.product:
-            representation['product'] = ProductSerializer(instance.product, context=self.context).data
-        
         # Добавляем информацию о платеже
         payment_info = self.get_payment_info(instance)
         if payment_info:
@@ -227,10 +478,8 @@ def validate_product(self, value):
         """
         if not value:
             raise serializers.ValidationError("Товар обязателен")
-        
-        if value.quantity <= 0:
-            raise serializers.ValidationError("Товар недоступен для покупки")
-        
+        # Остаток проверяется при резервировании в create: его могут вернуть
+        # просроченные заказы (core/stock.py)
         return value
 
     def validate(self, data):
@@ -256,16 +505,25 @@ def create(self, validated_data):
         """
         # Получаем пользователя из контекста
         buyer = self.context['request'].user
+        product = validated_data['product']
         
-        # Создаем заказ
-        order = Order.objects.create(
-            buyer=buyer,
-            product=validated_data['product'],
-            quantity=validated_data['quantity'],
-            comment=validated_data.get('comment', ''),
-            receipt_email=validated_data.get('receipt_email', ''),
-            status=Order.Status.PENDING
-        )
+        # Заказ и резерв остатка - одной транзакцией (core/stock.py). UPDATE
+        # остатка - последний запрос перед коммитом: блокировка строки товара,
+        # которую ждут другие покупки, держится как можно меньше
+        with transaction.atomic():
+            order = Order.objects.create(
+                buyer=buyer,
+                product=product,
+                quantity=validated_data['quantity'],
+                comment=validated_data.get('comment', ''),
+                receipt_email=validated_data.get('receipt_email', ''),
+                status=Order.Status.PENDING,
+                reserved_until=reservation_deadline(),
+            )
+            try:
+                reserve_for_order(product.pk, validated_data['quantity'])
+            except OutOfStock:
+                raise serializers.ValidationError({"quantity": ["Недостаточно товара в наличии"]})
         
         return order
 
@@ -289,3 +547,37 @@ class LoginResponseSerializer(serializers.Serializer):
 
 
 
+
+
+class SellerStatsQuerySerializer(serializers.Serializer):
+    """
+    Параметры /api/sellers/me/stats/: период и статусы заказов.
+    """
+    MAX_DAYS = 366
+
+    status = serializers.CharField(required=False)
+
+    def to_internal_value(self, data):
+        # from - ключевое слово, поэтому поля периода разбираются вручную
+        values = super().to_internal_value(data)
+        field = serializers.DateField()
+        errors = {}
+        dates = {}
+        for name in ('from', 'to'):
+            if data.get(name):
+                try:
+                    dates[name] = field.to_internal_value(data[name])
+                except serializers.ValidationError as exc:
+                    errors[name] = exc.detail
+        if errors:
+            raise serializers.ValidationError(errors)
+        date_to = dates.get('to') or timezone.localdate()
+        date_from = dates.get('from') or date_to - timedelta(days=29)
+        if date_from > date_to:
+            raise serializers.ValidationError({'from': ["Начало периода позже конца"]})
+        if (date_to - date_from).days >= self.MAX_DAYS:
+            raise serializers.ValidationError({'from': [f"Период не длиннее {self.MAX_DAYS} дней"]})
+        values['range'] = (date_from, date_to)
+        statuses = [item for item in values.get('status', '').split(',') if item]
+        values['status'] = statuses or list(SALE_STATUSES)
+        return values
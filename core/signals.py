@@ -0,0 +1,204 @@
+"""
+Сигналы моделей core.
+"""
+from django.db import transaction
+from django.db.models.functions import Now
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import invalidate_catalog
+from .models import Order, OrderStatusChange, Product, ProductComment, ProductImage, User
+from .orders import RELEASE_STATUSES
+from .ratings import apply_review_change
+from .sales import apply_order_change, order_amount, order_day
+from .search import get_search_backend
+from . import stock, suggest
+from .images import process_avatar, process_product_image, variant_files
+from .storage import acquire, release
+from .tasks import enqueue
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """
+    Обновляет документ товара в поисковом индексе.
+    """
+    get_search_backend().index_products([instance.pk])
+
+
+@receiver(pre_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """
+    Удаляет товар из поискового индекса до удаления самой строки.
+    """
+    get_search_backend().remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def update_suggest_index(sender, instance, **kwargs):
+    """
+    Индекс подсказок этого процесса; другие воркеры дочитают по updated_at.
+    """
+    suggest.product_changed(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_suggest_index(sender, instance, **kwargs):
+    suggest.product_removed(instance.pk)
+
+
+@receiver(post_save, sender=ProductComment)
+def update_ratings_on_save(sender, instance, created, **kwargs):
+    """
+    Обновляет агрегаты отзывов товара (ProductComment.save - в транзакции).
+    """
+    if created:
+        apply_review_change(instance.product_id, new_rating=instance.rating, comments_delta=1)
+    else:
+        apply_review_change(
+            instance.product_id,
+            old_rating=getattr(instance, '_loaded_rating', None),
+            new_rating=instance.rating,
+        )
+
+
+@receiver(post_delete, sender=ProductComment)
+def update_ratings_on_delete(sender, instance, **kwargs):
+    apply_review_change(instance.product_id, old_rating=instance.rating, comments_delta=-1)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    invalidate_catalog([instance.pk])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductComment)
+@receiver(post_delete, sender=ProductComment)
+def invalidate_related_cache(sender, instance, **kwargs):
+    """
+    Изображения и отзывы входят в ответы каталога о товаре.
+    """
+    invalidate_catalog([instance.product_id])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def touch_product_on_image_change(sender, instance, **kwargs):
+    """
+    Изображения входят в ответ о товаре: сдвигаем его updated_at (ETag).
+    """
+    Product.objects.filter(pk=instance.product_id).update(updated_at=Now())
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def touch_order_owners(sender, instance, **kwargs):
+    """
+    Сдвигает orders_updated_at покупателя и продавца (ETag списков заказов)
+    после коммита: строка продавца общая для всех его заказов, и UPDATE в
+    транзакции заказа выстраивал бы оформления в очередь.
+    """
+    owners = [instance.buyer_id, instance.seller_id]
+    transaction.on_commit(lambda: User.objects.filter(pk__in=owners).update(orders_updated_at=Now()))
+
+
+@receiver(post_save, sender=ProductImage)
+def process_product_image_variants(sender, instance, **kwargs):
+    """
+    Варианты размеров строятся в фоне для нового или заменённого файла.
+    """
+    if instance.image and instance.variants.get('source') != instance.image.name:
+        enqueue(process_product_image, instance.pk)
+
+
+@receiver(post_save, sender=ProductImage)
+def acquire_product_image_file(sender, instance, created, **kwargs):
+    """
+    Счётчик ссылок на файл изображения (core/storage.py): новый файл
+    занимаем, заменённый вместе с его вариантами освобождаем. Файл, записанный
+    через хранилище, занял сам ContentAddressedStorage._save (ContentImageField).
+    """
+    name = instance.image.name or ''
+    loaded = '' if created else getattr(instance, '_loaded_image', name)
+    saved = instance.__dict__.pop('_saved_image', None) == name
+    if name == loaded:
+        if saved:
+            # Загружен тот же файл: ссылка от _save лишняя
+            release([name])
+        return
+    with transaction.atomic():
+        if not saved:
+            acquire([name])
+        if loaded:
+            stale = variant_files(instance.variants) if instance.variants.get('source') == loaded else []
+            release([loaded, *stale])
+    instance._loaded_image = name
+
+
+@receiver(post_delete, sender=ProductImage)
+def release_product_image_files(sender, instance, **kwargs):
+    release([instance.image.name, *variant_files(instance.variants)])
+
+
+@receiver(post_save, sender=User)
+def process_avatar_variants(sender, instance, **kwargs):
+    if instance.avatar and instance.avatar_variants.get('source') != instance.avatar.name:
+        enqueue(process_avatar, instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def settle_stock_reservation(sender, instance, created, **kwargs):
+    """
+    Резерв остатка (core/stock.py): отмена или отказ возвращают его, оплата
+    делает постоянным. Подключён до update_sales_on_save, которому нужен
+    прежний статус из _loaded_sale.
+    """
+    if created:
+        return
+    if instance.status in RELEASE_STATUSES:
+        stock.release(instance)
+    elif instance.status in (Order.Status.PAID, Order.Status.DELIVERED):
+        previous = getattr(instance, '_loaded_sale', (None,))[0]
+        if previous == Order.Status.PENDING:
+            stock.consume(instance)
+
+
+@receiver(post_save, sender=Order)
+def record_order_status_change(sender, instance, created, **kwargs):
+    """
+    История статусов для записи заказа через save() (создание, админка).
+    Переходы core/orders.py пишут историю сами. Подключён до
+    update_sales_on_save, которому нужен прежний статус из _loaded_sale.
+    """
+    previous = '' if created else getattr(instance, '_loaded_sale', (instance.status,))[0]
+    if previous != instance.status:
+        OrderStatusChange.objects.create(order=instance, from_status=previous, to_status=instance.status)
+
+
+@receiver(post_save, sender=Order)
+def update_sales_on_save(sender, instance, created, **kwargs):
+    """
+    Статистика продаж (core/sales.py): новый заказ или смена статуса либо
+    количества. Order.save - в транзакции.
+    """
+    new = (instance.status, instance.quantity, order_amount(instance))
+    if created:
+        old = None
+    elif hasattr(instance, '_loaded_sale'):
+        status, quantity, unit_price = instance._loaded_sale
+        old = (status, quantity, (unit_price or 0) * quantity)
+    else:
+        return
+    apply_order_change(instance.seller_id, instance.product_id, order_day(instance), old, new)
+    instance._loaded_sale = (instance.status, instance.quantity, instance.unit_price)
+
+
+@receiver(post_delete, sender=Order)
+def update_sales_on_delete(sender, instance, **kwargs):
+    apply_order_change(
+        instance.seller_id, instance.product_id, order_day(instance),
+        old=(instance.status, instance.quantity, order_amount(instance)),
+    )
@@ -0,0 +1,131 @@
+"""
+Резервирование остатка товара при оформлении заказа.
+
+Заказ списывает quantity сразу при создании одним условным UPDATE
+(quantity = quantity - n WHERE quantity >= n), остаток не уходит в минус.
+Покупки одного товара всё же ждут друг друга: UPDATE держит блокировку
+строки товара до коммита (как и строку SalesRollup товара за день),
+поэтому в OrderCreateSerializer.create он - последний запрос перед
+коммитом, а orders_updated_at продавца сдвигается уже после коммита.
+Покупки разных товаров общих строк не блокируют. Резерв держится до
+Order.reserved_until:
+- оплата (paid) делает резерв постоянным;
+- отмена, отказ продавца или истечение срока возвращают остаток.
+Возврат идёт условным UPDATE заказа (reserved_until IS NOT NULL ->
+NULL), поэтому остаток возвращается ровно один раз, кто бы ни отменил
+заказ первым; переходы статуса (core/orders.py) снимают резерв тем же
+условным UPDATE, что меняет статус. Просроченные PENDING-заказы отменяет
+release_expired_reservations (manage.py release_expired_reservations по
+cron, а также при нехватке остатка у товара).
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .cache import invalidate_stock
+
+logger = logging.getLogger(__name__)
+
+SWEEP_BATCH_SIZE = 500
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def reserve(product_id, quantity):
+    """
+    Списывает quantity единиц, если столько есть. True - списано.
+    """
+    from .models import Product
+
+    updated = Product.objects.filter(pk=product_id, quantity__gte=quantity).update(
+        quantity=F('quantity') - quantity, updated_at=Now(),
+    )
+    if updated:
+        invalidate_stock([product_id])
+    return bool(updated)
+
+
+def reservation_deadline():
+    return timezone.now() + timedelta(seconds=settings.ORDER_RESERVATION_TTL)
+
+
+def reserve_for_order(product_id, quantity):
+    """
+    Резерв для нового заказа. Если остатка не хватает, сначала отменяются
+    просроченные заказы этого товара, затем одна повторная попытка.
+    """
+    if reserve(product_id, quantity):
+        return
+    if release_expired_reservations(product_id=product_id) and reserve(product_id, quantity):
+        return
+    raise OutOfStock
+
+
+def release(order):
+    """
+    Возвращает резерв заказа на склад (отмена, отказ, истечение срока).
+    """
+    from .models import Order, Product
+
+    with transaction.atomic():
+        if Order.objects.filter(pk=order.pk, reserved_until__isnull=False).update(reserved_until=None):
+            Product.objects.filter(pk=order.product_id).update(
+                quantity=F('quantity') + order.quantity, updated_at=Now(),
+            )
+            transaction.on_commit(lambda: invalidate_stock([order.product_id]))
+    order.reserved_until = None
+
+
+def consume(order):
+    """
+    Оплаченный заказ забирает резерв насовсем. Если резерв уже вернули
+    (оплата пришла после истечения срока), остаток списывается заново.
+    """
+    from .models import Order
+
+    if Order.objects.filter(pk=order.pk, reserved_until__isnull=False).update(reserved_until=None):
+        order.reserved_until = None
+        return
+    if not reserve(order.product_id, order.quantity):
+        logger.warning("Order %s paid without a reservation, product %s is out of stock", order.pk, order.product_id)
+
+
+def return_reserved(quantities):
+    """
+    Возвращает на склад {product_id: количество} - резервы, которые уже
+    сняты с заказов одним UPDATE (массовые действия, core/bulk.py).
+    """
+    from .models import Product
+
+    for product_id, quantity in quantities.items():
+        Product.objects.filter(pk=product_id).update(quantity=F('quantity') + quantity, updated_at=Now())
+    if quantities:
+        transaction.on_commit(lambda: invalidate_stock(list(quantities)))
+
+
+def release_expired_reservations(product_id=None, now=None, limit=SWEEP_BATCH_SIZE):
+    """
+    Отменяет PENDING-заказы с истёкшим резервом (до limit за вызов).
+    Возвращает число отменённых.
+    """
+    from .models import Order, OrderStatusChange
+    from .orders import ORDER_FIELDS, apply_transitions
+
+    now = now or timezone.now()
+    expired = Order.objects.filter(status=Order.Status.PENDING, reserved_until__lt=now)
+    if product_id is not None:
+        expired = expired.filter(product_id=product_id)
+    released = 0
+    for row in list(expired.values(*ORDER_FIELDS)[:limit]):
+        # Заказ, который оплатили, пока шла выборка, переход пропустит;
+        # остаток возвращает сам переход
+        if apply_transitions([row], Order.Status.CANCELED, OrderStatusChange.Source.RESERVATION):
+            released += 1
+    return released
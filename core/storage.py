@@ -0,0 +1,192 @@
+"""
+Хранилища файлов.
+
+private_storage - файлы цифровых товаров. Лежат в PRIVATE_MEDIA_ROOT вне
+MEDIA_ROOT и не имеют публичного URL, отдаются только через
+/api/products/{id}/download/.
+
+content_storage - изображения товаров и их варианты. Имя файла - sha256
+содержимого с разбиением по каталогам (products/ab/cd/abcd....jpg), поэтому:
+- одинаковые файлы хранятся один раз, сколько бы товаров на них ни ссылалось;
+- содержимое по URL никогда не меняется, nginx отдаёт их с
+  Cache-Control: immutable (nginx.conf).
+Число ссылок на файл хранится в MediaBlob (acquire/release), файл удаляется,
+когда ссылок не осталось. Ссылку на сохранённый файл занимает сам _save, в
+транзакции вызывающего, до проверки файла на диске: иначе delete_unreferenced
+мог удалить уже существующий файл между этой проверкой и acquire.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+from collections import Counter
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.fields.files import ImageFieldFile
+
+
+class PrivateFileSystemStorage(FileSystemStorage):
+    # Каталог читается из настроек при каждом обращении (override_settings в тестах)
+    @property
+    def base_location(self):
+        return settings.PRIVATE_MEDIA_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    @property
+    def base_url(self):
+        return None
+
+
+def private_storage():
+    return PrivateFileSystemStorage()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Сохраняет файл под именем {каталог}/{hash[:2]}/{hash[2:4]}/{hash}{.ext},
+    где каталог - первый компонент пути, предложенного полем (upload_to).
+    Если такой файл уже есть, второй раз он не пишется.
+
+    Каждое сохранение занимает ссылку на файл (acquire): она принадлежит
+    записи, которая сохранит имя. Если имя не понадобилось, ссылку
+    освобождает вызывающий (release).
+    """
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым: совпадение имён - тот же файл
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+
+        top = name.split('/', 1)[0] if '/' in name else ''
+        ext = posixpath.splitext(name)[1].lower()[:10]
+        name = posixpath.join(top, digest[:2], digest[2:4], digest + ext)
+        full_path = self.path(name)
+        # Сначала ссылка, потом проверка: пока ссылка есть,
+        # delete_unreferenced файл не тронет
+        acquire([name])
+        if os.path.exists(full_path):
+            return name
+
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # Пишем во временный файл и переименовываем: параллельная загрузка
+        # того же содержимого просто заменит файл идентичным
+        fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as target:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    target.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp, self.file_permissions_mode)
+            os.replace(temp, full_path)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        return name
+
+
+def content_storage():
+    return ContentAddressedStorage()
+
+
+class ContentImageFieldFile(ImageFieldFile):
+    def save(self, name, content, save=True):
+        super().save(name, content, save=False)
+        # Ссылку на записанный файл занял _save: сигналу её занимать не нужно
+        self.instance._saved_image = self.name
+        if save:
+            self.instance.save()
+
+
+class ContentImageField(models.ImageField):
+    """
+    ImageField для content_storage: запоминает на объекте имя файла,
+    записанного через хранилище (и уже занятого им).
+    """
+    attr_class = ContentImageFieldFile
+
+
+def _add_refs(counts, sign):
+    # Один UPDATE на группу файлов с одинаковым числом ссылок
+    from .models import MediaBlob
+
+    groups = {}
+    for name, count in counts.items():
+        groups.setdefault(count, []).append(name)
+    for count, names in groups.items():
+        MediaBlob.objects.filter(name__in=names).update(ref_count=F('ref_count') + sign * count)
+
+
+def acquire(names):
+    """
+    Увеличивает счётчики ссылок на файлы (имя может повторяться).
+    """
+    from .models import MediaBlob
+
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return
+    with transaction.atomic():
+        MediaBlob.objects.bulk_create(
+            [MediaBlob(name=name, ref_count=0) for name in counts], ignore_conflicts=True,
+        )
+        _add_refs(counts, 1)
+
+
+def release(names):
+    """
+    Уменьшает счётчики ссылок; файлы без ссылок удаляются после коммита.
+    """
+    from .models import MediaBlob
+    from .tasks import enqueue
+
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return
+    with transaction.atomic():
+        _add_refs(counts, -1)
+        MediaBlob.objects.filter(name__in=counts, ref_count__lte=0).delete()
+    enqueue(delete_unreferenced, list(counts))
+
+
+def delete_unreferenced(names):
+    """
+    Удаляет файлы из names, на которые нет ссылок. Проверка повторяется
+    здесь, потому что между release и этой задачей файл мог быть загружен снова.
+
+    Имена блокируются строками MediaBlob с нулём ссылок (вставляются, если
+    строк нет) до конца транзакции: acquire в _save ждёт её и после удаления
+    запишет файл заново, а файл, ссылку на который уже заняли, не удаляется.
+    """
+    from .models import MediaBlob
+
+    names = sorted(set(name for name in names if name))
+    if not names:
+        return
+    storage = content_storage()
+    with transaction.atomic():
+        MediaBlob.objects.bulk_create(
+            [MediaBlob(name=name, ref_count=0) for name in names], ignore_conflicts=True,
+        )
+        unused = list(
+            MediaBlob.objects.select_for_update().filter(name__in=names, ref_count__lte=0)
+            .order_by('name').values_list('name', flat=True)
+        )
+        for name in unused:
+            storage.delete(name)
+        MediaBlob.objects.filter(name__in=unused).delete()
@@ -0,0 +1,67 @@
+"""
+Потоковая отдача больших непагинированных списков (эндпоинты mine).
+
+Queryset читается через iterator(chunk_size) - prefetch_related выполняется
+на каждую пачку, - каждая пачка сериализуется и сразу уходит клиенту.
+Память на запрос не зависит от числа строк.
+
+Режим выбирается параметром ?stream=: json - JSON-массив в том же формате,
+что и обычный ответ, ndjson - по объекту на строку. Другие значения
+(?stream=0, ?stream=false) не включают потоковый режим.
+"""
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+STREAM_CHUNK_SIZE = 500
+STREAM_FORMATS = ('json', 'ndjson')
+NDJSON = 'application/x-ndjson'
+
+
+def stream_format(request):
+    """
+    'json', 'ndjson' или None (обычный ответ, в том числе для других значений).
+    """
+    requested = request.query_params.get('stream')
+    return requested if requested in STREAM_FORMATS else None
+
+
+def _dumps(item):
+    return json.dumps(item, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def _chunks(queryset, chunk_size):
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _json_array(view, queryset, chunk_size):
+    yield '['
+    first = True
+    for chunk in _chunks(queryset, chunk_size):
+        for item in view.get_serializer(chunk, many=True).data:
+            yield _dumps(item) if first else ',' + _dumps(item)
+            first = False
+    yield ']'
+
+
+def _ndjson(view, queryset, chunk_size):
+    for chunk in _chunks(queryset, chunk_size):
+        yield ''.join(_dumps(item) + '\n' for item in view.get_serializer(chunk, many=True).data)
+
+
+def streaming_response(view, queryset, fmt, chunk_size=None):
+    """
+    StreamingHttpResponse со списком queryset, сериализованным view.get_serializer.
+    """
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+    if fmt == 'ndjson':
+        return StreamingHttpResponse(_ndjson(view, queryset, chunk_size), content_type=NDJSON)
+    return StreamingHttpResponse(_json_array(view, queryset, chunk_size), content_type='application/json')
@@ -0,0 +1,197 @@
+"""
+Автодополнение поиска: префиксный индекс названий товаров в памяти воркера.
+
+Индекс - отсортированный массив пар (токен, id товара) плюс словарь
+id -> (название, вес). Префикс ищется бисекцией, лучшие k отбираются по весу
+(популярности), так что запрос не ходит в БД.
+
+Индекс строится при первом обращении (или загружается из снимка
+SUGGEST_SNAPSHOT_PATH, см. manage.py build_suggest_index). Дальше воркер раз в
+SUGGEST_SYNC_INTERVAL секунд дочитывает товары с updated_at новее последней
+синхронизации, а раз в SUGGEST_REBUILD_INTERVAL перестраивает индекс целиком
+(чтобы выпали товары, удалённые в других процессах). В процессе, где товар
+изменён, индекс обновляется сразу сигналами.
+"""
+import heapq
+import pickle
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .search import tokenize
+
+# Запас на транзакции, закоммиченные позже своего updated_at
+SYNC_OVERLAP = timedelta(seconds=5)
+MEMO_SIZE = 10000
+
+
+def popularity(comments_count, rating_avg):
+    return (comments_count, rating_avg)
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.entries = []       # отсортированные (токен, id)
+        self.products = {}      # id -> (название, вес, токены)
+        self.synced_at = None   # время БД, до которого индекс актуален
+        self.memo = {}
+
+    @classmethod
+    def build(cls):
+        from .models import Product
+        index = cls()
+        index.synced_at = timezone.now()
+        rows = Product.objects.values_list('id', 'title', 'comments_count', 'rating_avg')
+        for pk, title, comments_count, rating_avg in rows.iterator(chunk_size=5000):
+            tokens = tuple(sorted(set(tokenize(title))))
+            index.products[str(pk)] = (title, popularity(comments_count, rating_avg), tokens)
+            index.entries.extend((token, str(pk)) for token in tokens)
+        index.entries.sort()
+        return index
+
+    def add(self, pk, title, weight):
+        pk = str(pk)
+        self.remove(pk)
+        tokens = tuple(sorted(set(tokenize(title))))
+        self.products[pk] = (title, weight, tokens)
+        for token in tokens:
+            insort(self.entries, (token, pk))
+        self.memo.clear()
+
+    def remove(self, pk):
+        pk = str(pk)
+        old = self.products.pop(pk, None)
+        if old is None:
+            return
+        for token in old[2]:
+            position = bisect_left(self.entries, (token, pk))
+            if position < len(self.entries) and self.entries[position] == (token, pk):
+                del self.entries[position]
+        self.memo.clear()
+
+    def sync(self):
+        """
+        Дочитывает товары, изменённые после последней синхронизации.
+        """
+        from .models import Product
+        started = timezone.now()
+        rows = Product.objects.filter(updated_at__gte=self.synced_at - SYNC_OVERLAP).values_list(
+            'id', 'title', 'comments_count', 'rating_avg'
+        )
+        for pk, title, comments_count, rating_avg in rows:
+            self.add(pk, title, popularity(comments_count, rating_avg))
+        self.synced_at = started
+
+    def suggest(self, query, limit=10):
+        """
+        Лучшие по весу товары, у которых каждый токен запроса - префикс
+        какого-нибудь токена названия.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        key = (tuple(tokens), limit)
+        if key in self.memo:
+            return self.memo[key]
+
+        # Кандидаты - по самому длинному (самому избирательному) токену
+        pivot = max(tokens, key=len)
+        start = bisect_left(self.entries, (pivot,))
+        candidates = set()
+        for token, pk in self.entries[start:]:
+            if not token.startswith(pivot):
+                break
+            candidates.add(pk)
+        others = [token for token in tokens if token is not pivot]
+        if others:
+            candidates = {
+                pk for pk in candidates
+                if all(any(t.startswith(other) for t in self.products[pk][2]) for other in others)
+            }
+        best = heapq.nlargest(limit, candidates, key=lambda pk: self.products[pk][1])
+        result = [{'id': pk, 'title': self.products[pk][0]} for pk in best]
+
+        if len(self.memo) >= MEMO_SIZE:
+            self.memo.clear()
+        self.memo[key] = result
+        return result
+
+    def save(self, path):
+        with open(path, 'wb') as snapshot:
+            pickle.dump((self.synced_at, self.entries, self.products), snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with open(path, 'rb') as snapshot:
+            index.synced_at, index.entries, index.products = pickle.load(snapshot)
+        return index
+
+
+_index = None
+_built_at = 0.0
+_synced_at = 0.0
+_lock = threading.Lock()
+
+
+def _snapshot_path():
+    return getattr(settings, 'SUGGEST_SNAPSHOT_PATH', None)
+
+
+def _initial_index():
+    path = _snapshot_path()
+    if path:
+        try:
+            index = PrefixIndex.load(path)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            pass
+        else:
+            index.sync()
+            return index
+    return PrefixIndex.build()
+
+
+def get_suggest_index():
+    """
+    Индекс текущего процесса; строится или синхронизируется при необходимости.
+    """
+    global _index, _built_at, _synced_at
+    now = time.monotonic()
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _index = _initial_index()
+                _built_at = _synced_at = now
+        return _index
+
+    rebuild_due = now - _built_at > getattr(settings, 'SUGGEST_REBUILD_INTERVAL', 600)
+    sync_due = now - _synced_at > getattr(settings, 'SUGGEST_SYNC_INTERVAL', 30)
+    # Обновляет индекс один поток, остальные отвечают по текущему
+    if (rebuild_due or sync_due) and _lock.acquire(blocking=False):
+        try:
+            if rebuild_due:
+                _index = PrefixIndex.build()
+                _built_at = now
+            else:
+                _index.sync()
+            _synced_at = now
+        finally:
+            _lock.release()
+    return _index
+
+
+def product_changed(product):
+    """
+    Обновление из сигналов: только если индекс в этом процессе уже построен.
+    """
+    if _index is not None:
+        _index.add(product.pk, product.title, popularity(product.comments_count, product.rating_avg))
+
+
+def product_removed(pk):
+    if _index is not None:
+        _index.remove(pk)
@@ -0,0 +1,76 @@
+"""
+Фоновые задачи в пуле потоков воркера.
+
+Задача ставится после коммита текущей транзакции (чтобы видеть записанные
+данные) и выполняется в отдельном потоке со своим соединением с БД. Под
+gevent (worker_class = "gevent") threading подменён гринлетами, и задача
+с обработкой изображений держала бы цикл событий вместе с запросами,
+поэтому там пул - настоящие потоки ОС из gevent.threadpool.
+
+Очереди между перезапусками процесса нет: задача, прерванная перезапуском,
+теряется. Незавершённые импорты изображений заново запускает команда
+resume_imports (core/imports.py).
+
+BACKGROUND_TASKS_EAGER = True выполняет задачи сразу в текущем потоке (тесты,
+management-команды).
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, 'BACKGROUND_TASK_WORKERS', 2)
+        if _gevent_patched():
+            from gevent.threadpool import ThreadPool
+            _executor = ThreadPool(maxsize=workers)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='core-tasks')
+    return _executor
+
+
+def _submit(func, args, kwargs):
+    executor = _get_executor()
+    if isinstance(executor, ThreadPoolExecutor):
+        executor.submit(_run, func, args, kwargs)
+    else:
+        executor.spawn(_run, func, args, kwargs)
+
+
+def _run(func, args, kwargs):
+    close_old_connections()
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", func.__qualname__)
+    finally:
+        connection.close()
+
+
+def enqueue(func, *args, **kwargs):
+    """
+    Выполняет func(*args, **kwargs) в фоне после коммита транзакции.
+    """
+    def submit():
+        if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+            func(*args, **kwargs)
+        else:
+            _submit(func, args, kwargs)
+
+    transaction.on_commit(submit)
@@ -1,3 +1,1200 @@
-from django.test import TestCase
+import csv
+import hashlib
+import json
+import os
+import random
+import socket
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO, StringIO
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient, APITestCase
+
+from . import imports, stock, suggest
+from .cache import CATALOG_VERSION_KEY, cached_response_data
+from .facets import product_facets
+from .images import variant_files
+from .imports import ImageFetchError, load_image
+from .timing import phase
+from .uploads import UploadConflict, cleanup_uploads, temp_path as upload_temp_path, write_chunk
+from .models import (
+    REVIEW_PREVIEW_SIZE, MediaBlob, Order, OrderStatusChange, Product, ProductComment, ProductImage, ProductImport,
+    SalesRollup, Upload, User,
+)
+from .orders import InvalidTransition, transition
+from .serializers import ProductListSerializer
+from .views import ProductViewSet
+
+
+def make_user(email, role):
+    return User.objects.create_user(username=email.split('@')[0], email=email, password='pass12345', role=role)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True, MEDIA_ROOT='/tmp/reshop-test-media')
+class ProductQueryBudgetTests(APITestCase):
+    """
+    Число SQL-запросов эндпоинтов каталога не зависит от размера страницы.
+    """
+    def setUp(self):
+        self.seller = make_user('seller@example.com', 'seller')
+        self.buyer = make_user('buyer@example.com', 'buyer')
+
+    def create_products(self, count):
+        for i in range(count):
+            product = Product.objects.create(seller=self.seller, title=f'Товар {i}', price=Decimal('10.00'))
+            ProductImage.objects.create(
+                product=product, image=SimpleUploadedFile(f'p{i}.gif', b'GIF89a', content_type='image/gif')
+            )
+            ProductComment.objects.create(product=product, user=self.buyer, text='ok', rating=5)
+            Order.objects.create(buyer=self.buyer, product=product)
+
+    def test_product_list_constant_queries(self):
+        self.create_products(8)
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 8)
+        self.assertEqual(response.data['results'][0]['comments_count'], 1)
+        self.assertEqual(len(response.data['results'][0]['latest_comments']), 1)
+
+    def test_product_retrieve_and_mine(self):
+        self.create_products(3)
+        product = Product.objects.first()
+        self.assertEqual(self.client.get(f'/api/products/{product.id}/').status_code, 200)
+        self.client.force_authenticate(self.seller)
+        response = self.client.get('/api/products/mine/')
+        self.assertEqual(len(response.data), 3)
+
+    def test_mine_streaming(self):
+        self.create_products(3)
+        self.client.force_authenticate(self.seller)
+        expected = self.client.get('/api/products/mine/').json()
+        with mock.patch('core.streaming.STREAM_CHUNK_SIZE', 2):
+            response = self.client.get('/api/products/mine/?stream=json')
+            self.assertEqual(json.loads(b''.join(response.streaming_content)), expected)
+
+        self.client.force_authenticate(self.buyer)
+        response = self.client.get('/api/orders/mine/?stream=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0])['buyer']['id'], str(self.buyer.id))
+
+        for value in ('0', 'false'):
+            response = self.client.get(f'/api/orders/mine/?stream={value}')
+            self.assertFalse(response.streaming)
+            self.assertEqual(len(response.data), 3)
+
+    def test_reviews_are_paginated_separately(self):
+        self.create_products(1)
+        product = Product.objects.get()
+        for i in range(5):
+            ProductComment.objects.create(product=product, user=self.buyer, text=f'отзыв {i}', rating=4)
+
+        data = self.client.get(f'/api/products/{product.id}/').data
+        self.assertEqual(data['comments_count'], 6)
+        self.assertEqual(len(data['latest_comments']), REVIEW_PREVIEW_SIZE)
+        self.assertNotIn('comments', data)
+
+        response = self.client.get(f'/api/products/{product.id}/reviews/?page_size=4')
+        self.assertEqual(response.data['count'], 6)
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertEqual(self.client.get('/api/products/not-a-uuid/reviews/').status_code, 404)
+
+    def test_order_mine_constant_queries(self):
+        self.create_products(6)
+        self.client.force_authenticate(self.buyer)
+        # Компактный заказ: товар, продавец, покупатель и миниатюра - один запрос
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/orders/mine/')
+        self.assertEqual(len(response.data), 6)
+        product = response.data[0]['product']
+        self.assertEqual(set(product), {'id', 'title', 'price', 'seller_name', 'image'})
+        self.assertTrue(product['image'].startswith('http://testserver/media/products/'))
+
+        response = self.client.get('/api/orders/mine/?expand=product')
+        self.assertEqual(len(response.data[0]['product']['latest_comments']), 1)
+        self.client.force_authenticate(self.seller)
+        self.assertEqual(self.client.get('/api/orders/').status_code, 200)
+
+    def test_compact_list_and_sparse_fields(self):
+        self.create_products(2)
+        response = self.client.get('/api/products/?expand=description')
+        row = response.data['results'][0]
+        self.assertEqual(
+            set(row), set(ProductListSerializer.default_fields) | {'description'}
+        )
+        self.assertEqual(row['seller_name'], self.seller.username)
+        self.assertTrue(row['image'].startswith('http://testserver/media/products/'))
+
+        response = self.client.get('/api/products/?fields=id,title')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+
+
+class ProductSearchTests(APITestCase):
+    """
+    Полнотекстовый поиск товаров и ordering=relevance.
+    """
+    def setUp(self):
+        self.seller = make_user('seller@example.com', 'seller')
+
+    def titles(self, url):
+        return [row['title'] for row in self.client.get(url).data['results']]
+
+    def test_search_is_updated_incrementally(self):
+        product = Product.objects.create(seller=self.seller, title='Ёлочные игрушки', price=1)
+        Product.objects.create(seller=self.seller, title='Шаблон сайта', description='игрушки не продаём', price=1)
+        self.assertEqual(self.titles('/api/products/?search=елочн'), ['Ёлочные игрушки'])
+        self.assertEqual(self.titles('/api/products/?search=игрушки&ordering=relevance')[0], 'Ёлочные игрушки')
+
+        product.title = 'Гирлянда'
+        product.save()
+        self.assertEqual(self.titles('/api/products/?search=елочн'), [])
+        product.delete()
+        self.assertEqual(self.titles('/api/products/?search=гирлянда'), [])
+
+    def test_search_ignores_query_syntax(self):
+        Product.objects.create(seller=self.seller, title='C++ курс', price=1)
+        self.assertEqual(self.titles('/api/products/?search=c%2B%2B%20"OR'), [])
+        self.assertEqual(self.titles('/api/products/?search=курс)'), ['C++ курс'])
+
+
+class SuggestTests(APITestCase):
+    """
+    Подсказки поиска из индекса в памяти.
+    """
+    def setUp(self):
+        suggest._index = None
+        self.addCleanup(setattr, suggest, '_index', None)
+        self.seller = make_user('seller@example.com', 'seller')
+
+    def titles(self, query):
+        return [row['title'] for row in self.client.get('/api/products/suggest/', {'q': query}).data['results']]
+
+    def test_prefix_ranked_by_popularity_without_queries(self):
+        Product.objects.create(seller=self.seller, title='Шаблон сайта', price=1)
+        Product.objects.create(seller=self.seller, title='Шаблон лендинга', price=1, comments_count=5)
+        Product.objects.create(seller=self.seller, title='Курс Python', price=1)
+        self.assertEqual(self.titles('шаб'), ['Шаблон лендинга', 'Шаблон сайта'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles('сайт ША'), ['Шаблон сайта'])
+            self.assertEqual(self.titles(''), [])
+
+    def test_index_follows_product_changes(self):
+        product = Product.objects.create(seller=self.seller, title='Ёлочные игрушки', price=1)
+        self.assertEqual(self.titles('елоч'), ['Ёлочные игрушки'])
+        product.title = 'Гирлянда'
+        product.save()
+        self.assertEqual(self.titles('елоч'), [])
+        self.assertEqual(self.titles('гир'), ['Гирлянда'])
+        product.delete()
+        self.assertEqual(self.titles('гир'), [])
+
+
+class KeysetPaginationTests(APITestCase):
+    """
+    ?cursor= переключает список товаров на keyset-пагинацию по (created_at, id).
+    """
+    def test_walks_all_products_without_gaps(self):
+        seller = make_user('seller@example.com', 'seller')
+        created = {str(Product.objects.create(seller=seller, title=f'T{i}', price=1).id) for i in range(7)}
+        # Одинаковый created_at у части товаров - tie-break по id
+        Product.objects.filter(title__in=['T1', 'T2', 'T3']).update(created_at=Product.objects.get(title='T1').created_at)
+
+        seen = []
+        url = '/api/products/?cursor=&page_size=3&fields=id&with_count=1'
+        response = self.client.get(url)
+        self.assertEqual(response.data['approximate_count'], 7)
+        while url:
+            response = self.client.get(url)
+            self.assertNotIn('count', response.data)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(set(seen), created)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/products/?cursor=garbage').status_code, 404)
+
+
+class ProductRatingTests(APITestCase):
+    """
+    Денормализованные агрегаты отзывов и сортировка/фильтр по рейтингу.
+    """
+    def setUp(self):
+        self.seller = make_user('seller@example.com', 'seller')
+        self.buyer = make_user('buyer@example.com', 'buyer')
+        self.good = Product.objects.create(seller=self.seller, title='Хороший', price=1)
+        self.bad = Product.objects.create(seller=self.seller, title='Плохой', price=1)
+
+    def test_aggregates_follow_comment_changes(self):
+        first = ProductComment.objects.create(product=self.good, user=self.buyer, text='a', rating=5)
+        ProductComment.objects.create(product=self.good, user=self.buyer, text='b', rating=3)
+        ProductComment.objects.create(product=self.good, user=self.buyer, text='без оценки')
+        self.good.refresh_from_db()
+        self.assertEqual((self.good.comments_count, self.good.rating_count, self.good.rating_avg), (3, 2, 4.0))
+
+        first = ProductComment.objects.get(pk=first.pk)
+        first.rating = 4
+        first.save()
+        first.delete()
+        self.good.refresh_from_db()
+        self.assertEqual((self.good.comments_count, self.good.rating_count, self.good.rating_avg), (2, 1, 3.0))
+        self.assertEqual(self.good.rating_histogram, {1: 0, 2: 0, 3: 1, 4: 0, 5: 0})
+
+        expected = Product.objects.values_list('comments_count', 'rating_sum', 'rating_avg', 'rating_3_count')
+        before = sorted(expected)
+        Product.objects.update(comments_count=0, rating_sum=0, rating_avg=0, rating_3_count=0)
+        call_command('rebuild_product_ratings', stdout=StringIO())
+        self.assertEqual(sorted(expected), before)
+
+    def test_rating_ordering_and_filter(self):
+        ProductComment.objects.create(product=self.good, user=self.buyer, text='a', rating=5)
+        ProductComment.objects.create(product=self.bad, user=self.buyer, text='b', rating=2)
+        titles = [row['title'] for row in self.client.get('/api/products/?ordering=rating').data['results']]
+        self.assertEqual(titles, ['Хороший', 'Плохой'])
+        titles = [row['title'] for row in self.client.get('/api/products/?min_rating=4').data['results']]
+        self.assertEqual(titles, ['Хороший'])
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True, MEDIA_ROOT='/tmp/reshop-test-media')
+class ProductImportTests(APITestCase):
+    """
+    Пакетный импорт товаров с отчётом по строкам и фоновой загрузкой изображений.
+    """
+    def setUp(self):
+        self.seller = make_user('seller@example.com', 'seller')
+        self.client.force_authenticate(self.seller)
+
+    def archive(self):
+        png = BytesIO()
+        Image.new('RGB', (2, 2)).save(png, 'PNG')
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as bundle:
+            bundle.writestr('cover.png', png.getvalue())
+        return SimpleUploadedFile('images.zip', archive.getvalue(), content_type='application/zip')
+
+    def test_csv_import(self):
+        rows = (
+            'title,price,quantity,images\n'
+            'Курс по Django,100,5,cover.png\n'
+            'Без цены,,1,\n'
+            'Шаблон,10.5,,missing.png\n'
+        )
+        upload = SimpleUploadedFile('catalog.csv', rows.encode(), content_type='text/csv')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/products/import/', {'file': upload, 'images': self.archive()})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created_count'], 2)
+        self.assertEqual([(e['row'], list(e['errors'])) for e in response.data['errors']], [(2, ['price'])])
+
+        job = self.client.get(f"/api/product-imports/{response.data['id']}/").data
+        self.assertEqual((job['status'], job['images_pending']), ('done', 0))
+        self.assertEqual([error['row'] for error in job['image_errors']], [3])
+        product = Product.objects.get(title='Курс по Django')
+        self.assertEqual((product.seller, product.quantity, product.images.count()), (self.seller, 5, 1))
+        self.assertEqual(Product.objects.get(title='Шаблон').quantity, 1)
+        self.assertEqual(len(self.client.get('/api/products/?search=django').data['results']), 1)
+
+    def test_jsonl_import_reports_bad_lines(self):
+        rows = '{"title": "Курс", "price": "1"}\nnot json\n'
+        upload = SimpleUploadedFile('catalog.jsonl', rows.encode())
+        response = self.client.post('/api/products/import/', {'file': upload})
+        self.assertEqual((response.data['created_count'], response.data['errors'][0]['row']), (1, 2))
+        self.assertEqual(response.data['status'], 'done')
+
+    def test_resume_stale_import(self):
+        upload = SimpleUploadedFile('catalog.csv', 'title,price,images\nКурс,100,cover.png\n'.encode())
+        # Задача загрузки изображений потерялась вместе с процессом
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self.client.post('/api/products/import/', {'file': upload, 'images': self.archive()})
+        job = ProductImport.objects.get(pk=response.data['id'])
+        self.assertEqual(job.status, ProductImport.Status.IMAGES)
+
+        call_command('resume_imports', stdout=StringIO())
+        self.assertEqual(ProductImport.objects.get(pk=job.pk).status, ProductImport.Status.IMAGES)
+
+        # Другой запуск занялся импортом недавно - не трогаем
+        long_ago = timezone.now() - timedelta(hours=2)
+        ProductImport.objects.filter(pk=job.pk).update(created_at=long_ago, images_started_at=timezone.now())
+        call_command('resume_imports', stdout=StringIO())
+        self.assertEqual(ProductImport.objects.get(pk=job.pk).status, ProductImport.Status.IMAGES)
+
+        ProductImport.objects.filter(pk=job.pk).update(images_started_at=long_ago)
+        call_command('resume_imports', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.pending_images), (ProductImport.Status.DONE, []))
+        self.assertEqual(ProductImage.objects.filter(product__title='Курс').count(), 1)
+
+    def test_taken_over_import_keeps_shared_files(self):
+        upload = SimpleUploadedFile('catalog.csv', 'title,price,images\nКурс,100,cover.png\n'.encode())
+        with self.captureOnCommitCallbacks(execute=False):
+            response = self.client.post('/api/products/import/', {'file': upload, 'images': self.archive()})
+        job_id = response.data['id']
+        load = imports.load_image
+        calls = []
+
+        def load_image(ref, archive=None):
+            calls.append(ref)
+            if len(calls) == 1:
+                # Первый запуск завис - импорт занимает и завершает повторный
+                ProductImport.objects.filter(pk=job_id).update(images_started_at=timezone.now() - timedelta(days=1))
+                imports.fetch_import_images(job_id)
+            return load(ref, archive)
+
+        with mock.patch('core.imports.load_image', load_image), self.captureOnCommitCallbacks(execute=True):
+            imports.fetch_import_images(job_id)
+
+        image = ProductImage.objects.get()
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(image.image.storage.exists(image.image.name))
+        self.assertEqual(MediaBlob.objects.get(name=image.image.name).ref_count, 1)
+
+    def test_image_fetch_rechecks_redirects(self):
+        requested = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                requested.append(self.path)
+                self.send_response(302)
+                self.send_header('Location', f'http://127.0.0.1:{server.server_port}/secret')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        public = '93.184.216.34'
+        real_connect = socket.create_connection
+        connected = []
+
+        def resolve(host, port, *args, **kwargs):
+            address = public if host == 'cdn.example.com' else host
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (address, port or 0))]
+
+        def connect(address, *args, **kwargs):
+            # «Публичный» адрес ведёт на локальный сервер
+            connected.append(address[0])
+            return real_connect(('127.0.0.1', server.server_port), *args, **kwargs)
+
+        with mock.patch('core.imports.socket.getaddrinfo', resolve), \
+                mock.patch('core.imports.socket.create_connection', connect):
+            with self.assertRaisesMessage(ImageFetchError, 'Адрес недоступен'):
+                load_image('http://cdn.example.com/a.png')
+        self.assertEqual((requested, connected), (['/a.png'], [public]))
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True, MEDIA_ROOT='/tmp/reshop-test-media')
+class ImageProcessingTests(APITestCase):
+    """
+    Фоновая обработка изображений: варианты, размеры, заглушка, srcset.
+    """
+    def png(self, name, size):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_product_image_variants(self):
+        seller = make_user('seller@example.com', 'seller')
+        product = Product.objects.create(seller=seller, title='Товар', price=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=product, image=self.png('big.png', (800, 400)))
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (800, 400))
+        self.assertEqual(image.variants['thumb']['width'], 200)
+        self.assertEqual(image.variants['full']['width'], 800)
+        self.assertTrue(image.placeholder.startswith('data:image/webp;base64,'))
+
+        data = self.client.get(f'/api/products/{product.id}/').data['images'][0]
+        self.assertRegex(data['srcset'], r'\.webp 200w, .*\.webp 600w, .*\.webp 800w$')
+        self.assertIn('.png 200w', data['srcset_fallback'])
+        row = self.client.get('/api/products/?fields=image').data['results'][0]
+        self.assertTrue(row['image'].endswith(image.variants['card']['webp']))
+
+        files = variant_files(image.variants)
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertFalse(any(default_storage.exists(path) for path in files))
+
+    def test_identical_images_are_stored_once(self):
+        seller = make_user('seller@example.com', 'seller')
+        first, second = (Product.objects.create(seller=seller, title=title, price=1) for title in ('А', 'Б'))
+        with self.captureOnCommitCallbacks(execute=True):
+            a = ProductImage.objects.create(product=first, image=self.png('one.png', (400, 400)))
+            b = ProductImage.objects.create(product=second, image=self.png('other.png', (400, 400)))
+        a.refresh_from_db()
+        b.refresh_from_db()
+        name = a.image.name
+        self.assertRegex(name, r'^products/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.png$')
+        self.assertEqual((b.image.name, b.variants), (name, a.variants))
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 2)
+
+        files = [name, *variant_files(a.variants)]
+        with self.captureOnCommitCallbacks(execute=True):
+            a.delete()
+        self.assertTrue(all(a.image.storage.exists(path) for path in files))
+        with self.captureOnCommitCallbacks(execute=True):
+            b.delete()
+        self.assertFalse(any(a.image.storage.exists(path) for path in files))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_released_file_written_again_is_kept(self):
+        seller = make_user('seller@example.com', 'seller')
+        product = Product.objects.create(seller=seller, title='Товар', price=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = ProductImage.objects.create(product=product, image=self.png('one.png', (40, 40)))
+        with self.captureOnCommitCallbacks() as deletions:
+            first.delete()
+        # Тот же файл записан снова, а задача удаления выполняется до того,
+        # как запись с ним сохранена
+        image = ProductImage(product=product)
+        image.image.save('again.png', self.png('again.png', (40, 40)), save=False)
+        for callback in deletions:
+            callback()
+        self.assertTrue(image.image.storage.exists(image.image.name))
+        self.assertEqual(MediaBlob.objects.get(name=image.image.name).ref_count, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        self.assertEqual(MediaBlob.objects.get(name=image.image.name).ref_count, 1)
+
+    def test_avatar_variants(self):
+        user = make_user('buyer@example.com', 'buyer')
+        user.avatar = self.png('me.png', (300, 300))
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        user.refresh_from_db()
+        self.client.force_authenticate(user)
+        data = self.client.get('/api/users/me/').data
+        self.assertIn('_thumb.webp 200w', data['avatar_srcset'])
+        self.assertTrue(data['avatar_placeholder'])
+
+    def test_broken_image_is_not_retried(self):
+        seller = make_user('seller@example.com', 'seller')
+        product = Product.objects.create(seller=seller, title='Товар', price=1)
+        broken = SimpleUploadedFile('broken.png', b'not an image', content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=product, image=broken)
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.variants), (None, {'source': image.image.name}))
+
+        seller.avatar = SimpleUploadedFile('me.png', b'not an image', content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            seller.save()
+        seller.refresh_from_db()
+        self.assertEqual(seller.avatar_variants, {'source': seller.avatar.name})
+
+        # Неудача записана - повторное сохранение не ставит обработку снова
+        with mock.patch('core.signals.enqueue') as enqueue, self.captureOnCommitCallbacks(execute=True):
+            image.save()
+            seller.save()
+        enqueue.assert_not_called()
+
+
+@override_settings(MEDIA_ROOT='/tmp/reshop-test-media')
+class ProductGalleryTests(APITestCase):
+    """
+    Добавление, удаление и порядок изображений товара одной транзакцией.
+    """
+    def png(self, name, color):
+        buffer = BytesIO()
+        Image.new('RGB', (10, 10), color).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def setUp(self):
+        self.seller = make_user('seller@example.com', 'seller')
+        self.product = Product.objects.create(seller=self.seller, title='Товар', price=1)
+        self.images = [
+            ProductImage.objects.create(product=self.product, image=self.png(f'{color}.png', color), position=i)
+            for i, color in enumerate(('red', 'green', 'blue'))
+        ]
+        self.client.force_authenticate(self.seller)
+
+    def test_add_delete_reorder(self):
+        first, second, third = self.images
+        response = self.client.post(f'/api/products/{self.product.id}/images/', {
+            'delete': [first.id], 'order': [third.id, second.id],
+            'uploaded_images': [self.png('a.png', 'white'), self.png('b.png', 'black')],
+        })
+        self.assertEqual(response.status_code, 200)
+        ids = [image['id'] for image in response.data]
+        self.assertEqual(ids[:2], [third.id, second.id])
+        self.assertEqual([image['position'] for image in response.data], [0, 1, 2, 3])
+        self.assertFalse(ProductImage.objects.filter(pk=first.id).exists())
+        self.assertFalse(MediaBlob.objects.filter(name=first.image.name).exists())
+        self.assertEqual(MediaBlob.objects.filter(name__in=[i.image.name for i in self.images]).count(), 2)
+        detail = self.client.get(f'/api/products/{self.product.id}/').data
+        self.assertEqual([image['id'] for image in detail['images']], ids)
+
+    def test_update_with_images_is_atomic(self):
+        first = self.images[0]
+        with mock.patch('core.gallery.ProductImage.objects.bulk_create', side_effect=RuntimeError):
+            response = self.client.patch(f'/api/products/{self.product.id}/', {
+                'title': 'Новое', 'images_to_delete': [first.id],
+                'uploaded_images': [self.png('c.png', 'yellow')],
+            })
+        self.assertEqual(response.status_code, 500)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.title, 'Товар')
+        self.assertTrue(ProductImage.objects.filter(pk=first.id).exists())
+
+    def test_only_owner(self):
+        self.client.force_authenticate(make_user('other@example.com', 'seller'))
+        response = self.client.post(f'/api/products/{self.product.id}/images/', {'delete': [self.images[0].id]})
+        self.assertEqual(response.status_code, 403)
+
+
+class OrderListingTests(APITestCase):
+    """
+    Фильтры, сортировка и страницы списков заказов.
+    """
+    def setUp(self):
+        self.seller = make_user('seller@example.com', 'seller')
+        self.buyer = make_user('buyer@example.com', 'buyer')
+        self.course = Product.objects.create(seller=self.seller, title='Курс', price=Decimal('10.00'), quantity=100)
+        self.book = Product.objects.create(seller=self.seller, title='Книга', price=Decimal('25.00'), quantity=100)
+        self.orders = [
+            Order.objects.create(buyer=self.buyer, product=self.course if i % 2 else self.book, quantity=i + 1)
+            for i in range(5)
+        ]
+        Order.objects.filter(pk=self.orders[0].pk).update(status='paid')
+
+    def ids(self, data):
+        return [row['id'] for row in data]
+
+    def test_filters_and_ordering(self):
+        self.assertEqual(self.orders[0].seller, self.seller)
+        self.client.force_authenticate(self.seller)
+        data = self.client.get('/api/orders/mine/?status=pending').data
+        self.assertEqual(self.ids(data), [str(o.id) for o in reversed(self.orders[1:])])
+        data = self.client.get(f'/api/orders/mine/?status=paid,pending&product={self.course.id}').data
+        self.assertEqual(self.ids(data), [str(self.orders[3].id), str(self.orders[1].id)])
+        data = self.client.get('/api/orders/mine/?ordering=quantity').data
+        self.assertEqual([row['quantity'] for row in data], [1, 2, 3, 4, 5])
+        future = (timezone.now() + timedelta(days=1)).isoformat()
+        self.assertEqual(self.client.get('/api/orders/mine/', {'created_after': future}).data, [])
+
+    def test_pages(self):
+        self.client.force_authenticate(self.buyer)
+        data = self.client.get('/api/orders/mine/?page_size=2').data
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(self.ids(data['results']), [str(o.id) for o in reversed(self.orders[3:])])
+
+        seen, url = [], '/api/orders/mine/?cursor=&page_size=2&status=pending'
+        while url:
+            data = self.client.get(url).data
+            seen += self.ids(data['results'])
+            url = data['next']
+        self.assertEqual(seen, [str(o.id) for o in reversed(self.orders[1:])])
+
+    def test_export(self):
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.client.get('/api/orders/export/').status_code, 403)
+        self.client.force_authenticate(self.seller)
+        self.assertEqual(self.client.get('/api/orders/export/?type=pdf').status_code, 400)
+
+        with mock.patch('core.exports.EXPORT_CHUNK_SIZE', 2):
+            response = self.client.get('/api/orders/export/?status=pending')
+            content = b''.join(response.streaming_content).decode()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(StringIO(content.lstrip('\ufeff'))))
+        self.assertEqual(rows[0][:3], ['Заказ', 'Создан', 'Статус'])
+        self.assertEqual([row[0] for row in rows[1:]], [str(o.id) for o in self.orders[1:]])
+        self.assertEqual(rows[1][4:8], ['Курс', '2', '10.00', '20.00'])
+
+        with mock.patch('core.exports.EXPORT_CHUNK_SIZE', 2):
+            response = self.client.get('/api/orders/export/?type=xlsx')
+            content = b''.join(response.streaming_content)
+        with zipfile.ZipFile(BytesIO(content)) as archive:
+            self.assertIsNone(archive.testzip())
+            sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        ns = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = sheet.findall('.//x:row', ns)
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1].find('x:c/x:is/x:t', ns).text, str(self.orders[0].id))
+        self.assertEqual([c.findtext('x:v', namespaces=ns) for c in rows[1].findall('x:c', ns)][5:8], ['1', '25.00', '25.00'])
+
+
+class SellerStatsTests(APITestCase):
+    """
+    Статистика продаж из дневных агрегатов, которые сдвигаются вместе с заказами.
+    """
+    def setUp(self):
+        self.seller = make_user('seller@example.com', 'seller')
+        self.buyer = make_user('buyer@example.com', 'buyer')
+        self.course = Product.objects.create(seller=self.seller, title='Курс', price=Decimal('10.00'))
+        self.book = Product.objects.create(seller=self.seller, title='Книга', price=Decimal('25.00'))
+
+    def rollups(self):
+        return sorted(SalesRollup.objects.values_list('product__title', 'status', 'orders_count', 'units', 'revenue'))
+
+    def test_rollups_follow_orders(self):
+        paid = Order.objects.create(buyer=self.buyer, product=self.course, quantity=3)
+        Order.objects.create(buyer=self.buyer, product=self.book)
+        # Цена заказа фиксируется при создании
+        Product.objects.filter(pk=self.course.pk).update(price=Decimal('99.00'))
+        self.client.force_authenticate(self.seller)
+        self.assertEqual(self.client.post(f'/api/orders/{paid.id}/confirm/').status_code, 200)
+
+        with self.assertNumQueries(4):
+            data = self.client.get('/api/sellers/me/stats/').data
+        self.assertEqual((data['totals']['orders'], data['totals']['units']), (1, 3))
+        self.assertEqual(data['totals']['revenue'], Decimal('30.00'))
+        self.assertEqual(len(data['days']), 30)
+        self.assertEqual(data['days'][-1]['revenue'], Decimal('30.00'))
+        self.assertEqual([row['title'] for row in data['products']], ['Курс'])
+
+        data = self.client.get('/api/sellers/me/stats/?status=pending').data
+        self.assertEqual(data['totals']['revenue'], Decimal('25.00'))
+        data = self.client.get('/api/sellers/me/stats/?status=pending,paid,canceled').data
+        self.assertEqual(
+            [(row['status'], row['orders'], row['revenue']) for row in data['by_status']],
+            [('pending', 1, Decimal('25.00')), ('paid', 1, Decimal('30.00')), ('canceled', 0, Decimal('0.00'))],
+        )
+
+        incremental = self.rollups()
+        Order.objects.get(pk=paid.pk).delete()
+        self.assertIn(('Курс', 'paid', 0, 0, Decimal('0.00')), self.rollups())
+        Order.objects.create(buyer=self.buyer, product=self.course, quantity=3, unit_price=Decimal('10.00'), status='paid')
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), [row for row in incremental if row[2]])
+
+    def test_sellers_only_and_range_validation(self):
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.client.get('/api/sellers/me/stats/').status_code, 403)
+        self.client.force_authenticate(self.seller)
+        response = self.client.get('/api/sellers/me/stats/?from=2026-02-01&to=2026-01-01')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('from', response.data)
+
+
+class StockReservationTests(APITestCase):
+    """
+    Резерв остатка при оформлении заказа и его возврат.
+    """
+    def setUp(self):
+        self.seller = make_user('seller@example.com', 'seller')
+        self.buyer = make_user('buyer@example.com', 'buyer')
+        self.product = Product.objects.create(seller=self.seller, title='Курс', price=1, quantity=3)
+
+    def checkout(self, quantity):
+        self.client.force_authenticate(self.buyer)
+        return self.client.post('/api/orders/', {'product': self.product.id, 'quantity': quantity})
+
+    def stock(self):
+        return Product.objects.values_list('quantity', flat=True).get(pk=self.product.pk)
+
+    def test_reserve_consume_and_release(self):
+        self.assertEqual(self.checkout(2).status_code, 201)
+        self.assertEqual(self.checkout(1).status_code, 201)
+        self.assertEqual(self.stock(), 0)
+        response = self.checkout(1)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quantity', response.data)
+
+        paid, rejected = Order.objects.order_by('-quantity')
+        self.client.force_authenticate(self.seller)
+        self.client.post(f'/api/orders/{paid.id}/confirm/')
+        self.client.post(f'/api/orders/{rejected.id}/reject/')
+        self.assertEqual(self.stock(), 1)
+        # Повторная отмена не возвращает остаток второй раз
+        stock.release(Order.objects.get(pk=rejected.pk))
+        self.assertEqual(self.stock(), 1)
+        self.assertIsNone(Order.objects.get(pk=paid.pk).reserved_until)
+
+    def test_stock_update_is_last_before_commit(self):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(self.checkout(1).status_code, 201)
+        statements = [q['sql'] for q in queries.captured_queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        writes = [sql for sql in statements if sql.startswith(('INSERT', 'UPDATE'))]
+        self.assertTrue(writes[0].startswith('INSERT INTO "core_order"'))
+        self.assertTrue(writes[-1].startswith('UPDATE "core_product"'))
+        # Строки покупателя и продавца сдвигаются уже после коммита
+        self.assertFalse([sql for sql in writes if sql.startswith('UPDATE "core_user"')])
+        self.assertTrue(callbacks)
+
+    def test_total_uses_price_at_checkout(self):
+        self.checkout(2)
+        Product.objects.filter(pk=self.product.pk).update(price=5)
+        order = Order.objects.get()
+        response = self.client.get(f'/api/orders/{order.id}/')
+        self.assertEqual(response.data['total_amount'], 2.0)
+        # Заказ без сохранённой цены - по текущей цене товара
+        Order.objects.filter(pk=order.pk).update(unit_price=None)
+        response = self.client.get(f'/api/orders/{order.id}/')
+        self.assertEqual(response.data['total_amount'], 10.0)
+
+    def test_expired_reservations_are_released(self):
+        self.checkout(3)
+        Order.objects.update(reserved_until=timezone.now() - timedelta(minutes=1))
+        # Нехватка остатка сначала отменяет просроченные заказы этого товара
+        self.assertEqual(self.checkout(2).status_code, 201)
+        self.assertEqual(self.stock(), 1)
+        self.assertEqual(Order.objects.filter(status='canceled').count(), 1)
+
+        Order.objects.filter(status='pending').update(reserved_until=timezone.now() - timedelta(minutes=1))
+        call_command('release_expired_reservations', stdout=StringIO())
+        self.assertEqual(self.stock(), 3)
+        self.assertFalse(Order.objects.filter(status='pending').exists())
+        self.assertEqual(SalesRollup.objects.get(status='canceled').orders_count, 2)
+
+    def test_product_edit_keeps_concurrent_reservation(self):
+        load = ProductViewSet.get_object
+
+        def get_object(view):
+            product = load(view)
+            # Покупка между чтением товара и его сохранением
+            self.assertTrue(stock.reserve(product.pk, 2))
+            return product
+
+        self.client.force_authenticate(self.seller)
+        with mock.patch.object(ProductViewSet, 'get_object', get_object):
+            response = self.client.patch(f'/api/products/{self.product.id}/', {'title': 'Новый курс'})
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.title, self.product.quantity), ('Новый курс', 1))
+
+    def test_bulk_confirm_and_reject(self):
+        for _ in range(3):
+            self.checkout(1)
+        first, second, third = Order.objects.order_by('created_at')
+        other_seller = make_user('other@example.com', 'seller')
+        foreign = Order.objects.create(
+            buyer=self.buyer, product=Product.objects.create(seller=other_seller, title='Чужой', price=1),
+        )
+
+        self.client.force_authenticate(self.seller)
+        response = self.client.post('/api/orders/bulk-confirm/', {'ids': [first.id, foreign.id, second.id]}, format='json')
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual([row['result'] for row in response.data['results']], ['ok', 'not_found', 'ok'])
+        response = self.client.post('/api/orders/bulk-reject/', {'ids': [first.id, third.id]}, format='json')
+        self.assertEqual([row['result'] for row in response.data['results']], ['not_pending', 'ok'])
+
+        self.assertEqual(dict(Order.objects.filter(seller=self.seller).values_list('pk', 'status')), {
+            first.pk: 'paid', second.pk: 'paid', third.pk: 'seller_rejected',
+        })
+        self.assertFalse(Order.objects.filter(seller=self.seller, reserved_until__isnull=False).exists())
+        self.assertEqual(self.stock(), 1)
+        rollups = dict(SalesRollup.objects.filter(seller=self.seller).values_list('status', 'orders_count'))
+        self.assertEqual(rollups, {'pending': 0, 'paid': 2, 'seller_rejected': 1})
+
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.client.post('/api/orders/bulk-confirm/', {'ids': [third.id]}, format='json').status_code, 403)
+
+
+class OrderStatusTests(APITestCase):
+    """
+    Переходы статуса заказа: таблица, условный UPDATE и история.
+    """
+    def setUp(self):
+        self.seller = make_user('seller@example.com', 'seller')
+        self.buyer = make_user('buyer@example.com', 'buyer')
+        self.product = Product.objects.create(seller=self.seller, title='Курс', price=1, quantity=5)
+        self.client.force_authenticate(self.buyer)
+        self.client.post('/api/orders/', {'product': self.product.id, 'quantity': 2})
+        self.order = Order.objects.get()
+
+    def webhook(self, event):
+        return self.client.post('/api/payments/webhook/yookassa/', {
+            'event': event, 'object': {'id': 'p1', 'metadata': {'order_id': str(self.order.id)}},
+        }, format='json')
+
+    def history(self):
+        return list(self.order.status_history.values_list('from_status', 'to_status', 'source'))
+
+    def test_late_webhook_keeps_seller_decision(self):
+        self.client.force_authenticate(self.seller)
+        self.assertEqual(self.client.post(f'/api/orders/{self.order.id}/reject/').status_code, 200)
+        self.assertEqual(self.webhook('payment.succeeded').status_code, 200)
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'seller_rejected')
+        self.assertEqual(Product.objects.get(pk=self.product.pk).quantity, 5)
+        self.assertEqual(self.history(), [('', 'pending', 'system'), ('pending', 'seller_rejected', 'seller')])
+        self.assertEqual(self.client.post(f'/api/orders/{self.order.id}/confirm/').status_code, 400)
+
+    def test_stale_writers(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        transition(Order.objects.get(pk=self.order.pk), Order.Status.PAID, OrderStatusChange.Source.PAYMENT)
+        with self.assertRaises(InvalidTransition) as error:
+            transition(stale, Order.Status.CANCELED)
+        self.assertEqual(error.exception.current, 'paid')
+
+        # Полное сохранение устаревшего экземпляра не затирает статус
+        stale = Order.objects.get(pk=self.order.pk)
+        transition(Order.objects.get(pk=self.order.pk), Order.Status.DELIVERED)
+        stale.comment = 'Спасибо'
+        stale.save()
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.comment), ('delivered', 'Спасибо'))
+        self.assertEqual(Product.objects.get(pk=self.product.pk).quantity, 3)
+        self.assertEqual(
+            dict(SalesRollup.objects.filter(orders_count__gt=0).values_list('status', 'orders_count')), {'delivered': 1},
+        )
+
+
+class StockContentionTests(TransactionTestCase):
+    """
+    Одновременные покупки через POST /api/orders/ не продают больше, чем есть
+    на складе, пока продавец редактирует товар.
+    """
+    BUYERS = 20
+    STOCK = 5
+    EDITS = 5
+
+    def retry(self, request):
+        """
+        SQLite в тестах не ждёт блокировку таблицы, а падает - повторяем
+        запрос. Ошибка могла случиться и после коммита заказа (при чтении
+        ответа), поэтому проданное считаем по базе, а не по ответам.
+        """
+        for _ in range(1000):
+            try:
+                response = request()
+            except OperationalError:
+                response = None
+            # Редактирование товара отдаёт ошибку базы как 500
+            if response is not None and response.status_code != 500:
+                return response
+            time.sleep(random.uniform(0.005, 0.05))
+        raise AssertionError("База так и не освободилась")
+
+    def test_no_overselling(self):
+        seller = make_user('seller@example.com', 'seller')
+        buyers = [make_user(f'buyer{number}@example.com', 'buyer') for number in range(4)]
+        product = Product.objects.create(seller=seller, title='Дроп', price=7, quantity=self.STOCK)
+        barrier = threading.Barrier(self.BUYERS + 1)
+        statuses, edits = [], []
+
+        def buy(buyer):
+            client = APIClient()
+            client.force_authenticate(buyer)
+            try:
+                barrier.wait()
+                response = self.retry(lambda: client.post('/api/orders/', {'product': product.id, 'quantity': 1}))
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        def edit():
+            client = APIClient()
+            client.force_authenticate(seller)
+            try:
+                barrier.wait()
+                for number in range(self.EDITS):
+                    response = self.retry(
+                        lambda: client.patch(f'/api/products/{product.id}/', {'title': f'Дроп {number}'})
+                    )
+                    edits.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(buyers[number % len(buyers)],)) for number in range(self.BUYERS)]
+        threads.append(threading.Thread(target=edit))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(edits, [200] * self.EDITS)
+        self.assertEqual(len(statuses), self.BUYERS)
+        self.assertLessEqual(set(statuses), {201, 400})
+        self.assertLessEqual(statuses.count(201), self.STOCK)
+
+        product.refresh_from_db()
+        self.assertEqual((product.title, product.quantity), (f'Дроп {self.EDITS - 1}', 0))
+        orders = Order.objects.filter(product=product)
+        self.assertEqual(orders.count(), self.STOCK)
+        self.assertFalse(orders.filter(reserved_until__isnull=True).exists())
+        self.assertEqual(OrderStatusChange.objects.filter(order__product=product).count(), self.STOCK)
+        rollup = SalesRollup.objects.get(seller=seller, product=product, status='pending')
+        self.assertEqual(
+            (rollup.orders_count, rollup.units, rollup.revenue), (self.STOCK, self.STOCK, Decimal(7 * self.STOCK)),
+        )
+
+
+class ServerTimingTests(APITestCase):
+    """
+    Заголовок Server-Timing с разбивкой по фазам.
+    """
+    def test_header_phases(self):
+        Product.objects.create(seller=make_user('seller@example.com', 'seller'), title='Товар', price=1)
+        header = self.client.get('/api/products/')['Server-Timing']
+        for name in ('db', 'serialize', 'cache', 'view', 'total'):
+            self.assertRegex(header, rf'\b{name};dur=\d+\.\d')
+        self.assertIs(phase('db'), phase('cache'))
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/products/'))
+
+
+@override_settings(
+    BACKGROUND_TASKS_EAGER=True,
+    PRIVATE_MEDIA_ROOT='/tmp/reshop-test-private',
+    UPLOAD_TEMP_DIR='/tmp/reshop-test-private/uploads',
+)
+class ResumableUploadTests(APITestCase):
+    """
+    Загрузка файла товара частями, докачка и выдача покупателю.
+    """
+    def setUp(self):
+        self.seller = make_user('seller@example.com', 'seller')
+        self.product = Product.objects.create(seller=self.seller, title='Курс', price=1)
+        self.client.force_authenticate(self.seller)
+
+    def patch(self, url, offset, data):
+        return self.client.generic(
+            'PATCH', url, data, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_chunked_upload_and_download(self):
+        payload = b'0123456789' * 1000
+        response = self.client.post(
+            '/api/uploads/', {'product': self.product.id, 'filename': '../курс.zip', 'size': len(payload)},
+        )
+        self.assertEqual(response.status_code, 201)
+        url = f"/api/uploads/{response.data['id']}/"
+
+        self.assertEqual(self.patch(url, 0, payload[:4000])['Upload-Offset'], '4000')
+        # Повтор уже принятой части - конфликт с текущим смещением
+        response = self.patch(url, 0, payload[:4000])
+        self.assertEqual((response.status_code, response['Upload-Offset']), (409, '4000'))
+        self.assertEqual(self.client.head(url)['Upload-Offset'], '4000')
+        self.assertEqual(self.patch(url, 4000, payload[4000:]).status_code, 204)
+        self.assertEqual(self.patch(url, len(payload), b'extra').status_code, 413)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url + 'finalize/', {'checksum': hashlib.sha256(payload).hexdigest()})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.client.get(url).data['status'], 'complete')
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.file_name, self.product.file_size), ('курс.zip', len(payload)))
+        self.assertFalse(os.path.exists(upload_temp_path(url.split('/')[3])))
+
+        buyer = make_user('buyer@example.com', 'buyer')
+        self.client.force_authenticate(buyer)
+        download = f'/api/products/{self.product.id}/download/'
+        self.assertEqual(self.client.get(download).status_code, 403)
+        Order.objects.create(buyer=buyer, product=self.product, status='paid')
+        response = self.client.get(download)
+        self.assertEqual(b''.join(response.streaming_content), payload)
+
+    def test_chunk_conflicts_when_offset_moves(self):
+        response = self.client.post('/api/uploads/', {'product': self.product.id, 'filename': 'a.bin', 'size': 6})
+        upload = Upload.objects.get(pk=response.data['id'])
+
+        class Stream(BytesIO):
+            def read(self, size=-1):
+                # Смещение сдвинули, пока шла запись части
+                Upload.objects.filter(pk=upload.pk).update(offset=3)
+                return super().read(size)
+
+        with self.assertRaises(UploadConflict) as conflict:
+            write_chunk(upload, 0, Stream(b'abc'))
+        self.assertEqual(conflict.exception.offset, 3)
+        self.assertEqual(Upload.objects.get(pk=upload.pk).offset, 3)
+
+    def test_bad_checksum_and_cleanup(self):
+        response = self.client.post('/api/uploads/', {'product': self.product.id, 'filename': 'a.bin', 'size': 3})
+        url = f"/api/uploads/{response.data['id']}/"
+        self.patch(url, 0, b'abc')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url + 'finalize/', {'checksum': '0' * 64})
+        self.assertEqual(self.client.get(url).data['status'], 'failed')
+
+        response = self.client.post('/api/uploads/', {'product': self.product.id, 'filename': 'b.bin', 'size': 3})
+        Upload.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        os.utime(upload_temp_path(response.data['id']), (0, 0))
+        self.assertEqual(cleanup_uploads(), 2)
+        self.assertFalse(os.path.exists(upload_temp_path(response.data['id'])))
+
+    def test_failed_and_stuck_processing(self):
+        response = self.client.post('/api/uploads/', {'product': self.product.id, 'filename': 'a.bin', 'size': 3})
+        url = f"/api/uploads/{response.data['id']}/"
+        self.patch(url, 0, b'abc')
+        with mock.patch('core.uploads._move_to_storage', side_effect=OSError('disk full')), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url + 'finalize/', {'checksum': hashlib.sha256(b'abc').hexdigest()})
+        self.assertEqual(self.client.get(url).data['status'], 'failed')
+        self.assertFalse(os.path.exists(upload_temp_path(response.data['id'])))
+
+        # Задача проверки потерялась при перезапуске
+        response = self.client.post('/api/uploads/', {'product': self.product.id, 'filename': 'b.bin', 'size': 3})
+        stuck = response.data['id']
+        Upload.objects.filter(pk=stuck).update(
+            status=Upload.Status.PROCESSING, offset=3, updated_at=timezone.now() - timedelta(days=2),
+        )
+        os.utime(upload_temp_path(stuck), (0, 0))
+        cleanup_uploads()
+        self.assertEqual(Upload.objects.get(pk=stuck).status, Upload.Status.FAILED)
+        self.assertFalse(os.path.exists(upload_temp_path(stuck)))
+
+
+class ProductBulkUpdateTests(APITestCase):
+    """
+    Массовое изменение цен и остатков.
+    """
+    def test_bulk_update(self):
+        seller = make_user('seller@example.com', 'seller')
+        other = make_user('other@example.com', 'seller')
+        first = Product.objects.create(seller=seller, title='Первый', price=1, quantity=1)
+        second = Product.objects.create(seller=seller, title='Второй', price=2, quantity=2)
+        foreign = Product.objects.create(seller=other, title='Чужой', price=3, quantity=3)
+        self.client.force_authenticate(seller)
+
+        items = [
+            {'id': str(first.id), 'price': '10.50'},
+            {'id': str(second.id), 'quantity': 0, 'price': '20'},
+            {'id': str(foreign.id), 'price': '0'},
+        ]
+        # Проверка принадлежности, UPDATE, транзакция и версии кэша не зависят от числа товаров
+        with self.assertNumQueries(4):
+            response = self.client.patch('/api/products/bulk/', items, format='json')
+        self.assertEqual(response.data, {'updated': 2, 'not_found': [foreign.id]})
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        foreign.refresh_from_db()
+        self.assertEqual((first.price, first.quantity), (Decimal('10.50'), 1))
+        self.assertEqual((second.price, second.quantity), (Decimal('20'), 0))
+        self.assertEqual(foreign.price, Decimal('3'))
+
+        response = self.client.patch('/api/products/bulk/', [items[0], items[0]], format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CatalogFacetTests(APITestCase):
+    """
+    Фильтры каталога и счётчики фасетов.
+    """
+    def setUp(self):
+        cache.clear()
+        self.seller = make_user('seller@example.com', 'seller')
+        self.other = make_user('other@example.com', 'seller')
+        Product.objects.create(seller=self.seller, title='Курс один', price=50, quantity=0)
+        Product.objects.create(seller=self.seller, title='Курс два', price=700, quantity=3)
+        Product.objects.create(seller=self.other, title='Шаблон', price=7000, quantity=1)
+
+    def test_filters(self):
+        def titles(params):
+            return sorted(row['title'] for row in self.client.get('/api/products/', params).data['results'])
+
+        self.assertEqual(titles({'min_price': 100, 'max_price': 1000}), ['Курс два'])
+        self.assertEqual(titles({'in_stock': 'true', 'seller': self.seller.id}), ['Курс два'])
+        self.assertEqual(titles({'created_after': '2000-01-01T00:00:00Z', 'in_stock': 'false'}), ['Курс один'])
+
+    def test_facets_in_one_query(self):
+        with self.assertNumQueries(1):
+            facets = product_facets(Product.objects.all())
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [1, 0, 1, 0, 1])
+        self.assertEqual(facets['sellers'][0], {'id': str(self.seller.id), 'name': self.seller.username, 'count': 2})
+        self.assertEqual(facets['in_stock'], 2)
+
+        data = self.client.get('/api/products/', {'search': 'курс', 'facets': 1}).data
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['facets']['sellers'], [{'id': str(self.seller.id), 'name': self.seller.username, 'count': 2}])
+
+
+class CatalogCacheTests(APITestCase):
+    """
+    Кэш ответов каталога: инвалидация по версиям и отдача устаревшей копии
+    во время пересчёта.
+    """
+    def setUp(self):
+        cache.clear()
+        self.seller = make_user('seller@example.com', 'seller')
+
+    def test_writes_invalidate_cached_list_and_detail(self):
+        product = Product.objects.create(seller=self.seller, title='Первый', price=1)
+        self.assertEqual(self.client.get('/api/products/').data['count'], 1)
+        # Из базы читаются только остатки страницы
+        with self.assertNumQueries(1):
+            self.client.get('/api/products/')
+
+        Product.objects.create(seller=self.seller, title='Второй', price=1)
+        self.assertEqual(self.client.get('/api/products/').data['count'], 2)
+
+        self.assertEqual(self.client.get(f'/api/products/{product.id}/').data['comments_count'], 0)
+        ProductComment.objects.create(product=product, user=self.seller, text='ok', rating=5)
+        self.assertEqual(self.client.get(f'/api/products/{product.id}/').data['comments_count'], 1)
+
+    def test_stock_changes_keep_cached_list(self):
+        product = Product.objects.create(seller=self.seller, title='Товар', price=1, quantity=1)
+        self.client.get('/api/products/')
+        self.assertEqual(self.client.get('/api/products/?in_stock=true').data['count'], 1)
+        self.assertEqual(self.client.get(f'/api/products/{product.id}/').data['quantity'], 1)
+        etag = self.client.get('/api/products/')['ETag']
+        catalog_version = cache.get(CATALOG_VERSION_KEY)
+
+        self.assertTrue(stock.reserve(product.id, 1))
+        self.assertEqual(cache.get(CATALOG_VERSION_KEY), catalog_version)
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.data['results'][0]['quantity'], 0)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get('/api/products/?in_stock=true').data['count'], 0)
+        self.assertEqual(self.client.get(f'/api/products/{product.id}/').data['quantity'], 0)
+
+    def test_stale_entry_is_served_while_another_worker_rebuilds(self):
+        cache.set('catalog:test', (0, 'stale'), timeout=60)
+        cache.add('catalog:test:lock', 1)
+        self.assertEqual(cached_response_data('catalog:test', lambda: 'fresh'), 'stale')
+
+        cache.delete('catalog:test:lock')
+        self.assertEqual(cached_response_data('catalog:test', lambda: 'fresh'), 'fresh')
+        self.assertEqual(cached_response_data('catalog:test', lambda: 'newer'), 'fresh')
+
+
+class ConditionalGetTests(APITestCase):
+    """
+    ETag/Last-Modified: 304 без сериализации, новый ETag после изменений.
+    """
+    def setUp(self):
+        cache.clear()
+        self.seller = make_user('seller@example.com', 'seller')
+        self.buyer = make_user('buyer@example.com', 'buyer')
+        self.product = Product.objects.create(seller=self.seller, title='Товар', price=1)
+
+    def assertNotModified(self, url):
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def test_product_detail(self):
+        url = f'/api/products/{self.product.id}/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        # Одна строка товара по первичному ключу, без сериализации
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        ProductComment.objects.create(product=self.product, user=self.buyer, text='ok')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_orders_and_profile(self):
+        self.client.force_authenticate(self.buyer)
+        etag = self.assertNotModified('/api/orders/mine/')
+        self.assertNotModified('/api/users/me/')
+        # orders_updated_at сдвигается после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(buyer=self.buyer, product=self.product)
+        self.buyer.refresh_from_db()
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.client.get('/api/orders/mine/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -0,0 +1,164 @@
+"""
+Разбивка времени запроса по фазам: заголовок Server-Timing и строка в логе.
+
+Фазы: db (SQL через connection.execute_wrapper), serialize (to_representation
+сериализаторов DRF), cache (версии и ответы каталога, core/cache.py), http
+(исходящие запросы, например YooKassa), view (от вызова вьюхи до готового
+ответа) и total. Фазы могут вкладываться друг в друга (db внутри serialize),
+поэтому их сумма больше total.
+
+Выключено (SERVER_TIMING_ENABLED = False) - middleware не подключается, а
+phase() стоит одно чтение ContextVar. Включено - замеряется доля запросов
+SERVER_TIMING_SAMPLE_RATE, остальные идут по тому же быстрому пути.
+"""
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('server_timing', default=None)
+
+PHASES = ('db', 'serialize', 'cache', 'http', 'view')
+
+
+class Timings:
+    def __init__(self):
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.counts = dict.fromkeys(PHASES, 0)
+        self.depth = dict.fromkeys(PHASES, 0)
+
+    def add(self, name, seconds):
+        self.durations[name] += seconds
+        self.counts[name] += 1
+
+    def header(self, total):
+        parts = [
+            f'{name};dur={self.durations[name] * 1000:.1f}'
+            + (f';desc="{self.counts[name]} queries"' if name == 'db' else '')
+            for name in PHASES if self.counts[name]
+        ]
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+
+class _Phase:
+    __slots__ = ('timings', 'name', 'started')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        # Вложенные вызовы одной фазы (сериализатор в сериализаторе) не
+        # считаются повторно
+        depth = self.timings.depth
+        depth[self.name] += 1
+        self.started = time.perf_counter() if depth[self.name] == 1 else None
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.depth[self.name] -= 1
+        if self.started is not None:
+            self.timings.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NoopPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopPhase()
+
+
+def phase(name):
+    """
+    with phase('cache'): ... - засчитывает время блока в фазу текущего запроса.
+    """
+    timings = _current.get()
+    if timings is None:
+        return _NOOP
+    return _Phase(timings, name)
+
+
+def _sql_wrapper(execute, sql, params, many, context):
+    with phase('db'):
+        return execute(sql, params, many, context)
+
+
+_serializers_patched = False
+
+
+def _patch_serializers():
+    """
+    Оборачивает to_representation сериализаторов DRF фазой serialize.
+    Делается один раз и только при включённом замере.
+    """
+    global _serializers_patched
+    if _serializers_patched:
+        return
+    from rest_framework import serializers
+
+    def timed(method):
+        def to_representation(self, *args, **kwargs):
+            with phase('serialize'):
+                return method(self, *args, **kwargs)
+        return to_representation
+
+    serializers.Serializer.to_representation = timed(serializers.Serializer.to_representation)
+    serializers.ListSerializer.to_representation = timed(serializers.ListSerializer.to_representation)
+    _serializers_patched = True
+
+
+class ServerTimingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'SERVER_TIMING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'SERVER_TIMING_SAMPLE_RATE', 1.0)
+        _patch_serializers()
+
+    def __call__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        timings = Timings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(_sql_wrapper):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        finished = time.perf_counter()
+        total = finished - started
+
+        view_started = getattr(request, '_server_timing_view_started', None)
+        if view_started is not None:
+            timings.add('view', finished - view_started)
+        response['Server-Timing'] = timings.header(total)
+        logger.info(json.dumps({
+            'event': 'server_timing',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            **{f'{name}_ms': round(timings.durations[name] * 1000, 2) for name in PHASES},
+            'queries': timings.counts['db'],
+        }))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._server_timing_view_started = time.perf_counter()
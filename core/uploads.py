@@ -0,0 +1,241 @@
+"""
+Возобновляемая загрузка файлов товаров частями (по мотивам протокола tus).
+
+1. POST /api/uploads/ {product, filename, size} - создаёт загрузку, offset 0.
+2. PATCH /api/uploads/{id}/ с заголовком Upload-Offset и телом
+   application/offset+octet-stream - дописывает часть с этого смещения.
+   Тело читается из входного потока кусками и пишется прямо в файл на диске
+   (UPLOAD_TEMP_DIR), память воркера не зависит от размера части. Оборванная
+   часть засчитывается до последнего полученного байта.
+3. HEAD/GET /api/uploads/{id}/ - текущее смещение, чтобы продолжить.
+4. POST /api/uploads/{id}/finalize/ {checksum: sha256} - фоновая задача
+   сверяет контрольную сумму и переносит файл в хранилище товара.
+
+Брошенные загрузки удаляет manage.py cleanup_uploads, она же помечает
+ошибкой загрузки, проверка которых не завершилась (процесс перезапустили).
+"""
+import fcntl
+import hashlib
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models.functions import Now
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .cache import invalidate_catalog
+from .models import Product, Upload
+from .tasks import enqueue
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadConflict(Exception):
+    """
+    Смещение клиента не совпадает с сервером или загрузку уже пишут.
+    """
+    def __init__(self, offset):
+        super().__init__(offset)
+        self.offset = offset
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def _temp_dir():
+    return str(settings.UPLOAD_TEMP_DIR)
+
+
+def temp_path(upload_id):
+    return os.path.join(_temp_dir(), f'{upload_id}.part')
+
+
+def create_upload(owner, product, filename, size):
+    if size > settings.PRODUCT_FILE_MAX_SIZE:
+        raise UploadTooLarge
+    upload = Upload.objects.create(
+        owner=owner, product=product, filename=get_valid_filename(os.path.basename(filename)), size=size,
+    )
+    os.makedirs(_temp_dir(), exist_ok=True)
+    open(temp_path(upload.pk), 'wb').close()
+    return upload
+
+
+def write_chunk(upload, offset, stream):
+    """
+    Дописывает данные из stream начиная с offset. Возвращает новое смещение.
+    """
+    if upload.status != Upload.Status.UPLOADING or offset != upload.offset:
+        raise UploadConflict(upload.offset)
+
+    remaining = upload.size - offset
+    written = 0
+    with open(temp_path(upload.pk), 'r+b') as part:
+        try:
+            fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadConflict(upload.offset)
+        # Пока ждали блокировку, часть мог дописать другой запрос
+        current = Upload.objects.filter(pk=upload.pk).values_list('offset', flat=True).get()
+        if current != offset:
+            raise UploadConflict(current)
+
+        part.seek(offset)
+        part.truncate()
+        while True:
+            try:
+                chunk = stream.read(min(READ_CHUNK_SIZE, remaining - written + 1))
+            except OSError:
+                # Клиент оборвал соединение: сохраняем то, что успели получить
+                break
+            if not chunk:
+                break
+            if written + len(chunk) > remaining:
+                part.truncate(offset)
+                raise UploadTooLarge
+            part.write(chunk)
+            written += len(chunk)
+
+        # Смещение пишется под блокировкой: следующая часть не начнётся со старого
+        updated = Upload.objects.filter(pk=upload.pk, status=Upload.Status.UPLOADING, offset=offset).update(
+            offset=offset + written, updated_at=Now(),
+        )
+        if not updated:
+            raise UploadConflict(Upload.objects.filter(pk=upload.pk).values_list('offset', flat=True).get())
+    upload.offset = offset + written
+    return upload.offset
+
+
+def finalize_upload(upload, checksum):
+    """
+    Ставит проверку и перенос файла в фон. False - загрузка не дописана
+    или уже завершается.
+    """
+    if upload.offset != upload.size:
+        return False
+    updated = Upload.objects.filter(pk=upload.pk, status=Upload.Status.UPLOADING, offset=upload.size).update(
+        status=Upload.Status.PROCESSING, checksum=checksum.lower(), updated_at=Now(),
+    )
+    if updated:
+        enqueue(complete_upload, upload.pk)
+    return bool(updated)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for chunk in iter(lambda: part.read(READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _move_to_storage(path, name):
+    """
+    Переносит часть в хранилище файлов товаров под свободным именем.
+    На диске - жёсткой ссылкой без копирования (os.link не перезапишет
+    чужой файл), иначе - копией через storage.save. Возвращает имя.
+    """
+    storage = Product._meta.get_field('file').storage
+    try:
+        storage.path(name)
+    except NotImplementedError:
+        pass
+    else:
+        while True:
+            name = storage.get_available_name(name)
+            target = storage.path(name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.link(path, target)
+            except FileExistsError:
+                continue
+            except OSError:
+                # Другая файловая система или ссылки не поддерживаются
+                break
+            if storage.file_permissions_mode is not None:
+                os.chmod(target, storage.file_permissions_mode)
+            _discard(path)
+            return name
+
+    with open(path, 'rb') as part:
+        name = storage.save(name, File(part))
+    _discard(path)
+    return name
+
+
+def _fail(upload_id, error):
+    Upload.objects.filter(pk=upload_id).update(status=Upload.Status.FAILED, error=error, updated_at=Now())
+
+
+def complete_upload(upload_id):
+    """
+    Фоновая задача: сверяет sha256 и сохраняет файл в Product.file. При
+    ошибке загрузка помечается FAILED, чтобы не остаться в PROCESSING.
+    """
+    upload = Upload.objects.get(pk=upload_id)
+    path = temp_path(upload.pk)
+    try:
+        if _sha256(path) != upload.checksum:
+            _fail(upload.pk, "Контрольная сумма не совпадает")
+            _discard(path)
+            return
+        name = _move_to_storage(path, f'product_files/{upload.product_id}/{upload.filename}')
+    except Exception:
+        logger.exception("Upload %s failed", upload.pk)
+        _fail(upload.pk, "Не удалось сохранить файл")
+        _discard(path)
+        return
+
+    storage = Product._meta.get_field('file').storage
+    previous = Product.objects.filter(pk=upload.product_id).values_list('file', flat=True).first()
+    Product.objects.filter(pk=upload.product_id).update(
+        file=name, file_name=upload.filename, file_size=upload.size, updated_at=Now(),
+    )
+    Upload.objects.filter(pk=upload.pk).update(status=Upload.Status.COMPLETE, updated_at=Now())
+    invalidate_catalog([upload.product_id])
+    if previous and previous != name:
+        storage.delete(previous)
+
+
+def cleanup_uploads(max_age=None):
+    """
+    Удаляет незавершённые загрузки без активности дольше max_age и их части,
+    а также завершённые записи и части без записи в БД. Возвращает число
+    удалённых загрузок. Проверка, не завершившаяся за max_age (задачу
+    потеряли при перезапуске), считается неудачной: загрузка - FAILED.
+    """
+    max_age = max_age or timedelta(seconds=settings.UPLOAD_EXPIRY)
+    cutoff = timezone.now() - max_age
+    Upload.objects.filter(status=Upload.Status.PROCESSING, updated_at__lt=cutoff).update(
+        status=Upload.Status.FAILED, error="Проверка файла не завершилась", updated_at=Now(),
+    )
+    expired = Upload.objects.filter(updated_at__lt=cutoff).exclude(status=Upload.Status.PROCESSING)
+    expired_ids = list(expired.values_list('pk', flat=True))
+    Upload.objects.filter(pk__in=expired_ids).delete()
+
+    directory = _temp_dir()
+    if os.path.isdir(directory):
+        alive = {
+            f'{pk}.part' for pk in
+            Upload.objects.filter(status__in=[Upload.Status.UPLOADING, Upload.Status.PROCESSING])
+            .values_list('pk', flat=True)
+        }
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            # Свежие файлы не трогаем: запись о загрузке могла появиться после выборки
+            if name.endswith('.part') and name not in alive and os.path.getmtime(path) < cutoff.timestamp():
+                os.remove(path)
+    return len(expired_ids)
@@ -5,19 +5,27 @@
     ProductViewSet, 
     OrderViewSet, 
     UserViewSet, 
+    SellerViewSet,
     PaymentViewSet, 
     PaymentWebhookViewSet,
-    ProductCommentViewSet
+    ProductCommentViewSet,
+    ProductReviewViewSet,
+    ProductImportViewSet,
+    UploadViewSet,
 )
 
 router = DefaultRouter()
 router.register(r'auth/register', RegisterViewSet, basename='register')
 router.register(r'products', ProductViewSet, basename='product')
+router.register(r'product-imports', ProductImportViewSet, basename='product-import')
+router.register(r'uploads', UploadViewSet, basename='upload')
 router.register(r'orders', OrderViewSet, basename='order')
 router.register(r'users', UserViewSet, basename='user')
+router.register(r'sellers', SellerViewSet, basename='seller')
 router.register(r'payments', PaymentViewSet, basename='payment')
 router.register(r'payments/webhook', PaymentWebhookViewSet, basename='payment-webhook')
 router.register(r'comments', ProductCommentViewSet, basename='comment')
+router.register(r'products/(?P<product_pk>[^/.]+)/reviews', ProductReviewViewSet, basename='product-review')
 
 urlpatterns = [
     path('', include(router.urls)),
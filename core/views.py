@@ -1,28 +1,75 @@
+import os
+from io import BytesIO
+
 from rest_framework import viewsets, mixins, status, permissions
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.decorators import action
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
-from .models import Product, Order, ProductComment, User, ProductImage
+from .models import Product, Order, OrderStatusChange, ProductComment, User, ProductImport, Upload
 from .serializers import (
     RegisterSerializer,
     ProductSerializer,
+    ProductListSerializer,
     OrderSerializer,
     OrderCreateSerializer,
+    OrderBulkActionSerializer,
     UserSerializer,
     ProductCommentSerializer,
+    ProductImportSerializer,
+    ProductBulkUpdateSerializer,
+    ProductImageSerializer,
+    ProductImagesUpdateSerializer,
+    SellerStatsQuerySerializer,
+    UploadSerializer,
     TokenObtainPairSerializer as CustomTokenObtainPairSerializer,
     LoginResponseSerializer,
 )
 from .permissions import IsSeller, IsBuyer, IsSellerOrReadOnly, IsOrderOwnerOrSeller, HasPurchasedProduct
+from .querybudget import QueryBudgetMixin
+from .filters import OrderFilter, ProductFilter, ProductSearchFilter, ProductOrderingFilter
+from .pagination import ProductPagination, StandardPagination
+from .conditional import (
+    order_conditional,
+    order_list_conditional,
+    product_conditional,
+    product_list_conditional,
+    profile_conditional,
+)
+from .cache import (
+    cached_response_data, get_version, list_version_scope, product_version_key, request_key, with_live_quantity,
+)
+from .suggest import get_suggest_index
+from .facets import product_facets
+from .streaming import stream_format, streaming_response
+from .exports import EXPORT_FORMATS, export_orders
+from .imports import ImportFormatError, import_products
+from .bulk import bulk_set_order_status, bulk_update_products
+from .orders import InvalidTransition, transition
+from .gallery import update_images
+from .sales import seller_stats
+from .timing import phase
+from .uploads import (
+    UploadConflict,
+    UploadTooLarge,
+    create_upload,
+    finalize_upload,
+    temp_path as upload_temp_path,
+    write_chunk,
+)
 
+from django.db import transaction
 from django.shortcuts import redirect
-from django.http import HttpResponse
+from django_filters.rest_framework import DjangoFilterBackend
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from django.http import FileResponse, HttpResponse
 from django.views import View
 
 
@@ -60,89 +107,98 @@ class RegisterViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
     permission_classes = [AllowAny]
 
 
-class ProductPagination(PageNumberPagination):
-    page_size = 8
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
-
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     """
     /api/products/…
     """
-    print("🔥 PRODUCT VIEWSET LOADED WITH NEW CODE! 🔥")
-    
     queryset = Product.objects.all().order_by('-created_at')
     serializer_class = ProductSerializer
     pagination_class = ProductPagination
     parser_classes = (MultiPartParser, FormParser)
-    filter_backends = [SearchFilter, OrderingFilter]
-    search_fields = ['title', 'description']
-    ordering_fields = ['price', 'created_at']
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, ProductOrderingFilter]
+    filterset_class = ProductFilter
+    ordering_fields = ['price', 'created_at', 'relevance', 'rating']
+    # Число запросов не должно зависеть от размера страницы
+    query_budgets = {'list': 6, 'retrieve': 4, 'mine': 5}
+
+    def get_queryset(self):
+        fields = self.get_requested_fields()
+        if fields is not None:
+            return ProductListSerializer.setup_queryset(super().get_queryset(), fields)
+        return super().get_queryset().for_serializer()
+
+    def get_requested_fields(self):
+        """
+        Набор полей компактного представления для чтения товаров.
+
+        ?fields=id,title,price - ровно эти поля; ?expand=description,images -
+        поля по умолчанию плюс перечисленные. Без обоих параметров - None,
+        то есть полный ProductSerializer.
+        """
+        params = self.request.query_params
+        if self.action not in ('list', 'retrieve') or ('fields' not in params and 'expand' not in params):
+            return None
+        if params.get('fields'):
+            requested = set(params['fields'].split(','))
+            return requested & set(ProductListSerializer.Meta.fields)
+        expand = set(params.get('expand', '').split(',')) & set(ProductListSerializer.expandable_fields)
+        return set(ProductListSerializer.default_fields) | expand
+
+    def get_serializer_class(self):
+        if self.get_requested_fields() is not None:
+            return ProductListSerializer
+        return super().get_serializer_class()
 
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_requested_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+    @method_decorator(product_list_conditional)
     def list(self, request, *args, **kwargs):
         """
-        Переопределяем list чтобы передавать request в контекст сериализатора
-        и добавляем кастомный поиск
+        Переопределяем list чтобы передавать request в контекст сериализатора.
+        Поиск (?search=), фильтры (ProductFilter) и сортировка (?ordering=,
+        включая relevance) - в filter_backends. ?facets=1 добавляет счётчики
+        фасетов по отфильтрованному списку. Ответ кэшируется до изменения
+        каталога, остатки (quantity) подставляются в него при каждом ответе.
         """
-        # Получаем базовый queryset
-        queryset = self.get_queryset()
-        
-        # Кастомный поиск если передан параметр search
-        search_query = request.query_params.get('search', None)
-        if search_query:
-            # Экранируем специальные символы для iregex
-            import re
-            escaped_query = re.escape(search_query)
-            
-            # Используем iregex который работает лучше чем icontains
-            from django.db.models import Q
-            
-            # Поиск по названию и описанию с использованием iregex
-            queryset = queryset.filter(
-                Q(title__iregex=escaped_query) | 
-                Q(description__iregex=escaped_query)
-            )
-        
+        key = request_key(request, f'list:{list_version_scope(request)}')
+        return Response(with_live_quantity(cached_response_data(key, self.build_list_data)))
+
+    def build_list_data(self):
+        queryset = self.filter_queryset(self.get_queryset())
+
         # Пагинация
         page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = self.get_serializer(page, many=True, context={'request': request})
-            return self.get_paginated_response(serializer.data)
+            serializer = self.get_serializer(page, many=True)
+            data = self.get_paginated_response(serializer.data).data
+            if self.request.query_params.get('facets'):
+                data['facets'] = product_facets(queryset)
+            return data
 
-        serializer = self.get_serializer(queryset, many=True, context={'request': request})
-        return Response(serializer.data)
-
-    def perform_custom_search(self, queryset, search_query):
-        """
-        Кастомный поиск по названию и описанию товара
-        """
-        from django.db.models import Q
-        import logging
-        
-        logger = logging.getLogger(__name__)
-        logger.info(f"🔍 Performing custom search for: '{search_query}'")
-        logger.info(f"🔍 Initial queryset count: {queryset.count()}")
-        
-        # Создаем Q объекты для поиска
-        title_search = Q(title__icontains=search_query)
-        description_search = Q(description__icontains=search_query)
-        
-        # Объединяем поиск по названию и описанию
-        filtered_queryset = queryset.filter(title_search | description_search)
-        
-        logger.info(f"🔍 Filtered queryset count: {filtered_queryset.count()}")
-        logger.info(f"🔍 Search query: {search_query}")
-        
-        return filtered_queryset
+        serializer = self.get_serializer(queryset, many=True)
+        return serializer.data
 
+    @method_decorator(product_conditional)
     def retrieve(self, request, *args, **kwargs):
         """
-        Переопределяем retrieve чтобы передавать request в контекст сериализатора
+        Переопределяем retrieve чтобы передавать request в контекст сериализатора.
+        Ответ кэшируется до изменения товара.
         """
+        try:
+            product_id = uuid.UUID(kwargs['pk'])
+        except ValueError:
+            raise NotFound("Товар не найден")
+        version = get_version(product_version_key(product_id))
+        key = request_key(request, f'product:{product_id}:v{version}')
+        return Response(cached_response_data(key, self.build_retrieve_data))
+
+    def build_retrieve_data(self):
         instance = self.get_object()
-        serializer = self.get_serializer(instance, context={'request': request})
-        return Response(serializer.data)
+        return self.get_serializer(instance).data
 
     def update(self, request, *args, **kwargs):
         logger.info("=" * 50)
@@ -156,102 +212,47 @@ def update(self, request, *args, **kwargs):
         logger.info(f"Product ID: {kwargs.get('pk')}")
         logger.info("=" * 50)
         
-        # Также выводим в консоль для отладки
-        print("=" * 50)
-        print("PRODUCT UPDATE STARTED")
-        print("=" * 50)
-        print(f"Request method: {request.method}")
-        print(f"Request content type: {request.content_type}")
-        print(f"Request data: {request.data}")
-        print(f"Request FILES: {request.FILES}")
-        print(f"Request user: {request.user}")
-        print(f"Product ID: {kwargs.get('pk')}")
-        print("=" * 50)
-        
         try:
             instance = self.get_object()
             logger.info(f"Product instance found: {instance.id}")
-            print(f"Product instance found: {instance.id}")
             
             serializer = self.get_serializer(instance, data=request.data, partial=True, context={'request': request})
             logger.info(f"Update serializer created: {serializer}")
-            print(f"Update serializer created: {serializer}")
             
             if not serializer.is_valid():
                 logger.error(f"Update serializer validation errors: {serializer.errors}")
-                print(f"Update serializer validation errors: {serializer.errors}")
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             
             logger.info("Update serializer is valid, proceeding to save...")
-            print("Update serializer is valid, proceeding to save...")
-            
-            # Сохраняем товар
-            updated_product = serializer.save()
-            logger.info(f"Product updated successfully: {updated_product.id}")
-            print(f"Product updated successfully: {updated_product.id}")
             
-            # Обрабатываем новые изображения
-            if 'uploaded_images' in request.FILES:
-                logger.info(f"Processing {len(request.FILES.getlist('uploaded_images'))} new images")
-                print(f"Processing {len(request.FILES.getlist('uploaded_images'))} new images")
-                
-                for uploaded_file in request.FILES.getlist('uploaded_images'):
-                    logger.info(f"Creating ProductImage for file: {uploaded_file.name}")
-                    print(f"Creating ProductImage for file: {uploaded_file.name}")
-                    
-                    ProductImage.objects.create(
-                        product=updated_product,
-                        image=uploaded_file
-                    )
-                    logger.info(f"ProductImage created for: {uploaded_file.name}")
-                    print(f"ProductImage created for: {uploaded_file.name}")
-            
-            # Обрабатываем удаление изображений
-            if 'images_to_delete' in request.data:
-                images_to_delete = request.data.getlist('images_to_delete')
-                logger.info(f"Deleting {len(images_to_delete)} images: {images_to_delete}")
-                print(f"Deleting {len(images_to_delete)} images: {images_to_delete}")
-                
-                for image_id in images_to_delete:
-                    try:
-                        image = ProductImage.objects.get(id=image_id, product=updated_product)
-                        image.delete()
-                        logger.info(f"Image {image_id} deleted successfully")
-                        print(f"Image {image_id} deleted successfully")
-                    except ProductImage.DoesNotExist:
-                        logger.warning(f"Image {image_id} not found for deletion")
-                        print(f"Image {image_id} not found for deletion")
-            
-            # Получаем обновленные данные с изображениями
-            final_serializer = self.get_serializer(updated_product, context={'request': request})
-            logger.info("=" * 50)
+            # Товар и изменения галереи - одной транзакцией (core/gallery.py)
+            uploaded = serializer.validated_data.pop('uploaded_images', [])
+            gallery = ProductImagesUpdateSerializer(data={
+                'delete': request.data.getlist('images_to_delete'),
+                'order': request.data.getlist('images_order'),
+            })
+            if not gallery.is_valid():
+                return Response(gallery.errors, status=status.HTTP_400_BAD_REQUEST)
+            with transaction.atomic():
+                updated_product = serializer.save()
+                logger.info(f"Product updated successfully: {updated_product.id}")
+                update_images(
+                    updated_product,
+                    uploaded=uploaded,
+                    delete=gallery.validated_data['delete'],
+                    order=gallery.validated_data['order'] or None,
+                )
+
+            # Ответ сериализуется один раз
+            final_data = self.get_serializer(updated_product, context={'request': request}).data
             logger.info("PRODUCT UPDATE COMPLETED SUCCESSFULLY")
-            logger.info("=" * 50)
-            print("=" * 50)
-            print("PRODUCT UPDATE COMPLETED SUCCESSFULLY")
-            print("=" * 50)
-            
-            # Логируем финальные данные для отладки
-            final_data = final_serializer.data
-            logger.info(f"Final serializer data: {final_data}")
             logger.info(f"Final images count: {len(final_data.get('images', []))}")
-            if final_data.get('images'):
-                for i, img in enumerate(final_data['images']):
-                    logger.info(f"Final image {i+1}: {img}")
-            print(f"Final serializer data: {final_data}")
-            print(f"Final images count: {len(final_data.get('images', []))}")
-            if final_data.get('images'):
-                for i, img in enumerate(final_data['images']):
-                    print(f"Final image {i+1}: {img}")
-            
             return Response(final_data)
             
         except Exception as e:
             logger.error(f"ERROR updating product: {e}")
-            print(f"ERROR updating product: {e}")
             import traceback
             logger.error(f"Traceback: {traceback.format_exc()}")
-            print(f"Traceback: {traceback.format_exc()}")
             return Response(
                 {"error": f"Failed to update product: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -261,9 +262,12 @@ def update(self, request, *args, **kwargs):
     def mine(self, request):
         """
         Возвращает ВСЕ товары для текущего аутентифицированного продавца,
-        отключая пагинацию для этого эндпоинта.
+        отключая пагинацию для этого эндпоинта. ?stream=json|ndjson - потоковый ответ.
         """
-        user_products = Product.objects.filter(seller=request.user).order_by('-created_at')
+        user_products = self.get_queryset().filter(seller=request.user)
+        fmt = stream_format(request)
+        if fmt:
+            return streaming_response(self, user_products, fmt)
         serializer = self.get_serializer(user_products, many=True, context={'request': request})
         return Response(serializer.data)
 
@@ -287,6 +291,98 @@ def has_purchased(self, request, pk=None):
             'product_id': str(product.id)
         })
 
+    @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny], authentication_classes=[])
+    @method_decorator(cache_control(public=True, max_age=60))
+    def suggest(self, request):
+        """
+        Автодополнение по названиям товаров из индекса в памяти (core/suggest.py).
+        ?q= - начало запроса, ?limit= - число подсказок (до 20).
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 20)
+        except ValueError:
+            limit = 10
+        results = get_suggest_index().suggest(request.query_params.get('q', ''), limit)
+        return Response({'results': results})
+
+    @action(
+        detail=False, methods=['post'], url_path='import',
+        permission_classes=[permissions.IsAuthenticated, IsSeller],
+    )
+    def import_products(self, request):
+        """
+        Пакетный импорт товаров: file - CSV или JSONL, images - необязательный
+        zip-архив с изображениями. Изображения загружаются в фоне, состояние -
+        GET /api/product-imports/{id}/.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Не передан файл"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            job = import_products(request.user, upload, upload.name, archive=request.FILES.get('images'))
+        except ImportFormatError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ProductImportSerializer(job).data, status=status.HTTP_201_CREATED)
+
+    @action(
+        detail=False, methods=['patch'], url_path='bulk', parser_classes=[JSONParser],
+        permission_classes=[permissions.IsAuthenticated, IsSeller],
+    )
+    def bulk_update(self, request):
+        """
+        Массовое изменение своих товаров: [{"id": ..., "price": ..., "quantity": ...}].
+        Возвращает число обновлённых и id не найденных (или чужих) товаров.
+        """
+        serializer = ProductBulkUpdateSerializer(
+            data=request.data, many=True, max_length=settings.PRODUCT_BULK_UPDATE_MAX_ITEMS,
+        )
+        serializer.is_valid(raise_exception=True)
+        updated, not_found = bulk_update_products(request.user, serializer.validated_data)
+        return Response({'updated': len(updated), 'not_found': not_found})
+
+    @action(detail=True, methods=['post'], url_path='images')
+    def manage_images(self, request, pk=None):
+        """
+        Галерея товара одной транзакцией: uploaded_images - новые файлы (в
+        конец), delete - id удаляемых, order - id в нужном порядке. Возвращает
+        изображения товара по порядку.
+        """
+        product = self.get_object()
+        if product.seller_id != request.user.pk:
+            raise PermissionDenied("Можно изменять только свои товары")
+        serializer = ProductImagesUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        images = update_images(
+            product,
+            uploaded=serializer.validated_data.get('uploaded_images', []),
+            delete=serializer.validated_data.get('delete', []),
+            order=serializer.validated_data.get('order'),
+        )
+        return Response(ProductImageSerializer(images, many=True, context={'request': request}).data)
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def download(self, request, pk=None):
+        """
+        Файл товара для продавца и покупателей с оплаченным заказом.
+        С PRIVATE_MEDIA_ACCEL_REDIRECT файл отдаёт nginx (X-Accel-Redirect).
+        """
+        product = self.get_object()
+        allowed = product.seller_id == request.user.pk or Order.objects.filter(
+            buyer=request.user, product=product, status__in=['paid', 'delivered'],
+        ).exists()
+        if not allowed:
+            return Response({"error": "Товар не куплен"}, status=status.HTTP_403_FORBIDDEN)
+        if not product.file:
+            raise NotFound("У товара нет файла")
+
+        accel_prefix = getattr(settings, 'PRIVATE_MEDIA_ACCEL_REDIRECT', None)
+        if accel_prefix:
+            response = HttpResponse()
+            response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + product.file.name
+            response['Content-Disposition'] = f'attachment; filename="{product.file_name}"'
+            return response
+        return FileResponse(product.file.open('rb'), as_attachment=True, filename=product.file_name)
+
     def perform_create(self, serializer):
         """
         Продавец-создатель → seller.
@@ -294,8 +390,12 @@ def perform_create(self, serializer):
         serializer.save(seller=self.request.user)
 
     def get_permissions(self):
-        if self.action in ("create", "update", "partial_update", "destroy"):
+        if self.action in (
+            "create", "update", "partial_update", "destroy", "import_products", "bulk_update", "manage_images",
+        ):
             return [permissions.IsAuthenticated(), IsSeller()]
+        if self.action == "download":
+            return [permissions.IsAuthenticated()]
         return [AllowAny()]
 
     @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
@@ -373,12 +473,13 @@ class ProductCommentViewSet(viewsets.ModelViewSet):
     queryset = ProductComment.objects.all()
     serializer_class = ProductCommentSerializer
     permission_classes = [permissions.IsAuthenticated, HasPurchasedProduct]
+    pagination_class = StandardPagination
 
     def get_queryset(self):
         """
         Фильтруем комментарии по товару если передан product_id
         """
-        queryset = ProductComment.objects.all()
+        queryset = ProductComment.objects.select_related('user')
         product_id = self.request.query_params.get('product_id', None)
         if product_id:
             queryset = queryset.filter(product_id=product_id)
@@ -400,19 +501,161 @@ def get_permissions(self):
         return [permissions.IsAuthenticated()]
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class ProductReviewViewSet(QueryBudgetMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    /api/products/{product_pk}/reviews/ - отзывы о товаре постранично
+    (в том числе ?cursor=). Публичный: без аутентификации, ответ не зависит
+    от пользователя и кэшируется.
+    """
+    serializer_class = ProductCommentSerializer
+    pagination_class = StandardPagination
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    query_budgets = {'list': 2}
+
+    def get_queryset(self):
+        try:
+            product_id = uuid.UUID(self.kwargs['product_pk'])
+        except ValueError:
+            raise NotFound("Товар не найден")
+        return (
+            ProductComment.objects.filter(product_id=product_id)
+            .select_related('user')
+            .order_by('-created_at', '-id')
+        )
+
+    @method_decorator(cache_control(public=True, max_age=60))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+
+class ProductImportViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    /api/product-imports/ - импорты товаров текущего продавца.
+    """
+    serializer_class = ProductImportSerializer
+    permission_classes = [permissions.IsAuthenticated, IsSeller]
+    pagination_class = StandardPagination
+
+    def get_queryset(self):
+        return ProductImport.objects.filter(seller=self.request.user).order_by('-created_at')
+
+
+class UploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin,
+                    viewsets.GenericViewSet):
+    """
+    /api/uploads/ - возобновляемая загрузка файлов товаров частями (core/uploads.py).
+    """
+    serializer_class = UploadSerializer
+    permission_classes = [permissions.IsAuthenticated, IsSeller]
+
+    def get_queryset(self):
+        return Upload.objects.filter(owner=self.request.user)
+
+    def offset_headers(self, response, upload):
+        response['Upload-Offset'] = str(upload.offset)
+        response['Upload-Length'] = str(upload.size)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            upload = create_upload(request.user, **serializer.validated_data)
+        except UploadTooLarge:
+            return Response({"error": "Файл слишком большой"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        response = Response(self.get_serializer(upload).data, status=status.HTTP_201_CREATED)
+        response['Location'] = request.build_absolute_uri(f'{upload.pk}/')
+        return self.offset_headers(response, upload)
+
+    def retrieve(self, request, *args, **kwargs):
+        upload = self.get_object()
+        return self.offset_headers(Response(self.get_serializer(upload).data), upload)
+
+    def partial_update(self, request, *args, **kwargs):
+        """
+        Часть файла: заголовок Upload-Offset, тело - байты
+        (Content-Type: application/offset+octet-stream).
+        """
+        upload = self.get_object()
+        if request.content_type != 'application/offset+octet-stream':
+            return Response(
+                {"error": "Ожидается application/offset+octet-stream"},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response({"error": "Нужен заголовок Upload-Offset"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            write_chunk(upload, offset, request.stream or BytesIO())
+        except UploadConflict as exc:
+            upload.offset = exc.offset
+            return self.offset_headers(Response(status=status.HTTP_409_CONFLICT), upload)
+        except UploadTooLarge:
+            return Response({"error": "Данные больше объявленного размера"},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        return self.offset_headers(Response(status=status.HTTP_204_NO_CONTENT), upload)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        try:
+            os.remove(upload_temp_path(instance.pk))
+        except FileNotFoundError:
+            pass
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """
+        {"checksum": "<sha256 hex>"} - проверка и перенос файла в товар идут
+        в фоне, статус - GET /api/uploads/{id}/.
+        """
+        upload = self.get_object()
+        checksum = str(request.data.get('checksum', ''))
+        if len(checksum) != 64:
+            return Response({"error": "Нужна контрольная сумма sha256"}, status=status.HTTP_400_BAD_REQUEST)
+        if not finalize_upload(upload, checksum):
+            return self.offset_headers(
+                Response({"error": "Загрузка не завершена"}, status=status.HTTP_409_CONFLICT), upload,
+            )
+        upload.refresh_from_db()
+        return Response(self.get_serializer(upload).data, status=status.HTTP_202_ACCEPTED)
+
+
+class OrderViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     """
     Покупатель создаёт заказ, а также может получить список своих заказов.
     """
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = StandardPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = OrderFilter
+    ordering_fields = ['created_at', 'updated_at', 'quantity', 'status']
+    ordering = ['-created_at', '-id']
+    query_budgets = {'list': 6, 'retrieve': 5, 'mine': 5}
+
+    def get_expand(self):
+        """
+        ?expand=product - полный товар вместо краткого (id, название, цена,
+        миниатюра).
+        """
+        return set(self.request.query_params.get('expand', '').split(',')) & {'product'}
 
     def get_queryset(self):
         user = self.request.user
+        orders = Order.objects.for_serializer() if self.get_expand() else Order.objects.compact()
         if user.role == "seller":
-            return Order.objects.filter(product__seller=user)
-        return Order.objects.filter(buyer=user)
+            return orders.filter(seller=user)
+        return orders.filter(buyer=user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand'] = self.get_expand()
+        return context
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -422,6 +665,14 @@ def get_serializer_class(self):
     def perform_create(self, serializer):
         serializer.save(buyer=self.request.user)
 
+    @method_decorator(order_list_conditional)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @method_decorator(order_conditional)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def create(self, request, *args, **kwargs):
         """
         Переопределяем create для правильной обработки заказов
@@ -445,21 +696,70 @@ def create(self, request, *args, **kwargs):
         return Response(response_data, status=status.HTTP_201_CREATED, headers=headers)
 
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    @method_decorator(order_list_conditional)
     def mine(self, request):
         """
-        Возвращает заказы для текущего аутентифицированного пользователя
+        Возвращает заказы для текущего аутентифицированного пользователя.
+        Фильтры и ?ordering= - как у списка. ?page=, ?page_size= или
+        ?cursor= - постраничный ответ, без них - весь список массивом.
+        ?stream=json|ndjson - потоковый ответ.
         """
-        user = request.user
-        if user.role == "seller":
-            # Для продавца - заказы на его товары
-            orders = Order.objects.filter(product__seller=user).order_by('-created_at')
-        else:
-            # Для покупателя - его заказы
-            orders = Order.objects.filter(buyer=user).order_by('-created_at')
-        
-        serializer = self.get_serializer(orders, many=True, context={'request': request})
+        # Для продавца - заказы на его товары, для покупателя - его заказы
+        orders = self.filter_queryset(self.get_queryset())
+        fmt = stream_format(request)
+        if fmt:
+            return streaming_response(self, orders, fmt)
+
+        paginator = self.paginator
+        if {paginator.page_query_param, paginator.page_size_query_param, paginator.cursor_query_param} & set(request.query_params):
+            page = self.paginate_queryset(orders)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        serializer = self.get_serializer(orders, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated, IsSeller])
+    def export(self, request):
+        """
+        Заказы на товары продавца файлом потоком, по дате создания:
+        ?type=csv (по умолчанию) или ?type=xlsx. Фильтры - как у списка.
+        """
+        fmt = request.query_params.get('type', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            raise ValidationError({'type': f"Допустимые форматы: {', '.join(EXPORT_FORMATS)}"})
+        orders = self.filter_queryset(Order.objects.filter(seller=request.user))
+        return export_orders(orders, fmt, filename=f"orders-{timezone.localdate():%Y%m%d}")
+
+    def _bulk_status(self, request, status_value):
+        serializer = OrderBulkActionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = bulk_set_order_status(request.user, serializer.validated_data['ids'], status_value)
+        return Response({
+            'updated': sum(row['result'] == 'ok' for row in results),
+            'results': results,
+        })
+
+    @action(
+        detail=False, methods=['post'], url_path='bulk-confirm', parser_classes=[JSONParser],
+        permission_classes=[permissions.IsAuthenticated, IsSeller],
+    )
+    def bulk_confirm(self, request):
+        """
+        Подтверждение нескольких заказов одной транзакцией: {"ids": [...]}.
+        Для каждого id - ok, not_found или not_pending.
+        """
+        return self._bulk_status(request, Order.Status.PAID)
+
+    @action(
+        detail=False, methods=['post'], url_path='bulk-reject', parser_classes=[JSONParser],
+        permission_classes=[permissions.IsAuthenticated, IsSeller],
+    )
+    def bulk_reject(self, request):
+        """
+        Отклонение нескольких заказов одной транзакцией, как bulk-confirm.
+        """
+        return self._bulk_status(request, Order.Status.SELLER_REJECTED)
+
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def confirm(self, request, pk=None):
         """
@@ -469,22 +769,22 @@ def confirm(self, request, pk=None):
             order = self.get_object()
             
             # Проверяем, что пользователь является продавцом этого товара
-            if request.user.role != "seller" or order.product.seller != request.user:
+            if request.user.role != "seller" or order.seller_id != request.user.pk:
                 return Response(
                     {"error": "У вас нет прав для подтверждения этого заказа"}, 
                     status=status.HTTP_403_FORBIDDEN
                 )
             
-            # Проверяем, что заказ в статусе "pending"
-            if order.status != "pending":
+            # Условный переход: только из "pending", даже если статус
+            # поменяли после get_object
+            try:
+                transition(order, Order.Status.PAID, OrderStatusChange.Source.SELLER)
+            except InvalidTransition:
                 return Response(
                     {"error": "Можно подтверждать только заказы в ожидании оплаты"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            order.status = "paid"
-            order.save()
-            
             serializer = self.get_serializer(order)
             return Response(serializer.data)
             
@@ -503,22 +803,22 @@ def reject(self, request, pk=None):
             order = self.get_object()
             
             # Проверяем, что пользователь является продавцом этого товара
-            if request.user.role != "seller" or order.product.seller != request.user:
+            if request.user.role != "seller" or order.seller_id != request.user.pk:
                 return Response(
                     {"error": "У вас нет прав для отклонения этого заказа"}, 
                     status=status.HTTP_403_FORBIDDEN
                 )
             
-            # Проверяем, что заказ в статусе "pending"
-            if order.status != "pending":
+            # Условный переход: только из "pending", даже если статус
+            # поменяли после get_object
+            try:
+                transition(order, Order.Status.SELLER_REJECTED, OrderStatusChange.Source.SELLER)
+            except InvalidTransition:
                 return Response(
                     {"error": "Можно отклонять только заказы в ожидании оплаты"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            order.status = "seller_rejected"
-            order.save()
-            
             serializer = self.get_serializer(order)
             return Response(serializer.data)
             
@@ -543,9 +843,27 @@ class UserViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     @action(detail=False, methods=['get'], url_path='me')
+    @method_decorator(profile_conditional)
     def me(self, request):
         serializer = UserSerializer(request.user)
         return Response(serializer.data)
+
+
+class SellerViewSet(viewsets.ViewSet):
+    """
+    /api/sellers/me/stats/ - статистика продаж продавца (core/sales.py).
+    """
+    permission_classes = [permissions.IsAuthenticated, IsSeller]
+
+    @action(detail=False, methods=['get'], url_path='me/stats')
+    def stats(self, request):
+        """
+        ?from=YYYY-MM-DD&to=YYYY-MM-DD (по умолчанию последние 30 дней),
+        ?status=paid,delivered - статусы заказов. Итоги, по дням и по товарам.
+        """
+        query = SellerStatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(seller_stats(request.user, *query.validated_data['range'], query.validated_data['status']))
     
 
 
@@ -635,7 +953,8 @@ def create(self, request, *args, **kwargs):
                 
                 logger.info("Creating Yookassa payment...")
                 
-                payment = Payment.create(payment_data, idempotency_key=str(order.id))
+                with phase('http'):
+                    payment = Payment.create(payment_data, idempotency_key=str(order.id))
                 
                 logger.info(f"Yookassa payment created successfully: {payment.id}")
                 logger.info("Payment confirmation URL generated")
@@ -681,6 +1000,9 @@ def create(self, request, *args, **kwargs):
                 logger.info("Fallback response prepared (payment failed)")
                 return Response(response_data, status=status.HTTP_201_CREATED)
                 
+        except ValidationError as e:
+            # Например, остаток закончился, пока заказ оформлялся
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"ERROR creating order: {e}")
             import traceback
@@ -706,11 +1028,13 @@ def yookassa_webhook(self, request):
                 
                 try:
                     order = Order.objects.get(id=order_id)
-                    order.status = Order.Status.PAID
-                    order.save()
+                    transition(order, Order.Status.PAID, OrderStatusChange.Source.PAYMENT)
                     print(f"Order {order_id} status updated to PAID.")
                 except Order.DoesNotExist:
                     print(f"Order with ID {order_id} not found.")
+                except InvalidTransition as e:
+                    # Поздний вебхук не переписывает решение продавца или отмену
+                    logger.warning("Order %s: payment succeeded, but status is %s", order_id, e.current)
 
             elif notification_data['event'] == 'payment.canceled':
                 payment_id = notification_data['object']['id']
@@ -718,11 +1042,12 @@ def yookassa_webhook(self, request):
 
                 try:
                     order = Order.objects.get(id=order_id)
-                    order.status = Order.Status.CANCELED
-                    order.save()
+                    transition(order, Order.Status.CANCELED, OrderStatusChange.Source.PAYMENT)
                     print(f"Order {order_id} status updated to CANCELED.")
                 except Order.DoesNotExist:
                     print(f"Order with ID {order_id} not found.")
+                except InvalidTransition as e:
+                    logger.warning("Order %s: payment canceled, but status is %s", order_id, e.current)
 
             return Response({"status": "success"}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -31,11 +31,63 @@
     "PAGE_SIZE": 20,
 }
 
+# Превышение бюджета SQL-запросов эндпоинта (core.querybudget):
+# True - исключение (тесты), False - предупреждение в логе
+QUERY_BUDGET_STRICT = False
+
+# Бэкенд полнотекстового поиска товаров (dotted path, см. core/search.py).
+# None - выбор по типу БД: PostgreSQL tsvector / SQLite FTS5
+PRODUCT_SEARCH_BACKEND = None
+
+# Кэш ответов каталога (core/cache.py), секунды. 0 - кэш выключен
+CATALOG_CACHE_TIMEOUT = 60
+# Сколько ещё отдавать устаревший ответ, пока один воркер его пересчитывает
+CATALOG_CACHE_STALE_TIMEOUT = 300
+CATALOG_CACHE_LOCK_TIMEOUT = 10
+# Индекс подсказок поиска (core/suggest.py): снимок для быстрого старта
+# воркера (manage.py build_suggest_index), интервалы досинхронизации и полной перестройки
+SUGGEST_SNAPSHOT_PATH = None
+SUGGEST_SYNC_INTERVAL = 30
+SUGGEST_REBUILD_INTERVAL = 600
+# Границы ценовых диапазонов в фасетах каталога (core/facets.py)
+PRODUCT_PRICE_FACETS = [100, 500, 1000, 5000]
+
+# Пакетный импорт товаров (core/imports.py)
+PRODUCT_IMPORT_MAX_ROWS = 10000
+PRODUCT_IMPORT_MAX_IMAGE_SIZE = 10 * 1024 * 1024
+# Импорт, не загрузивший изображения за это время (секунды), resume_imports запускает заново
+PRODUCT_IMPORT_STALE_AFTER = 60 * 60
+# Максимум товаров в одном PATCH /api/products/bulk/
+PRODUCT_BULK_UPDATE_MAX_ITEMS = 10000
+# Сколько секунд неоплаченный заказ держит резерв остатка (core/stock.py)
+ORDER_RESERVATION_TTL = 30 * 60
+# Максимум заказов в одном POST /api/orders/bulk-confirm/ и bulk-reject/
+ORDER_BULK_MAX_ITEMS = 500
+
+# Фоновые задачи в пуле потоков (core/tasks.py). EAGER - выполнять сразу
+BACKGROUND_TASK_WORKERS = 2
+BACKGROUND_TASKS_EAGER = False
+
+# Заголовок Server-Timing и лог фаз запроса (core/timing.py).
+# SAMPLE_RATE - доля замеряемых запросов
+SERVER_TIMING_ENABLED = True
+SERVER_TIMING_SAMPLE_RATE = 1.0
+
+# Загрузка файлов товаров частями (core/uploads.py)
+UPLOAD_TEMP_DIR = BASE_DIR / 'private_media' / 'uploads'
+PRODUCT_FILE_MAX_SIZE = 10 * 1024 ** 3
+# Незавершённые загрузки без активности дольше этого (секунды) удаляет cleanup_uploads
+UPLOAD_EXPIRY = 24 * 60 * 60
+
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "static"
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Файлы цифровых товаров: вне MEDIA_ROOT, отдаются через /api/products/{id}/download/
+PRIVATE_MEDIA_ROOT = BASE_DIR / 'private_media'
+# Префикс internal-location nginx для X-Accel-Redirect (None - файл отдаёт Django)
+PRIVATE_MEDIA_ACCEL_REDIRECT = None
 
 # часовой пояс
 TIME_ZONE = "Europe/Moscow"
@@ -83,6 +135,7 @@
 ]
 
 MIDDLEWARE = [
+    "core.timing.ServerTimingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -40,6 +40,9 @@
 STATIC_ROOT = BASE_DIR / "static"
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Server-Timing: замеряем только часть запросов
+SERVER_TIMING_SAMPLE_RATE = float(os.environ.get('SERVER_TIMING_SAMPLE_RATE', '0.05'))
+
 # Logging configuration for production
 LOGGING = {
     'version': 1,